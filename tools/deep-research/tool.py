@@ -4,19 +4,29 @@
 # ]
 # ///
 
-from typing import Any, List, Dict, Tuple, Set, Optional, Callable
+from typing import Any, List, Dict, Tuple, Set, Optional, Callable, NamedTuple
 import asyncio
+import functools
+import hashlib
+import heapq
 import json
+import math
 import re
 import os
-from datetime import date
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from datetime import date, datetime
+from urllib.parse import urldefrag
 
 from shinkai_local_tools import (
     shinkai_llm_prompt_processor,
     duck_duck_go_search,
     download_pages,
-    pdf_text_extractor,
-    wait_1_5_seconds
+    pdf_text_extractor
 )
 from shinkai_local_support import get_home_path
 
@@ -28,15 +38,38 @@ class CONFIG:
     max_reflection_loops: int = 1 # number of reflection loops to perform to eventually look for more information
     include_execution_log: bool = False # set to True to include the detailed execution log in the output
     # --- Config for content truncation ---
-    truncate_first_chars: int = 50000 # Max characters to take from the beginning of a source. Set to 0 to disable.
-    truncate_last_chars: int = 15000 # Max characters to take from the end of a source. Set to 0 to disable.
+    truncate_first_chars: int = 50000 # Max characters to take from the beginning of a source (only used when source_token_budget is 0). Set to 0 to disable.
+    truncate_last_chars: int = 15000 # Max characters to take from the end of a source (only used when source_token_budget is 0). Set to 0 to disable.
+    source_token_budget: int = 3000 # Approximate tokens kept per source, made of its passages most relevant to the subsection. Set to 0 to use the bookend truncation above instead.
     # --- Config for concurrent workers ---
     max_concurrent_downloads: int = 60 # max number of concurrent results webpages to download at any given time
     max_concurrent_llm_calls: int = 15 # max number of concurrent LLM calls to perform at any given a time
+    llm_batch_size: int = 4 # max number of small independent prompts (ranking lists, filename, title) packed into one LLM call. Set to 1 to disable batching.
+    # --- Config for the on-disk page content cache ---
+    page_cache_ttl_hours: int = 72 # hours a downloaded page stays valid in the cache. Set to 0 to disable the cache.
+    page_cache_max_mb: int = 500 # max size of the compressed page cache on disk, least recently used pages are evicted first
+    # --- Config for per-backend rate limiting (token buckets) ---
+    search_rate_per_second: float = 1.0 # sustained search calls per second. Set to 0 to disable limiting.
+    search_burst: int = 3 # number of search calls that may start at once before the sustained rate applies
+    llm_rate_per_second: float = 2.0 # sustained LLM calls per second. Set to 0 to disable limiting.
+    llm_burst: int = 5 # number of LLM calls that may start at once before the sustained rate applies
+    download_rate_per_second: float = 0.0 # sustained page downloads per second. 0 (the default) leaves downloads unlimited, bounded only by max_concurrent_downloads.
+    download_burst: int = 10 # number of downloads that may start at once before the sustained rate applies
+    # --- Config for streaming synthesis ---
+    synthesis_quorum: int = 3 # synthesize a subsection as soon as this many of its sources are downloaded. Set to 0 to wait for all of them.
+    subsection_deadline_seconds: int = 120 # synthesize a subsection with the sources ready after this many seconds. Set to 0 to disable.
+    # --- Config for search result ranking ---
+    ranking_method: str = "local" # "local" ranks results with BM25 (+ optional embeddings) and only asks the LLM when that is inconclusive, "llm" always asks the LLM
+    ranking_embedding_model: str = "" # optional fastembed model name (e.g. "BAAI/bge-small-en-v1.5") blended with BM25 for local ranking. Empty to use BM25 only.
+    near_duplicate_similarity: float = 0.8 # estimated Jaccard similarity above which two sources are collapsed into one before synthesis. Set to 0 to disable.
+    # --- Config for run tracing ---
+    write_trace_file: bool = False # set to True to also write the run trace as trace.json in the run directory
+    keep_run_checkpoints: int = 20 # number of most recent run directories (checkpoints, traces) kept; older ones are deleted when a run starts. Set to 0 to keep all.
 
 
 class INPUTS:
     research_query: str
+    resume_run_id: Optional[str] = None
 
 
 class OUTPUT:
@@ -44,17 +77,244 @@ class OUTPUT:
     all_executed_queries: Dict[str, Dict[str, Any]]
     referenced_urls: List[str]
     execution_log: Optional[List[str]]
+    collapsed_duplicate_sources: Dict[str, str]
     md_file_path: str
     md_export_message: str
+    run_id: str
+    trace: Dict[str, Any]
 
 
 # --------------------------- Globals ---------------------------
 CURRENT_DATE: Optional[str] = None
+PAGE_CACHE: Optional["PageContentCache"] = None
+EMBEDDING_MODELS: Dict[str, Any] = {}
+EMBEDDING_MODELS_LOCK = threading.Lock() # Embeddings run in worker threads, keep them from loading a model twice
+DUPLICATE_INDEX: Optional["NearDuplicateIndex"] = None
+RATE_LIMITERS: Dict[str, "AsyncTokenBucket"] = {}
+TRACER: Optional["RunTracer"] = None
 
 
-# --------------------------- Utility ---------------------------
-async def async_wait_1_5s():
-    await wait_1_5_seconds({})
+# --------------------------- Run checkpoints ---------------------------
+class RunCheckpoint:
+    """
+    Phase-level checkpoints of one research run, stored as JSON files in its run directory
+    so that `resume_run_id` can skip every phase that already completed.
+    """
+
+    def __init__(self, run_dir: str, log_fn):
+        self.run_dir = run_dir
+        self.log_fn = log_fn
+        os.makedirs(run_dir, exist_ok=True)
+
+    def _path(self, phase: str) -> str:
+        return os.path.join(self.run_dir, f"{phase}.json")
+
+    def load(self, phase: str) -> Optional[Any]:
+        path = self._path(phase)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.log_fn(f"INFO: [checkpoint] Restored phase '{phase}'.")
+            return data
+        except Exception as e:
+            self.log_fn(f"WARN: [checkpoint] Could not read phase '{phase}', it will be recomputed: {e}")
+            return None
+
+    def save(self, phase: str, data: Any):
+        path = self._path(phase)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self.log_fn(f"INFO: [checkpoint] Saved phase '{phase}'.")
+        except Exception as e:
+            self.log_fn(f"WARN: [checkpoint] Could not save phase '{phase}': {e}")
+
+
+def prune_run_directories(runs_dir: str, keep: int, current_run_id: str, log_fn):
+    """Deletes all but the `keep` most recently updated run directories (the current run is always kept)."""
+    if keep <= 0 or not os.path.isdir(runs_dir):
+        return
+    try:
+        with os.scandir(runs_dir) as it:
+            runs = sorted(
+                ((entry.stat().st_mtime, entry.path) for entry in it if entry.is_dir() and entry.name != current_run_id),
+                reverse=True,
+            )
+    except OSError as e:
+        log_fn(f"WARN: [checkpoint] Could not list old runs: {e}")
+        return
+    for _, path in runs[max(keep - 1, 0):]:
+        shutil.rmtree(path, ignore_errors=True)
+        log_fn(f"INFO: [checkpoint] Deleted old run directory '{os.path.basename(path)}'.")
+
+
+def restore_processed_urls(saved: Dict[str, Any], log_fn) -> Dict[str, str]:
+    """
+    Rebuilds the downloaded pages of a checkpoint from the page cache; checkpoints only keep the URLs.
+    Pages that are no longer cached are left out and downloaded again if they are needed.
+    """
+    if "processed_urls_cache" in saved: # Checkpoints written before pages were left out of them
+        return dict(saved["processed_urls_cache"])
+    urls = saved.get("processed_urls") or []
+    restored: Dict[str, str] = {}
+    if PAGE_CACHE is not None:
+        for url in urls:
+            cached = PAGE_CACHE.get(url)
+            if cached and cached[0]:
+                restored[url] = cached[0]
+    if len(restored) < len(urls):
+        log_fn(f"INFO: [checkpoint] {len(urls) - len(restored)} of {len(urls)} pages are no longer cached and will be downloaded again if needed.")
+    return restored
+
+
+def _new_run_id() -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+# --------------------------- Run trace ---------------------------
+_TRACE_TOTALS = ("wall_s", "queue_wait_s", "bytes", "prompt_chars", "response_chars")
+
+
+class RunTracer:
+    """
+    Structured trace of one run: one span per phase, search, download and LLM call, each with its
+    wall time, the time it waited in a queue or rate limiter, bytes downloaded and prompt/response
+    character counts. Spans started while a phase is open are tagged with that phase.
+    """
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.origin = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+        self.current_phase = ""
+
+    def start(self, kind: str, name: str, **attrs) -> Dict[str, Any]:
+        now = time.monotonic()
+        span = {"kind": kind, "name": name, "start_s": round(now - self.origin, 4), "wall_s": 0.0, "queue_wait_s": 0.0}
+        if kind == "phase":
+            self.current_phase = name
+        else:
+            span["phase"] = self.current_phase
+        span.update(attrs)
+        span["_t0"] = now
+        self.spans.append(span)
+        return span
+
+    def end(self, span: Dict[str, Any], **attrs):
+        span.update(attrs)
+        t0 = span.pop("_t0", None)
+        if t0 is not None:
+            span["wall_s"] = round(time.monotonic() - t0, 4)
+        span["queue_wait_s"] = round(span.get("queue_wait_s", 0.0), 4)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        totals: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            agg = totals.setdefault(span["kind"], {"count": 0, **{k: 0 for k in _TRACE_TOTALS}})
+            agg["count"] += 1
+            for k in _TRACE_TOTALS:
+                agg[k] += span.get(k, 0) or 0
+        for agg in totals.values():
+            agg["wall_s"], agg["queue_wait_s"] = round(agg["wall_s"], 4), round(agg["queue_wait_s"], 4)
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = []
+        for span in self.spans:
+            span = dict(span)
+            if span.pop("_t0", None) is not None:
+                span["unfinished"] = True
+            spans.append(span)
+        return {
+            "run_id": self.run_id,
+            "total_s": round(time.monotonic() - self.origin, 4),
+            "summary": self.summary(),
+            "spans": spans,
+        }
+
+
+def trace_start(kind: str, name: str, **attrs) -> Optional[Dict[str, Any]]:
+    return TRACER.start(kind, name, **attrs) if TRACER is not None else None
+
+
+def trace_end(span: Optional[Dict[str, Any]], **attrs):
+    if span is not None and TRACER is not None:
+        TRACER.end(span, **attrs)
+
+
+# --------------------------- Rate limiting ---------------------------
+class AsyncTokenBucket:
+    """
+    Async token bucket for one backend. Up to `burst` calls start immediately, then calls are
+    released at `rate_per_second`. Errors halve the current rate (down to 10% of the configured
+    rate) and successes restore it gradually.
+    """
+
+    def __init__(self, name: str, rate_per_second: float, burst: int):
+        self.name = name
+        self.max_rate = rate_per_second
+        self.rate = rate_per_second
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def report_success(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def report_error(self):
+        self._refill()
+        self.rate = max(self.max_rate * 0.1, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+
+
+def configure_rate_limiters(config: CONFIG, log_fn):
+    RATE_LIMITERS.clear()
+    for backend in ("search", "llm", "download"):
+        rate = float(getattr(config, f"{backend}_rate_per_second", getattr(CONFIG, f"{backend}_rate_per_second")))
+        burst = int(getattr(config, f"{backend}_burst", getattr(CONFIG, f"{backend}_burst")))
+        if rate > 0:
+            RATE_LIMITERS[backend] = AsyncTokenBucket(backend, rate, burst)
+            log_fn(f"INFO: [rate_limit] {backend}: {rate:g}/s, burst {burst}.")
+        else:
+            log_fn(f"INFO: [rate_limit] {backend}: unlimited.")
+
+
+async def throttle(backend: str) -> float:
+    """Waits for the backend's rate limiter and returns the seconds spent waiting."""
+    limiter = RATE_LIMITERS.get(backend)
+    if limiter is None:
+        return 0.0
+    started = time.monotonic()
+    await limiter.acquire()
+    return time.monotonic() - started
+
+
+def report_backend_result(backend: str, ok: bool):
+    limiter = RATE_LIMITERS.get(backend)
+    if limiter is None:
+        return
+    if ok:
+        limiter.report_success()
+    else:
+        limiter.report_error()
 
 
 # --------------------------- Markdown / string helpers ---------------------------
@@ -200,27 +460,386 @@ def _truncate_content_bookend(content: str, first_chars: int, last_chars: int) -
     return f"{first_part.rstrip()}{separator}{last_part.lstrip()}"
 
 
+class ExcerptConfig(NamedTuple):
+    first_chars: int
+    last_chars: int
+    token_budget: int
+    embedding_model: str
+
+
+def _estimate_tokens(text: str) -> int:
+    """Cheap token estimate: one token per word and per punctuation mark."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def _chunk_content(content: str, target_tokens: int = 200) -> List[str]:
+    """Splits content into passages of roughly `target_tokens`, on paragraph, then sentence, then word boundaries."""
+    pieces: List[str] = []
+    for para in re.split(r"\n\s*\n", content):
+        para = para.strip()
+        if not para:
+            continue
+        if _estimate_tokens(para) <= target_tokens:
+            pieces.append(para)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", para):
+            words = sentence.split(" ")
+            while words:
+                pieces.append(" ".join(words[:target_tokens]))
+                words = words[target_tokens:]
+
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = _estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > target_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def select_relevant_passages(content: str, focus_text: str, token_budget: int, embedding_model: str = "", log_fn=None) -> str:
+    """
+    Keeps the passages of `content` most relevant to `focus_text` (BM25, blended with embedding
+    similarity when a model is configured) until `token_budget` is spent. The first passage is
+    always kept for context, whatever its score, and the selection is returned in document order.
+    """
+    if not content or _estimate_tokens(content) <= token_budget:
+        return content or ""
+    chunks = _chunk_content(content)
+    scores = bm25_scores(_tokenize(focus_text), [_tokenize(c) for c in chunks])
+    if embedding_model:
+        similarities = embedding_similarity_matrix(embedding_model, [focus_text], chunks, log_fn or (lambda _: None))
+        if similarities is not None:
+            best = max(scores, default=0.0)
+            scores = [0.5 * (sc / best if best > 0 else 0.0) + 0.5 * float(sim) for sc, sim in zip(scores, similarities[0])]
+
+    # The lead passage always goes in first (cut to the budget if it is larger); ranking fills the rest.
+    used = _estimate_tokens(chunks[0])
+    if used > token_budget:
+        return _truncate_content_bookend(chunks[0], token_budget * 4, 0)
+    selected = [0]
+    for i in sorted(range(1, len(chunks)), key=lambda i: (-scores[i], i)):
+        chunk_tokens = _estimate_tokens(chunks[i])
+        if used + chunk_tokens > token_budget:
+            continue
+        selected.append(i)
+        used += chunk_tokens
+
+    selected.sort()
+    parts = [chunks[selected[0]]]
+    for prev, i in zip(selected, selected[1:]):
+        parts.append("\n\n" if i == prev + 1 else "\n\n[...]\n\n")
+        parts.append(chunks[i])
+    return "".join(parts)
+
+
+def _source_excerpt(content: str, focus_text: str, excerpt_config: ExcerptConfig) -> str:
+    if excerpt_config.token_budget > 0:
+        return select_relevant_passages(content, focus_text, excerpt_config.token_budget, excerpt_config.embedding_model)
+    return _truncate_content_bookend(content, excerpt_config.first_chars, excerpt_config.last_chars)
+
+
+# --------------------------- Page content cache ---------------------------
+def _cache_key_for_url(url: str) -> str:
+    """Normalizes a URL into its cache key: the `_clean_url` form without fragment."""
+    return urldefrag(_clean_url(url))[0]
+
+
+class PageContentCache:
+    """
+    SQLite-backed cache of extracted page content, stored zlib-compressed under the home path.
+    Entries expire after `ttl_seconds`; when the compressed total exceeds `max_bytes`,
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY, source TEXT NOT NULL, content BLOB NOT NULL,"
+            " stored_size INTEGER NOT NULL, fetch_seconds REAL NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)")
+        self.conn.execute("DELETE FROM pages WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self.conn.commit()
+
+    def get(self, url: str) -> Optional[Tuple[str, str]]:
+        key = _cache_key_for_url(url)
+        row = self.conn.execute(
+            "SELECT source, content, fetch_seconds, created_at FROM pages WHERE url = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if not row or row[3] < now - self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE pages SET last_access = ? WHERE url = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        self.saved_seconds += row[2]
+        return zlib.decompress(row[1]).decode("utf-8"), row[0]
+
+    def put(self, url: str, content: str, source: str, fetch_seconds: float):
+        data = zlib.compress(content.encode("utf-8"), 6)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (url, source, content, stored_size, fetch_seconds, created_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (_cache_key_for_url(url), source, data, len(data), fetch_seconds, now, now),
+        )
+        self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(stored_size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT url, stored_size FROM pages ORDER BY last_access ASC").fetchall()
+        evicted = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+        self.conn.executemany("DELETE FROM pages WHERE url = ?", evicted)
+
+    def stats_message(self) -> str:
+        return (f"INFO: [page_cache] {self.hits} hits, {self.misses} misses, "
+                f"~{self.saved_seconds:.1f}s of download time saved.")
+
+    def close(self):
+        try:
+            self.conn.commit()
+        finally:
+            self.conn.close()
+
+
+def open_page_cache(home_path: str, config: CONFIG, log_fn) -> Optional[PageContentCache]:
+    ttl_hours = float(getattr(config, "page_cache_ttl_hours", CONFIG.page_cache_ttl_hours))
+    max_mb = float(getattr(config, "page_cache_max_mb", CONFIG.page_cache_max_mb))
+    if ttl_hours <= 0 or max_mb <= 0:
+        log_fn("INFO: [page_cache] Disabled by configuration.")
+        return None
+    try:
+        cache = PageContentCache(os.path.join(home_path, "page_cache.sqlite3"), ttl_hours * 3600, int(max_mb * 1024 * 1024))
+        log_fn(f"INFO: [page_cache] Opened (ttl={ttl_hours:g}h, max={max_mb:g}MB).")
+        return cache
+    except Exception as e:
+        log_fn(f"WARN: [page_cache] Could not open cache, continuing without it: {e}")
+        return None
+
+
+# --------------------------- Local ranking ---------------------------
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "its", "of",
+    "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "with",
+}
+
+
+def _tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+
+def bm25_scores(query_tokens: List[str], docs_tokens: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of each tokenized document against the query, with IDF computed over `docs_tokens`."""
+    n_docs = len(docs_tokens)
+    if not n_docs or not query_tokens:
+        return [0.0] * n_docs
+    avg_len = sum(len(d) for d in docs_tokens) / n_docs or 1.0
+    doc_freq: Dict[str, int] = {}
+    for doc in docs_tokens:
+        for term in set(doc):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+    scores = []
+    for doc in docs_tokens:
+        term_counts: Dict[str, int] = {}
+        for term in doc:
+            term_counts[term] = term_counts.get(term, 0) + 1
+        score = 0.0
+        for term in set(query_tokens):
+            tf = term_counts.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+def _load_embedding_model(model_name: str, log_fn) -> Optional[Any]:
+    with EMBEDDING_MODELS_LOCK:
+        if model_name not in EMBEDDING_MODELS:
+            EMBEDDING_MODELS[model_name] = _create_embedding_model(model_name, log_fn)
+        return EMBEDDING_MODELS[model_name]
+
+
+def _create_embedding_model(model_name: str, log_fn) -> Optional[Any]:
+    model = None
+    try:
+        from fastembed import TextEmbedding
+        model = TextEmbedding(model_name=model_name)
+        log_fn(f"INFO: [ranking] Loaded embedding model '{model_name}'.")
+    except ImportError:
+        log_fn("WARN: [ranking] fastembed is not installed, ranking with BM25 only.")
+    except Exception as e:
+        log_fn(f"WARN: [ranking] Could not load embedding model '{model_name}', ranking with BM25 only: {e}")
+    return model
+
+
+def embedding_similarity_matrix(model_name: str, contexts: List[str], docs: List[str], log_fn) -> Optional[Any]:
+    """Cosine similarity of every context against every document, as one (contexts x docs) NumPy matrix."""
+    model = _load_embedding_model(model_name, log_fn)
+    if model is None or not contexts or not docs:
+        return None
+    try:
+        import numpy as np
+        vectors = np.asarray(list(model.embed(contexts + docs)), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        return vectors[:len(contexts)] @ vectors[len(contexts):].T
+    except Exception as e:
+        log_fn(f"WARN: [ranking] Embedding similarity failed, ranking with BM25 only: {e}")
+        return None
+
+
+def rank_results_locally(
+    queries: List[str],
+    contexts: List[str],
+    raw_results: List[List[Dict[str, Any]]],
+    embedding_model: str,
+    log_fn
+) -> List[Optional[List[str]]]:
+    """
+    Orders each query's search results by BM25 relevance of their title and description to the query
+    and its context, blended with embedding cosine similarity when a model is configured. Returns None
+    for a query when no result shares any term with it, so the caller can fall back to the LLM.
+    """
+    docs_per_query = [[f"{r.get('title') or ''} {r.get('description') or ''}" for r in results] for results in raw_results]
+    flat_docs = [d for docs in docs_per_query for d in docs]
+    similarities = embedding_similarity_matrix(embedding_model, contexts, flat_docs, log_fn) if embedding_model else None
+
+    ranked: List[Optional[List[str]]] = []
+    offset = 0
+    for q_idx, (query, context, results) in enumerate(zip(queries, contexts, raw_results)):
+        docs = docs_per_query[q_idx]
+        lexical = bm25_scores(_tokenize(f"{query} {context}"), [_tokenize(d) for d in docs])
+        best = max(lexical, default=0.0)
+        if similarities is not None:
+            semantic = [float(x) for x in similarities[q_idx, offset:offset + len(docs)]]
+            scores = [0.5 * (l / best if best > 0 else 0.0) + 0.5 * c for l, c in zip(lexical, semantic)]
+        elif best > 0:
+            scores = lexical
+        else:
+            scores = None
+        offset += len(docs)
+        if scores is None:
+            ranked.append(None)
+            continue
+        order = sorted(range(len(results)), key=lambda i: scores[i], reverse=True)
+        ranked.append([_clean_url(results[i].get("url")) for i in order if results[i].get("url")])
+    return ranked
+
+
+# --------------------------- Near-duplicate detection ---------------------------
+class NearDuplicateIndex:
+    """
+    Bottom-k MinHash sketches of downloaded sources, used to collapse syndicated copies and mirrors
+    before they are sent to the LLM. Collapsed URLs are remembered with the URL that was kept.
+    """
+
+    def __init__(self, threshold: float, sketch_size: int = 128, shingle_size: int = 5):
+        self.threshold = threshold
+        self.sketch_size = sketch_size
+        self.shingle_size = shingle_size
+        self.sketches: Dict[str, Set[int]] = {}
+        self.collapsed: Dict[str, str] = {}
+
+    def _sketch(self, url: str, content: str) -> Set[int]:
+        sketch = self.sketches.get(url)
+        if sketch is None:
+            tokens = _tokenize(content)
+            k = self.shingle_size
+            shingles = {" ".join(tokens[i:i + k]) for i in range(max(1, len(tokens) - k + 1))}
+            hashes = (int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "big") for sh in shingles)
+            sketch = set(heapq.nsmallest(self.sketch_size, hashes))
+            self.sketches[url] = sketch
+        return sketch
+
+    def similarity(self, a: Set[int], b: Set[int]) -> float:
+        union_bottom = set(heapq.nsmallest(self.sketch_size, a | b))
+        if not union_bottom:
+            return 0.0
+        return len(union_bottom & a & b) / len(union_bottom)
+
+    def collapse(self, sources: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Keeps sources in order, dropping each one that is a near-duplicate of an already kept source."""
+        if self.threshold <= 0:
+            return sources
+        kept: List[Tuple[Dict[str, str], Set[int]]] = []
+        for src in sources:
+            sketch = self._sketch(src["url"], src["content"])
+            duplicate_of = next((k["url"] for k, k_sketch in kept if self.similarity(sketch, k_sketch) >= self.threshold), None)
+            if duplicate_of:
+                self.collapsed[src["url"]] = duplicate_of
+            else:
+                kept.append((src, sketch))
+        return [src for src, _ in kept]
+
+
+def collapse_near_duplicate_sources(sources: List[Dict[str, str]], log_fn) -> List[Dict[str, str]]:
+    if DUPLICATE_INDEX is None or len(sources) < 2:
+        return sources
+    kept = DUPLICATE_INDEX.collapse(sources)
+    if len(kept) < len(sources):
+        log_fn(f"INFO: [dedupe] Collapsed {len(sources) - len(kept)} near-duplicate sources: {[s['url'] for s in sources if s not in kept]}")
+    return kept
+
+
 # --------------------------- Low-level raw helpers (no internal delays) ---------------------------
 async def llm_raw_call(payload: Dict[str, Any], log_fn) -> Dict[str, Any]:
+    span = trace_start("llm", payload.get("format", "text"), prompt_chars=len(payload.get("prompt") or ""))
+    resp: Dict[str, Any] = {}
     try:
-        resp = await shinkai_llm_prompt_processor(payload)
+        waited = await throttle("llm")
+        if span is not None: span["queue_wait_s"] = waited
+        resp = await shinkai_llm_prompt_processor(payload) or {}
+        report_backend_result("llm", bool(resp))
         log_fn("INFO: llm_raw_call completed.")
-        return resp or {}
+        return resp
     except Exception as e:
+        report_backend_result("llm", False)
         log_fn(f"ERROR: llm_raw_call failed: {e}")
         return {}
+    finally:
+        trace_end(span, response_chars=len(_extract_message_text(resp)), ok=bool(resp))
 
 
 async def search_raw(query: str, log_fn) -> List[Dict[str, Any]]:
+    span = trace_start("search", query, results=0)
+    msg = ""
     try:
+        waited = await throttle("search")
+        if span is not None: span["queue_wait_s"] = waited
         res = await duck_duck_go_search({"message": query})
         msg = res.get("message")
+        report_backend_result("search", bool(msg))
         if not msg:
             log_fn(f"WARN: search_raw for '{query}' returned an empty message.")
             return []
         parsed = json.loads(msg)
         if isinstance(parsed, list):
             log_fn(f"INFO: search_raw for '{query}' returned {len(parsed)} results.")
+            if span is not None: span["results"] = len(parsed)
             return parsed
         else:
             log_fn(f"WARN: search_raw unexpected format for '{query}'.")
@@ -229,27 +848,68 @@ async def search_raw(query: str, log_fn) -> List[Dict[str, Any]]:
         log_fn(f"ERROR: search_raw failed to parse JSON for '{query}': {e}. Response was: '{msg}'")
         return []
     except Exception as e:
+        report_backend_result("search", False)
         log_fn(f"ERROR: search_raw failed for '{query}': {e}")
         return []
+    finally:
+        trace_end(span, response_chars=len(msg or ""))
 
 
-async def extract_content_from_url(url: str, log_fn) -> Tuple[str, str]:
+async def extract_content_from_url(url: str, log_fn, queue_wait: float = 0.0) -> Tuple[str, str]:
+    span = trace_start("download", url, queue_wait_s=queue_wait, bytes=0, source="none", cache_hit=False)
+    content, source = "", "none"
+    try:
+        if PAGE_CACHE is not None:
+            try:
+                cached = PAGE_CACHE.get(url)
+                if cached:
+                    log_fn(f"INFO: [page_cache] Hit for {url} ({len(cached[0])} chars)")
+                    content, source = cached
+                    if span is not None: span["cache_hit"] = True
+                    return cached
+            except Exception as e:
+                log_fn(f"WARN: [page_cache] Lookup failed for {url}: {e}")
+
+        started = time.monotonic()
+        content, source = await _download_content_from_url(url, log_fn, span)
+        if PAGE_CACHE is not None and content:
+            try:
+                PAGE_CACHE.put(url, content, source, time.monotonic() - started)
+            except Exception as e:
+                log_fn(f"WARN: [page_cache] Store failed for {url}: {e}")
+        return content, source
+    except asyncio.CancelledError:
+        if span is not None: span["cancelled"] = True
+        raise
+    finally:
+        trace_end(span, bytes=len(content.encode("utf-8")) if content else 0, source=source)
+
+
+async def _download_content_from_url(url: str, log_fn, span: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    waited = await throttle("download")
+    if span is not None: span["queue_wait_s"] += waited
     try:
         page_resp = await download_pages({"url": url})
+        report_backend_result("download", True)
         content = page_resp.get("markdown", "")
         if content and len(content) > 100:
             log_fn(f"INFO: [download_pages] Extracted {len(content)} chars from page {url}")
             return content, "page"
     except Exception as e:
+        report_backend_result("download", False)
         log_fn(f"INFO: download_pages failed for {url}: {e}")
 
+    waited = await throttle("download")
+    if span is not None: span["queue_wait_s"] += waited
     try:
         pdf_resp = await pdf_text_extractor({"url": url})
+        report_backend_result("download", True)
         content = pdf_resp.get("text_content", "")
         if content and len(content) > 100:
             log_fn(f"INFO: [pdf_downloader] Extracted {len(content)} chars from PDF {url}")
             return content, "pdf"
     except Exception as e:
+        report_backend_result("download", False)
         log_fn(f"INFO: pdf_downloader failed for {url}: {e}")
 
     log_fn(f"WARN: No extractable content at {url} after all attempts.")
@@ -347,13 +1007,19 @@ def _ranking_prompt_for_query(query_text: str, search_results: List[Dict[str, An
         '{"ranked_results": [{"url": "https://...", "title": "...", "score": 5}, {"url": "...", "title": "...", "score": 3}]}'
     )
 
+def _deduplicated_subsection_synthesis_prompt(research_query: str, section_title: str, subsection_title: str,
+                                              subsection_desc: str, top_sources: List[Dict[str, str]],
+                                              excerpt_config: ExcerptConfig, log_fn) -> str:
+    top_sources = collapse_near_duplicate_sources(top_sources, log_fn)
+    return _subsection_synthesis_prompt(research_query, section_title, subsection_title, subsection_desc, "", top_sources, excerpt_config)
+
 def _subsection_synthesis_prompt(research_query: str, section_title: str, subsection_title: str,
                                  subsection_desc: str, existing_section_context: str,
                                  top_sources: List[Dict[str, str]],
-                                 truncate_config: Tuple[int, int]) -> str:
-    first_chars, last_chars = truncate_config
+                                 excerpt_config: ExcerptConfig) -> str:
+    focus_text = f"{subsection_title} {subsection_desc}"
     sources_summary = "\n\n---\n\n".join(
-        [f"Source URL: {s['url']}\nContent excerpt:\n{_truncate_content_bookend(s['content'], first_chars, last_chars)}" for s in top_sources])
+        [f"Source URL: {s['url']}\nContent excerpt:\n{_source_excerpt(s['content'], focus_text, excerpt_config)}" for s in top_sources])
     return (
         "You are a professional research analyst. Produce a well-structured markdown subsection that answers the query below.\n\n"
         f"Main Research Query: {research_query}\n"
@@ -371,13 +1037,26 @@ def _subsection_synthesis_prompt(research_query: str, section_title: str, subsec
         f"Output: A polished markdown paragraph block (no heading)."
     )
 
+def _reflection_prompt(research_query: str, section_title: str, section_desc: str,
+                       section_markdown: str, max_new_queries: int) -> str:
+    return (
+        "You are a critical-thinking expert. Reflect on the section content and propose up to "
+        f"{max_new_queries} "
+        "highly specific new web search queries to close meaningful gaps. Do not repeat any queries that would have been used to generate the existing content.\n\n"
+        f"Main research query: {research_query}\n\n"
+        f"Section Title: {section_title}\n"
+        f"Section Goal: {section_desc}\n\n"
+        "Existing Section Content:\n" + section_markdown + "\n\n"
+        "Rules:\n- Propose queries for genuinely new, relevant information.\n- Avoid overlap.\n"
+        "Output MUST be valid JSON: {\"new_queries\": [\"query1\", \"query2\"]}"
+    )
+
 def _supplemental_prompt_for_query(research_query: str, section_title: str, section_desc: str,
                                    current_section_markdown: str, query: str,
                                    top_sources: List[Dict[str, str]],
-                                   truncate_config: Tuple[int, int]) -> str:
-    first_chars, last_chars = truncate_config
+                                   excerpt_config: ExcerptConfig) -> str:
     sources_summary = "\n\n".join(
-        [f"Source URL: {s['url']}\nContent excerpt:\n{_truncate_content_bookend(s['content'], first_chars, last_chars)}" for s in top_sources])
+        [f"Source URL: {s['url']}\nContent excerpt:\n{_source_excerpt(s['content'], query, excerpt_config)}" for s in top_sources])
     return (
         f"You are enhancing the section '{section_title}' for the research topic '{research_query}'.\n"
         f"Section goal: {section_desc}\n\n"
@@ -471,28 +1150,105 @@ def _title_prompt(abstract: str, research_query: str) -> str:
     )
 
 
-# --------------------------- Dispatchers (Unchanged) ---------------------------
-async def dispatch_staggered_searches(queries: List[str], log_fn: Callable[[str], None]) -> List[Any]:
-    tasks = []
-    for q in queries:
-        await async_wait_1_5s()
-        tasks.append(asyncio.create_task(search_raw(q, log_fn)))
+# --------------------------- Dispatchers (paced by the per-backend rate limiters) ---------------------------
+async def dispatch_searches(queries: List[str], log_fn: Callable[[str], None]) -> List[Any]:
+    tasks = [asyncio.create_task(search_raw(q, log_fn)) for q in queries]
     return await asyncio.gather(*tasks, return_exceptions=True)
 
-async def dispatch_staggered_llm_json(prompts: List[str], log_fn: Callable[[str], None]) -> List[Any]:
-    tasks = []
-    for p in prompts:
-        await async_wait_1_5s()
-        tasks.append(asyncio.create_task(llm_json_from_message(p, log_fn)))
+async def dispatch_llm_json(prompts: List[str], log_fn: Callable[[str], None]) -> List[Any]:
+    tasks = [asyncio.create_task(llm_json_from_message(p, log_fn)) for p in prompts]
     return await asyncio.gather(*tasks, return_exceptions=True)
 
-async def dispatch_staggered_llm_text(prompts: List[str], log_fn: Callable[[str], None]) -> List[Any]:
-    tasks = []
-    for p in prompts:
-        await async_wait_1_5s()
-        tasks.append(asyncio.create_task(llm_text_from_message(p, log_fn)))
+async def dispatch_llm_text(prompts: List[str], log_fn: Callable[[str], None]) -> List[Any]:
+    tasks = [asyncio.create_task(llm_text_from_message(p, log_fn)) for p in prompts]
     return await asyncio.gather(*tasks, return_exceptions=True)
 
+def _batched_prompt(prompts: List[str]) -> str:
+    tasks = "\n\n".join(f'=== TASK "{i}" ===\n{p}' for i, p in enumerate(prompts))
+    return (
+        f"You will complete {len(prompts)} independent tasks. Each task starts with a line '=== TASK \"<id>\" ==='. "
+        "Complete each task exactly as it instructs, as if it were the only one.\n\n"
+        f"{tasks}\n\n"
+        "=== OUTPUT FORMAT ===\n"
+        "Return ONLY one JSON object mapping every task id to its answer, e.g. {\"0\": <answer to task 0>, \"1\": <answer to task 1>}. "
+        "When a task asks for a JSON object, its answer is that JSON object; otherwise its answer is a JSON string."
+    )
+
+async def dispatch_llm_batched(prompts: List[str], expect_json: bool, batch_size: int, log_fn: Callable[[str], None]) -> List[Any]:
+    """
+    Packs small independent prompts into batches of up to `batch_size`, sends each batch as one JSON request and
+    splits the answers back by task id. Prompts whose batch response is unparsable or lacks their answer are
+    retried as individual calls.
+    """
+    batch_size = max(1, batch_size)
+    batches = [list(range(i, min(i + batch_size, len(prompts)))) for i in range(0, len(prompts), batch_size)]
+    packed = [b for b in batches if len(b) > 1]
+    individual = [b[0] for b in batches if len(b) == 1]
+    results: List[Any] = [None] * len(prompts)
+
+    packed_results = await dispatch_llm_json([_batched_prompt([prompts[j] for j in b]) for b in packed], log_fn) if packed else []
+    for batch, res in zip(packed, packed_results):
+        for pos, j in enumerate(batch):
+            answer = res.get(str(pos)) if isinstance(res, dict) else None
+            if expect_json and isinstance(answer, str):
+                try:
+                    answer = json.loads(answer)
+                except Exception:
+                    answer = None
+            if (isinstance(answer, dict) if expect_json else isinstance(answer, str) and answer.strip()):
+                results[j] = answer
+            else:
+                individual.append(j)
+    fallbacks = len(individual) - sum(1 for b in batches if len(b) == 1)
+    if fallbacks:
+        log_fn(f"WARN: [batching] {fallbacks} batched prompts got no usable answer, retrying them individually.")
+
+    if individual:
+        dispatch = dispatch_llm_json if expect_json else dispatch_llm_text
+        for j, res in zip(individual, await dispatch([prompts[j] for j in individual], log_fn)):
+            results[j] = res
+    log_fn(f"INFO: [batching] {len(prompts)} prompts answered with {len(packed) + len(individual)} LLM calls.")
+    return results
+
+async def rank_search_results(
+    queries: List[str],
+    contexts: List[str],
+    raw_search_results: List[Any],
+    top_n: int,
+    config: CONFIG,
+    log_fn: Callable[[str], None]
+) -> Dict[str, List[str]]:
+    """Returns the top `top_n` URLs of each query, ranked locally, or by the LLM where local ranking is inconclusive or disabled."""
+    raw_lists = [raw if isinstance(raw, list) else [] for raw in raw_search_results]
+    method = (getattr(config, "ranking_method", CONFIG.ranking_method) or "local").strip().lower()
+    if method == "llm":
+        local_ranked: List[Optional[List[str]]] = [None] * len(queries)
+    else:
+        embedding_model = (getattr(config, "ranking_embedding_model", CONFIG.ranking_embedding_model) or "").strip()
+        # CPU-bound (BM25, optional embeddings): run it in a thread so downloads and syntheses keep going.
+        local_ranked = await asyncio.to_thread(rank_results_locally, queries, contexts, raw_lists, embedding_model, log_fn)
+
+    ranking_prompts = [_ranking_prompt_for_query(q, raw) if raw and local_ranked[idx] is None else "" for idx, (q, raw) in enumerate(zip(queries, raw_lists))]
+    llm_prompt_count = sum(1 for p in ranking_prompts if p)
+    log_fn(f"INFO: [ranking] {len(queries) - llm_prompt_count} queries ranked locally, {llm_prompt_count} sent to the LLM.")
+    batch_size = int(getattr(config, "llm_batch_size", CONFIG.llm_batch_size))
+    ranking_results = await dispatch_llm_batched([p for p in ranking_prompts if p], True, batch_size, log_fn) if llm_prompt_count else []
+
+    ranked_urls_by_query: Dict[str, List[str]] = {}
+    rank_res_iter = iter(ranking_results)
+    for idx, query_text in enumerate(queries):
+        urls = list(local_ranked[idx] or [])
+        raw = raw_lists[idx]
+        if ranking_prompts[idx]:
+            rank_res = next(rank_res_iter, {})
+            if isinstance(rank_res, dict):
+                ranked = sorted(rank_res.get("ranked_results", []), key=lambda x: int(x.get("score", 0)), reverse=True)
+                urls = [_clean_url(r.get("url")) for r in ranked if r.get("url")]
+        urls.extend([_clean_url(r.get("url")) for r in raw if r.get("url") and _clean_url(r.get("url")) not in urls])
+        ranked_urls_by_query[query_text] = urls[:top_n]
+    return ranked_urls_by_query
+
+
 # --------------------------- Concurrent Worker Functions ---------------------------
 async def synthesis_worker(
     worker_id: int,
@@ -503,10 +1259,14 @@ async def synthesis_worker(
     """Pulls synthesis jobs from a queue, executes them, and stores the result."""
     while True:
         try:
-            subsection_key, prompt = await queue.get()
+            subsection_key, prompt, enqueued_at = await queue.get()
             log_fn(f"INFO: SynthWorker-{worker_id} starting: {subsection_key}")
-            await async_wait_1_5s()
+            if callable(prompt):
+                # Selecting the source passages (BM25, optional embeddings) is CPU-bound, keep it off the event loop.
+                prompt = await asyncio.to_thread(prompt)
+            span = trace_start("synthesis", f"{subsection_key[0]} / {subsection_key[1]}", queue_wait_s=time.monotonic() - enqueued_at)
             result = await llm_text_from_message(prompt, log_fn)
+            trace_end(span, prompt_chars=len(prompt), response_chars=len(result) if isinstance(result, str) else 0)
             results_dict[subsection_key] = result if isinstance(result, str) else ""
             queue.task_done()
             log_fn(f"INFO: SynthWorker-{worker_id} finished: {subsection_key}")
@@ -517,44 +1277,133 @@ async def synthesis_worker(
             if 'subsection_key' in locals(): results_dict[subsection_key] = ""
             queue.task_done()
 
+class SubsectionSynthesisScheduler:
+    """
+    Decides when a subsection is ready for synthesis: once `quorum` of its ranked sources have content,
+    once all of them have been processed, or once its deadline expired with at least one source ready.
+    Downloads that no pending subsection still needs are skipped or cancelled.
+    """
+
+    def __init__(
+        self,
+        synthesis_queue: asyncio.Queue,
+        processed_urls_cache: Dict[str, str],
+        url_to_subsections_map: Dict[str, List[Tuple[str, int]]],
+        subsection_dependencies: Dict[Tuple[str, int], Set[str]],
+        sections_data: Dict[str, Any],
+        research_query: str,
+        ranked_urls_by_query: Dict[str, List[str]],
+        excerpt_config: ExcerptConfig,
+        quorum: int,
+        log_fn
+    ):
+        self.synthesis_queue = synthesis_queue
+        self.processed_urls_cache = processed_urls_cache
+        self.url_to_subsections_map = url_to_subsections_map
+        self.subsection_dependencies = subsection_dependencies
+        self.sections_data = sections_data
+        self.research_query = research_query
+        self.ranked_urls_by_query = ranked_urls_by_query
+        self.excerpt_config = excerpt_config
+        self.quorum = quorum
+        self.log_fn = log_fn
+        self.deadline_expired: Set[Tuple[str, int]] = set()
+        self.inflight_downloads: Dict[str, asyncio.Task] = {}
+        self.cancelled_downloads = 0
+
+    def _subsection(self, key: Tuple[str, int]) -> Dict[str, Any]:
+        sec_title, sub_idx = key
+        return self.sections_data[sec_title]["subsections"][sub_idx]
+
+    def _is_ready(self, key: Tuple[str, int]) -> bool:
+        required_urls = self.subsection_dependencies.get(key)
+        if not required_urls:
+            return False
+        processed = [u for u in required_urls if u in self.processed_urls_cache]
+        with_content = sum(1 for u in processed if self.processed_urls_cache[u])
+        if len(processed) == len(required_urls):
+            return True
+        if self.quorum > 0 and with_content >= min(self.quorum, len(required_urls)):
+            return True
+        return key in self.deadline_expired and with_content > 0
+
+    def url_still_needed(self, url: str) -> bool:
+        return any(not self._subsection(key).get("synthesis_queued") for key in self.url_to_subsections_map.get(url, []))
+
+    def on_url_processed(self, url: str, content: str):
+        self.processed_urls_cache[url] = content or ""
+        for key in self.url_to_subsections_map.get(url, []):
+            if self._is_ready(key):
+                self.trigger(key, "sources ready")
+
+    def on_deadline(self, key: Tuple[str, int]):
+        self.deadline_expired.add(key)
+        if self._is_ready(key):
+            self.trigger(key, "deadline")
+
+    def trigger(self, key: Tuple[str, int], reason: str):
+        sub = self._subsection(key)
+        if sub.get("synthesis_queued"):
+            return
+        sub["synthesis_queued"] = True
+        sec_title = key[0]
+        required_urls = self.subsection_dependencies.get(key) or set()
+        ready_count = sum(1 for u in required_urls if self.processed_urls_cache.get(u))
+        self.log_fn(f"INFO: Triggered synthesis for {key} ({reason}, {ready_count}/{len(required_urls)} sources).")
+
+        ordered_urls = [u for u in self.ranked_urls_by_query.get(sub["query"], []) if u in required_urls]
+        ordered_urls.extend([u for u in required_urls if u not in ordered_urls])
+        top_sources = [{"url": u, "content": self.processed_urls_cache.get(u, "")} for u in ordered_urls if self.processed_urls_cache.get(u, "")]
+
+        # Collapsing near-duplicates and building the prompt are CPU-bound; the synthesis worker runs them in a thread.
+        prompt = f"### {sub['title']}\n\nNo reliable sources were found for query: {sub['query']}" if not top_sources else functools.partial(_deduplicated_subsection_synthesis_prompt, self.research_query, sec_title, sub["title"], sub["description"], top_sources, self.excerpt_config, self.log_fn)
+        self.synthesis_queue.put_nowait((key, prompt, time.monotonic()))
+
+        for url in required_urls:
+            task = self.inflight_downloads.get(url)
+            if task is not None and not task.done() and not self.url_still_needed(url):
+                self.log_fn(f"INFO: Cancelling download no longer needed: {url}")
+                self.cancelled_downloads += 1
+                task.cancel()
+
+    def flush(self):
+        for key in self.subsection_dependencies:
+            if self.subsection_dependencies[key] and not self._subsection(key).get("synthesis_queued"):
+                self.trigger(key, "downloads finished")
+
+
+async def subsection_deadline_watcher(scheduler: SubsectionSynthesisScheduler, key: Tuple[str, int], deadline_seconds: float):
+    await asyncio.sleep(deadline_seconds)
+    scheduler.on_deadline(key)
+
+
 async def downloader_and_orchestrator_worker(
     worker_id: int,
     url_queue: asyncio.Queue,
-    synthesis_queue: asyncio.Queue,
-    processed_urls_cache: Dict[str, str],
-    url_to_subsections_map: Dict[str, List[Tuple[str, int]]],
-    subsection_dependencies: Dict[Tuple[str, int], Set[str]],
-    sections_data: Dict[str, Any],
-    research_query: str,
-    ranked_urls_by_query: Dict[str, List[str]],
-    truncate_config: Tuple[int, int],
+    scheduler: SubsectionSynthesisScheduler,
     log_fn
 ):
-    """Pulls a URL to download, and after downloading, checks if any subsections are now ready for synthesis."""
+    """Pulls a URL to download, and after downloading, lets the scheduler queue any subsection that is now ready."""
     while not url_queue.empty():
         url = None
         try:
-            url = await url_queue.get()
+            url, enqueued_at = await url_queue.get()
+            if not scheduler.url_still_needed(url):
+                log_fn(f"INFO: Downloader-{worker_id} skipping {url}: its subsections are already being synthesized.")
+                url_queue.task_done()
+                continue
             log_fn(f"INFO: Downloader-{worker_id} fetching: {url}")
-            content, _ = await extract_content_from_url(url, log_fn)
-            processed_urls_cache[url] = content or ""
-            
-            subsections_to_check = url_to_subsections_map.get(url, [])
-            for key in subsections_to_check:
-                required_urls = subsection_dependencies.get(key)
-                if required_urls and all(u in processed_urls_cache for u in required_urls):
-                    sec_title, sub_idx = key
-                    sub = sections_data[sec_title]["subsections"][sub_idx]
-                    if sub.get("synthesis_queued"): continue
-                    sub["synthesis_queued"] = True
-                    log_fn(f"INFO: Downloader-{worker_id} triggered synthesis for: {key}")
-                    
-                    ordered_urls = [u for u in ranked_urls_by_query.get(sub["query"], []) if u in required_urls]
-                    ordered_urls.extend([u for u in required_urls if u not in ordered_urls])
-                    top_sources = [{"url": u, "content": processed_urls_cache.get(u, "")} for u in ordered_urls if processed_urls_cache.get(u, "")]
-                    
-                    prompt = f"### {sub['title']}\n\nNo reliable sources were found for query: {sub['query']}" if not top_sources else _subsection_synthesis_prompt(research_query, sec_title, sub["title"], sub["description"], "", top_sources, truncate_config)
-                    await synthesis_queue.put((key, prompt))
+            download = asyncio.create_task(extract_content_from_url(url, log_fn, time.monotonic() - enqueued_at))
+            scheduler.inflight_downloads[url] = download
+            try:
+                await asyncio.wait({download})
+            finally:
+                scheduler.inflight_downloads.pop(url, None)
+                if not download.done():
+                    download.cancel()
+            if not download.cancelled():
+                content, _ = download.result()
+                scheduler.on_url_processed(url, content)
             url_queue.task_done()
         except asyncio.CancelledError:
             break
@@ -562,8 +1411,120 @@ async def downloader_and_orchestrator_worker(
             log_fn(f"ERROR: Downloader-{worker_id} failed on {url}: {e}")
             if url: url_queue.task_done()
 
+class SharedDownloadPool:
+    """
+    Download queue shared by the concurrent section reflection pipelines. A fixed pool of workers
+    fetches each URL at most once; every pipeline asking for a URL that is queued or in flight
+    waits on the same result.
+    """
+
+    def __init__(self, processed_urls_cache: Dict[str, str], worker_count: int, log_fn):
+        self.processed_urls_cache = processed_urls_cache
+        self.log_fn = log_fn
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(max(1, worker_count))]
+
+    async def fetch(self, url: str) -> str:
+        if url in self.processed_urls_cache:
+            return self.processed_urls_cache[url]
+        future = self.pending.get(url)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[url] = future
+            self.queue.put_nowait((url, time.monotonic()))
+        return await asyncio.shield(future)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            url, enqueued_at = await self.queue.get()
+            content = ""
+            try:
+                self.log_fn(f"INFO: ReflectionDownloader-{worker_id} fetching: {url}")
+                content, _ = await extract_content_from_url(url, self.log_fn, time.monotonic() - enqueued_at)
+                self.processed_urls_cache[url] = content or ""
+            except Exception as e:
+                self.log_fn(f"ERROR: ReflectionDownloader-{worker_id} failed on {url}: {e}")
+            finally:
+                future = self.pending.pop(url, None)
+                if future is not None and not future.done():
+                    future.set_result(content or "")
+                self.queue.task_done()
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+
+async def section_reflection_pipeline(
+    sec_title: str,
+    sdata: Dict[str, Any],
+    research_query: str,
+    claimed_queries: Set[str],
+    downloads: SharedDownloadPool,
+    excerpt_config: ExcerptConfig,
+    top_n: int,
+    max_new_queries: int,
+    config: CONFIG,
+    loop_num: int,
+    log_fn
+) -> List[str]:
+    """
+    One reflection round of a single section, independent of the other sections: reflect, search and rank
+    the new queries, then write each query's supplemental block as soon as its own sources are downloaded,
+    and rewrite the section once all of its blocks are in. Returns the new queries claimed by the section.
+    """
+    span = trace_start("section_reflection", sec_title)
+    res = await llm_json_from_message(_reflection_prompt(research_query, sec_title, sdata["description"], sdata["final_markdown"], max_new_queries), log_fn)
+    new_qs: List[str] = []
+    for q in (res.get("new_queries", []) if isinstance(res, dict) else []):
+        qs = q.strip() if isinstance(q, str) else ""
+        # Claimed synchronously, so two sections never both run the same query.
+        if qs and qs not in claimed_queries:
+            claimed_queries.add(qs)
+            new_qs.append(qs)
+    log_fn(f"INFO: [Reflection Loop {loop_num}] Section '{sec_title}' generated {len(new_qs)} new queries.")
+    if not new_qs:
+        trace_end(span, new_queries=0)
+        return []
+
+    search_results = await dispatch_searches(new_qs, log_fn)
+    ranked_urls = await rank_search_results(new_qs, [f"{sec_title}. {sdata['description']}"] * len(new_qs), search_results, top_n, config, log_fn)
+
+    async def supplemental_block(query: str) -> str:
+        urls = [u for u in ranked_urls.get(query, []) if u]
+        contents = await asyncio.gather(*(downloads.fetch(u) for u in urls))
+        top_srcs = await asyncio.to_thread(collapse_near_duplicate_sources, [{"url": u, "content": c} for u, c in zip(urls, contents) if c], log_fn)
+        prompt = await asyncio.to_thread(_supplemental_prompt_for_query, research_query, sec_title, sdata["description"], sdata["final_markdown"], query, top_srcs, excerpt_config)
+        res = await llm_text_from_message(prompt, log_fn)
+        if not (isinstance(res, str) and res.strip()):
+            return ""
+        return remove_redundant_section_heading(_clean_markdown_citations(sanitize_markdown_block(res)), sec_title)
+
+    blocks = [b for b in await asyncio.gather(*(supplemental_block(q) for q in new_qs)) if b]
+    if blocks:
+        res = await llm_text_from_message(_rewrite_section_prompt(research_query, sec_title, sdata["description"], sdata["final_markdown"], blocks), log_fn)
+        if isinstance(res, str) and res.strip():
+            new_md = _clean_markdown_citations(sanitize_markdown_block(res))
+            sdata["final_markdown"] = remove_redundant_section_heading(new_md, sec_title)
+    log_fn(f"INFO: [Reflection Loop {loop_num}] Section '{sec_title}' rewritten with {len(blocks)} supplemental blocks.")
+    trace_end(span, new_queries=len(new_qs), supplemental_blocks=len(blocks))
+    return new_qs
+
 # --------------------------- Full pipeline ---------------------------
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
+    global PAGE_CACHE
+    try:
+        return await _run_pipeline(config, inputs)
+    finally:
+        # Also on failure, so the cache connection is never left open with pending writes.
+        if PAGE_CACHE is not None:
+            PAGE_CACHE.close()
+            PAGE_CACHE = None
+
+
+async def _run_pipeline(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     log_messages: List[str] = []
     
     # Define a conditional logger function
@@ -572,21 +1533,47 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
             log_messages.append(message)
 
     log(f"START: Full staged pipeline for query: '{inputs.research_query}'") # Use the new log function
-    global CURRENT_DATE
+    global CURRENT_DATE, PAGE_CACHE, DUPLICATE_INDEX, TRACER
     CURRENT_DATE = _get_ordinal_date()
     log(f"INFO: Current date set to {CURRENT_DATE}")
+    home_path = await get_home_path()
+    PAGE_CACHE = open_page_cache(home_path, config, log)
+    configure_rate_limiters(config, log)
+    DUPLICATE_INDEX = NearDuplicateIndex(float(getattr(config, "near_duplicate_similarity", CONFIG.near_duplicate_similarity)))
+
+    resume_run_id = re.sub(r"[^\w\-]", "", (getattr(inputs, "resume_run_id", None) or "").strip())
+    run_id = resume_run_id or _new_run_id()
+    runs_dir = os.path.join(home_path, "deep_research_runs")
+    prune_run_directories(runs_dir, int(getattr(config, "keep_run_checkpoints", CONFIG.keep_run_checkpoints)), run_id, log)
+    checkpoint = RunCheckpoint(os.path.join(runs_dir, run_id), log)
+    run_info = checkpoint.load("run") if resume_run_id else None
+    if resume_run_id and not run_info:
+        log(f"WARN: [checkpoint] No checkpoints found for run '{run_id}', starting it from scratch.")
+    if run_info and run_info.get("research_query") and run_info["research_query"] != inputs.research_query:
+        log(f"INFO: [checkpoint] Resuming with the original research query: '{run_info['research_query']}'")
+        inputs.research_query = run_info["research_query"]
+    if not run_info:
+        checkpoint.save("run", {"run_id": run_id, "research_query": inputs.research_query})
+    log(f"INFO: Run id: {run_id}")
+    TRACER = RunTracer(run_id)
 
     # This dictionary will store all queries in a structured way for the output.
     executed_queries_by_section: Dict[str, Dict[str, Any]] = {}
 
     # --- Phase 1 & 1b: Research Plan ---
-    log("[Phase 1] Generating research plan...")
-    await async_wait_1_5s()
-    rp = await llm_json_from_message(_research_plan_prompt(inputs.research_query), log)
-    research_plan = rp if isinstance(rp, dict) and rp else {}
-    if not research_plan:
-        log("WARN: Empty research plan – falling back to single-section.")
-        research_plan = {inputs.research_query: {"description": "Answer the user's primary question.", "subsections": [{"title": "Overview", "description": "General overview", "query": inputs.research_query}]}}
+    saved_plan = checkpoint.load("plan") if run_info else None
+    phase_span = trace_start("phase", "plan", restored=bool(saved_plan))
+    if saved_plan:
+        research_plan = saved_plan["research_plan"]
+    else:
+        log("[Phase 1] Generating research plan...")
+        rp = await llm_json_from_message(_research_plan_prompt(inputs.research_query), log)
+        research_plan = rp if isinstance(rp, dict) and rp else {}
+        if not research_plan:
+            log("WARN: Empty research plan – falling back to single-section.")
+            research_plan = {inputs.research_query: {"description": "Answer the user's primary question.", "subsections": [{"title": "Overview", "description": "General overview", "query": inputs.research_query}]}}
+        checkpoint.save("plan", {"research_plan": research_plan})
+    trace_end(phase_span)
     ordered_section_titles = list(research_plan.keys())
     sections_data: Dict[str, Dict[str, Any]] = {}
     all_subquestions: List[str] = []
@@ -625,24 +1612,22 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         sections_data[sec_title] = {"description": desc, "subsections": subsecs, "final_markdown": ""}
 
     # --- Phase 3 & 3.5: Search and Rank ---
-    log("[Phase 3 & 3.5] Searching all queries and ranking results...")
-    uniq_queries: List[str] = list(dict.fromkeys(all_subquestions))
-    raw_search_results = await dispatch_staggered_searches(uniq_queries, log)
-    ranking_prompts = [_ranking_prompt_for_query(qt, raw) if isinstance(raw, list) and raw else "" for qt, raw in zip(uniq_queries, raw_search_results)]
-    ranking_results = await dispatch_staggered_llm_json([p for p in ranking_prompts if p], log)
     top_n = getattr(config, "top_results_per_query", CONFIG.top_results_per_query)
-    ranked_urls_by_query: Dict[str, List[str]] = {}
-    rank_res_iter = iter(ranking_results)
-    for idx, query_text in enumerate(uniq_queries):
-        urls = []
-        raw = raw_search_results[idx] if isinstance(raw_search_results[idx], list) else []
-        if ranking_prompts[idx]:
-            rank_res = next(rank_res_iter, {})
-            if isinstance(rank_res, dict):
-                ranked = sorted(rank_res.get("ranked_results", []), key=lambda x: int(x.get("score", 0)), reverse=True)
-                urls = [_clean_url(r.get("url")) for r in ranked if r.get("url")]
-        urls.extend([_clean_url(r.get("url")) for r in raw if r.get("url") and _clean_url(r.get("url")) not in urls])
-        ranked_urls_by_query[query_text] = urls[:top_n]
+    saved_ranking = checkpoint.load("ranking") if run_info else None
+    phase_span = trace_start("phase", "search_and_rank", restored=bool(saved_ranking))
+    if saved_ranking:
+        ranked_urls_by_query: Dict[str, List[str]] = saved_ranking["ranked_urls_by_query"]
+    else:
+        log("[Phase 3 & 3.5] Searching all queries and ranking results...")
+        uniq_queries: List[str] = list(dict.fromkeys(all_subquestions))
+        raw_search_results = await dispatch_searches(uniq_queries, log)
+        query_contexts: Dict[str, List[str]] = {}
+        for sdata in sections_data.values():
+            for sub in sdata["subsections"]:
+                query_contexts.setdefault(sub["query"], []).append(f"{sub['title']}. {sub['description']}")
+        ranked_urls_by_query = await rank_search_results(uniq_queries, [" ".join(query_contexts.get(q, [])) for q in uniq_queries], raw_search_results, top_n, config, log)
+        checkpoint.save("ranking", {"ranked_urls_by_query": ranked_urls_by_query})
+    trace_end(phase_span)
 
     # --- Phase 4: Consolidate URLs ---
     log("[Phase 4] Deduplicating URLs...")
@@ -653,34 +1638,58 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     log(f"INFO: Collected {len(url_map)} unique URLs.")
 
     # --- Phase 5 & 6: Concurrent Download and Synthesis ---
-    log("[Phase 5 & 6] Starting concurrent download and synthesis engine...")
     processed_urls_cache: Dict[str, str] = {}
     subsection_markdown_results: Dict[Tuple[str, int], str] = {}
-    synthesis_queue = asyncio.Queue()
-    url_download_queue = asyncio.Queue()
-    for url in url_map.keys(): await url_download_queue.put(url)
-    subsection_dependencies: Dict[Tuple[str, int], Set[str]] = {}
-    url_to_subsections_map: Dict[str, List[Tuple[str, int]]] = {}
-    for sec_title, sdata in sections_data.items():
-        for idx, sub in enumerate(sdata["subsections"]):
-            key = (sec_title, idx)
-            required_urls = set(ranked_urls_by_query.get(sub["query"], [])[:top_n])
-            subsection_dependencies[key] = {u for u in required_urls if u}
-            for url in required_urls:
-                if url: url_to_subsections_map.setdefault(url, []).append(key)
-
-    synthesis_workers = [asyncio.create_task(synthesis_worker(i, synthesis_queue, subsection_markdown_results, log)) for i in range(getattr(config, 'max_concurrent_llm_calls', 5))]
-    truncate_config_tuple = (config.truncate_first_chars, config.truncate_last_chars)
-    downloader_workers = [asyncio.create_task(downloader_and_orchestrator_worker(i, url_download_queue, synthesis_queue, processed_urls_cache, url_to_subsections_map, subsection_dependencies, sections_data, inputs.research_query, ranked_urls_by_query, truncate_config_tuple, log)) for i in range(getattr(config, 'max_concurrent_downloads', 10))]
+    excerpt_config = ExcerptConfig(
+        int(config.truncate_first_chars),
+        int(config.truncate_last_chars),
+        int(getattr(config, "source_token_budget", CONFIG.source_token_budget)),
+        (getattr(config, "ranking_embedding_model", CONFIG.ranking_embedding_model) or "").strip(),
+    )
+    saved_synthesis = checkpoint.load("synthesis") if run_info else None
+    phase_span = trace_start("phase", "download_and_synthesis", restored=bool(saved_synthesis))
+    if saved_synthesis:
+        processed_urls_cache.update(restore_processed_urls(saved_synthesis, log))
+        DUPLICATE_INDEX.collapsed.update(saved_synthesis.get("collapsed_duplicate_sources", {}))
+        subsection_markdown_results.update({(sec_title, sub_idx): md for sec_title, sub_idx, md in saved_synthesis["subsection_markdown_results"]})
+    else:
+        log("[Phase 5 & 6] Starting concurrent download and synthesis engine...")
+        synthesis_queue = asyncio.Queue()
+        url_download_queue = asyncio.Queue()
+        for url in url_map.keys(): await url_download_queue.put((url, time.monotonic()))
+        subsection_dependencies: Dict[Tuple[str, int], Set[str]] = {}
+        url_to_subsections_map: Dict[str, List[Tuple[str, int]]] = {}
+        for sec_title, sdata in sections_data.items():
+            for idx, sub in enumerate(sdata["subsections"]):
+                key = (sec_title, idx)
+                required_urls = set(ranked_urls_by_query.get(sub["query"], [])[:top_n])
+                subsection_dependencies[key] = {u for u in required_urls if u}
+                for url in required_urls:
+                    if url: url_to_subsections_map.setdefault(url, []).append(key)
+
+        synthesis_workers = [asyncio.create_task(synthesis_worker(i, synthesis_queue, subsection_markdown_results, log)) for i in range(getattr(config, 'max_concurrent_llm_calls', 5))]
+        quorum = int(getattr(config, "synthesis_quorum", CONFIG.synthesis_quorum))
+        deadline_seconds = float(getattr(config, "subsection_deadline_seconds", CONFIG.subsection_deadline_seconds))
+        scheduler = SubsectionSynthesisScheduler(synthesis_queue, processed_urls_cache, url_to_subsections_map, subsection_dependencies, sections_data, inputs.research_query, ranked_urls_by_query, excerpt_config, quorum, log)
+        deadline_watchers = [asyncio.create_task(subsection_deadline_watcher(scheduler, key, deadline_seconds)) for key in subsection_dependencies] if deadline_seconds > 0 else []
+        downloader_workers = [asyncio.create_task(downloader_and_orchestrator_worker(i, url_download_queue, scheduler, log)) for i in range(getattr(config, 'max_concurrent_downloads', 10))]
     
-    await url_download_queue.join()
-    log("INFO: All URLs processed by downloaders.")
-    await synthesis_queue.join()
-    log("INFO: All synthesis jobs completed.")
-    for worker in synthesis_workers + downloader_workers: worker.cancel()
-    await asyncio.gather(*synthesis_workers, *downloader_workers, return_exceptions=True)
-    log("INFO: Concurrent engine shut down.")
+        await url_download_queue.join()
+        log(f"INFO: All URLs processed by downloaders ({scheduler.cancelled_downloads} downloads cancelled as no longer needed).")
+        scheduler.flush()
+        await synthesis_queue.join()
+        log("INFO: All synthesis jobs completed.")
+        for worker in synthesis_workers + downloader_workers + deadline_watchers: worker.cancel()
+        await asyncio.gather(*synthesis_workers, *downloader_workers, *deadline_watchers, return_exceptions=True)
+        log("INFO: Concurrent engine shut down.")
     
+        checkpoint.save("synthesis", {
+            "processed_urls": list(processed_urls_cache),
+            "subsection_markdown_results": [[sec_title, sub_idx, md] for (sec_title, sub_idx), md in subsection_markdown_results.items()],
+            "collapsed_duplicate_sources": DUPLICATE_INDEX.collapsed,
+        })
+    trace_end(phase_span)
+
     for (sec_title, sub_idx), llm_out in subsection_markdown_results.items():
         sub = sections_data[sec_title]["subsections"][sub_idx]
         sec_num, sub_num = ordered_section_titles.index(sec_title) + 1, sub_idx + 1
@@ -695,122 +1704,79 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         sdata["final_markdown"] = sub_blocks
 
     # --- Phase 7 & 8: Reflection and Append Loop ---
-    max_loops = getattr(config, 'max_reflection_loops', 1)
-    for i in range(max_loops):
-        loop_num = i + 1
-        log(f"[Reflection Loop {loop_num}/{max_loops}] Starting...")
-
-        reflect_prompts = []
-        reflect_sections = []
-        for sec_title, sdata in sections_data.items():
-            prompt = (
-                "You are a critical-thinking expert. Reflect on the section content and propose up to "
-                f"{getattr(config, 'max_additional_queries_per_section', 2)} "
-                "highly specific new web search queries to close meaningful gaps. Do not repeat any queries that would have been used to generate the existing content.\n\n"
-                f"Main research query: {inputs.research_query}\n\n"
-                f"Section Title: {sec_title}\n"
-                f"Section Goal: {sdata['description']}\n\n"
-                "Existing Section Content:\n" + sdata["final_markdown"] + "\n\n"
-                "Rules:\n- Propose queries for genuinely new, relevant information.\n- Avoid overlap.\n"
-                "Output MUST be valid JSON: {\"new_queries\": [\"query1\", \"query2\"]}"
-            )
-            reflect_prompts.append(prompt)
-            reflect_sections.append(sec_title)
-
-        reflect_results = await dispatch_staggered_llm_json(reflect_prompts, log)
-
-        section_additional_queries: Dict[str, List[str]] = {}
-        global_additional_queries: List[str] = []
-        for sec_title, res in zip(reflect_sections, reflect_results):
-            new_qs = []
-            if isinstance(res, dict):
-                raw = res.get("new_queries", [])
-                for q in raw:
-                    qs = q.strip() if isinstance(q, str) else ""
-                    if qs and qs not in all_subquestions and qs not in global_additional_queries:
-                        new_qs.append(qs)
-                        global_additional_queries.append(qs)
-            section_additional_queries[sec_title] = new_qs
-            log(f"INFO: [Reflection Loop {loop_num}] Section '{sec_title}' generated {len(new_qs)} new queries.")
-
-        # Add the newly generated supplemental queries to our structured output dictionary
-        for sec_title, new_queries in section_additional_queries.items():
-            if sec_title in executed_queries_by_section:
-                executed_queries_by_section[sec_title]["supplemental_queries"].extend(new_queries)
-
-        log(f"INFO: [Reflection Loop {loop_num}] Total new supplemental queries: {len(global_additional_queries)}")
-
-        if not global_additional_queries:
-            log(f"[Reflection Loop {loop_num}] No new queries found. Ending reflection cycles.")
-            break
-
-        log(f"[Phase 8, Loop {loop_num}] Processing {len(global_additional_queries)} supplemental queries...")
-        add_search = await dispatch_staggered_searches(global_additional_queries, log)
-
-        add_ranking_prompts = [_ranking_prompt_for_query(q, raw) if isinstance(raw, list) and raw else "" for q, raw in zip(global_additional_queries, add_search)]
-        add_ranking = await dispatch_staggered_llm_json([p for p in add_ranking_prompts if p], log)
-        
-        add_ranked_urls: Dict[str, List[str]] = {}
-        add_rank_iter = iter(add_ranking)
-        for idx, q in enumerate(global_additional_queries):
-            urls = []
-            raw = add_search[idx] if isinstance(add_search[idx], list) else []
-            if add_ranking_prompts[idx]:
-                rank_res = next(add_rank_iter, {})
-                if isinstance(rank_res, dict):
-                    ranked = sorted(rank_res.get("ranked_results", []), key=lambda x: int(x.get("score", 0)), reverse=True)
-                    urls = [_clean_url(r.get("url")) for r in ranked if r.get("url")]
-            urls.extend([_clean_url(r.get("url")) for r in raw if r.get("url") and _clean_url(r.get("url")) not in urls])
-            add_ranked_urls[q] = urls[:top_n]
-
-        new_urls = [u for u in set().union(*add_ranked_urls.values()) if u and u not in processed_urls_cache]
-        if new_urls:
-            log(f"INFO: [Loop {loop_num}] Downloading {len(new_urls)} new URLs for supplemental content...")
-            dl_tasks = [asyncio.create_task(extract_content_from_url(u, log)) for u in new_urls]
-            for f in asyncio.as_completed(dl_tasks):
-                content, _ = await f
-                # The URL isn't directly available from the future result, this logic is flawed in original code.
-                # Assuming processed_urls_cache is updated inside extract_content_from_url, which it is not.
-                # Re-writing this loop to be correct.
-            new_urls_contents = await asyncio.gather(*dl_tasks)
-            for url, (content, _) in zip(new_urls, new_urls_contents):
-                processed_urls_cache[url] = content
-        
-        supplemental_prompts, supplemental_keys = [], []
-        for sec_title, queries in section_additional_queries.items():
-            for q in queries:
-                urls = add_ranked_urls.get(q, [])
-                top_srcs = [{"url": u, "content": processed_urls_cache.get(u, "")} for u in urls if processed_urls_cache.get(u, "")]
-                supplemental_prompts.append(_supplemental_prompt_for_query(inputs.research_query, sec_title, sections_data[sec_title]["description"], sections_data[sec_title]["final_markdown"], q, top_srcs, truncate_config_tuple))
-                supplemental_keys.append((sec_title, q))
-
-        supplemental_blocks_by_section: Dict[str, List[str]] = {s: [] for s in sections_data}
-        if supplemental_prompts:
-            sup_results = await dispatch_staggered_llm_text(supplemental_prompts, log)
-            for (sec_title, _), res in zip(supplemental_keys, sup_results):
-                if isinstance(res, str) and res.strip():
-                    blk = _clean_markdown_citations(sanitize_markdown_block(res))
-                    blk = remove_redundant_section_heading(blk, sec_title)
-                    supplemental_blocks_by_section[sec_title].append(blk)
-
-        rewrite_prompts, rewrite_keys = [], []
-        for sec_title, blocks in supplemental_blocks_by_section.items():
-            if not blocks: continue
-            rewrite_prompts.append(_rewrite_section_prompt(inputs.research_query, sec_title, sections_data[sec_title]["description"], sections_data[sec_title]["final_markdown"], blocks))
-            rewrite_keys.append(sec_title)
-
-        if rewrite_prompts:
-            rewrite_results = await dispatch_staggered_llm_text(rewrite_prompts, log)
-            for sec_title, res in zip(rewrite_keys, rewrite_results):
-                if isinstance(res, str) and res.strip():
-                    new_md = _clean_markdown_citations(sanitize_markdown_block(res))
-                    new_md = remove_redundant_section_heading(new_md, sec_title)
-                    sections_data[sec_title]["final_markdown"] = new_md
-        
-        all_subquestions.extend(global_additional_queries)
+    # Each section runs its own reflect→search→rank→download→synthesize→rewrite pipeline, so a fast
+    # section is rewritten without waiting for the slowest section's downloads.
+    max_loops = int(getattr(config, 'max_reflection_loops', 1))
+    loops_done, reflection_finished = 0, False
+    loop_sections_done: Dict[str, int] = {}
+    saved_reflection = checkpoint.load("reflection") if run_info else None
+    if saved_reflection:
+        loops_done, reflection_finished = saved_reflection["loops_done"], saved_reflection["finished"]
+        loop_sections_done = saved_reflection.get("loop_sections_done", {})
+        all_subquestions = saved_reflection["all_subquestions"]
+        processed_urls_cache.update(restore_processed_urls(saved_reflection, log))
+        DUPLICATE_INDEX.collapsed.update(saved_reflection.get("collapsed_duplicate_sources", {}))
+        for sec_title, md in saved_reflection["section_markdown"].items():
+            sections_data[sec_title]["final_markdown"] = md
+        for sec_title, queries in saved_reflection["supplemental_queries"].items():
+            executed_queries_by_section[sec_title]["supplemental_queries"] = queries
+
+    checkpoint_lock = asyncio.Lock()
+
+    async def save_reflection_checkpoint(loops: int, finished: bool):
+        # The state is snapshotted on the event loop, then written from a thread so the other sections' pipelines
+        # keep running; the lock keeps the writes in order.
+        async with checkpoint_lock:
+            snapshot = {
+                "loops_done": loops,
+                "finished": finished,
+                "loop_sections_done": dict(loop_sections_done),
+                "all_subquestions": list(all_subquestions),
+                "processed_urls": list(processed_urls_cache),
+                "collapsed_duplicate_sources": dict(DUPLICATE_INDEX.collapsed),
+                "section_markdown": {t: sdata["final_markdown"] for t, sdata in sections_data.items()},
+                "supplemental_queries": {t: list(q["supplemental_queries"]) for t, q in executed_queries_by_section.items()},
+            }
+            await asyncio.to_thread(checkpoint.save, "reflection", snapshot)
+
+    if loops_done < max_loops and not reflection_finished:
+        claimed_queries: Set[str] = set(all_subquestions)
+        download_pool = SharedDownloadPool(processed_urls_cache, int(getattr(config, 'max_concurrent_downloads', 10)), log)
+        max_new_queries = getattr(config, 'max_additional_queries_per_section', 2)
+        try:
+            for i in range(loops_done, max_loops):
+                loop_num = i + 1
+                log(f"[Reflection Loop {loop_num}/{max_loops}] Starting...")
+                phase_span = trace_start("phase", f"reflection_loop_{loop_num}")
+
+                async def reflect_section(sec_title: str):
+                    new_qs = await section_reflection_pipeline(sec_title, sections_data[sec_title], inputs.research_query, claimed_queries, download_pool, excerpt_config, top_n, max_new_queries, config, loop_num, log)
+                    executed_queries_by_section[sec_title]["supplemental_queries"].extend(new_qs)
+                    all_subquestions.extend(new_qs)
+                    loop_sections_done[sec_title] = len(new_qs)
+                    await save_reflection_checkpoint(i, False)
+
+                pending_sections = [t for t in ordered_section_titles if t not in loop_sections_done]
+                results = await asyncio.gather(*(reflect_section(t) for t in pending_sections), return_exceptions=True)
+                for sec_title, res in zip(pending_sections, results):
+                    if isinstance(res, Exception):
+                        log(f"ERROR: [Reflection Loop {loop_num}] Section '{sec_title}' failed: {res}")
+
+                total_new_queries = sum(loop_sections_done.values())
+                log(f"INFO: [Reflection Loop {loop_num}] Total new supplemental queries: {total_new_queries}")
+                loop_sections_done = {}
+                trace_end(phase_span, new_queries=total_new_queries)
+                if not total_new_queries:
+                    log(f"[Reflection Loop {loop_num}] No new queries found. Ending reflection cycles.")
+                    await save_reflection_checkpoint(i, True)
+                    break
+                await save_reflection_checkpoint(loop_num, False)
+        finally:
+            await download_pool.close()
 
     # --- Final Assembly ---
     log("[Final Phase] Assembling final report...")
+    phase_span = trace_start("phase", "final")
     for sec_idx, sec_title in enumerate(ordered_section_titles, start=1):
         sdata = sections_data[sec_title]
         cleaned_body = _clean_and_dedupe_section(sec_title, sdata["description"], sec_idx, sdata["final_markdown"])
@@ -826,20 +1792,36 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
 
     body_sections = "\n\n---\n\n".join([sections_data[t]["final_markdown"] for t in ordered_section_titles])
     
-    # First, get the abstract, conclusion, and filename in parallel
-    initial_final_parts = await dispatch_staggered_llm_text([
-        _abstract_prompt(body_sections, inputs.research_query),
-        _conclusion_prompt(body_sections, inputs.research_query),
-        _filename_prompt(inputs.research_query)
-    ], log)
-    
-    # Unpack these three results
-    abstract, conclusion, filename_candidate = (initial_final_parts[i] if len(initial_final_parts) > i and isinstance(initial_final_parts[i], str) else "" for i in range(3))
-    
-    # Now that we have the abstract, make a separate call to generate the title
-    await async_wait_1_5s() # Maintain the delay between calls
-    report_title = await llm_text_from_message(_title_prompt(abstract, inputs.research_query), log)
-    report_title = report_title.strip() or inputs.research_query # Clean and provide a fallback
+    saved_final_parts = checkpoint.load("final_parts") if run_info else None
+    if saved_final_parts:
+        abstract, conclusion, filename_candidate = saved_final_parts["abstract"], saved_final_parts["conclusion"], saved_final_parts.get("filename_candidate")
+    else:
+        # First, get the abstract and conclusion in parallel
+        initial_final_parts = await dispatch_llm_text([
+            _abstract_prompt(body_sections, inputs.research_query),
+            _conclusion_prompt(body_sections, inputs.research_query)
+        ], log)
+        abstract, conclusion = (initial_final_parts[i] if len(initial_final_parts) > i and isinstance(initial_final_parts[i], str) else "" for i in range(2))
+        filename_candidate = None
+        checkpoint.save("final_parts", {"abstract": abstract, "conclusion": conclusion, "filename_candidate": filename_candidate})
+
+    saved_title = checkpoint.load("title") if run_info else None
+    report_title = saved_title["report_title"] if saved_title else None
+
+    # Now that we have the abstract, the filename and title are small enough to share a single batched call
+    pending_parts: Dict[str, str] = {}
+    if filename_candidate is None:
+        pending_parts["filename"] = _filename_prompt(inputs.research_query)
+    if report_title is None:
+        pending_parts["title"] = _title_prompt(abstract, inputs.research_query)
+    if pending_parts:
+        answers = dict(zip(pending_parts, await dispatch_llm_batched(list(pending_parts.values()), False, int(getattr(config, "llm_batch_size", CONFIG.llm_batch_size)), log)))
+        if "filename" in pending_parts:
+            filename_candidate = answers["filename"] if isinstance(answers["filename"], str) else ""
+            checkpoint.save("final_parts", {"abstract": abstract, "conclusion": conclusion, "filename_candidate": filename_candidate})
+        if "title" in pending_parts:
+            report_title = (answers["title"] if isinstance(answers["title"], str) else "").strip() or inputs.research_query # Clean and provide a fallback
+            checkpoint.save("title", {"report_title": report_title})
     
     filename_candidate = sanitize_filename_candidate(filename_candidate.splitlines()[0].strip() if filename_candidate else "", 40) or sanitize_filename_candidate(inputs.research_query, 40)
     markdown_filename = f"{filename_candidate}.md"
@@ -850,7 +1832,11 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     # Update the final report string to use the new title format
     final_report = f"# Deep Research Report: {report_title}\n\n*Generated on: {CURRENT_DATE}*\n\n{toc}\n\n---\n\n## Abstract\n\n{abstract}\n\n---\n\n{body_sections}\n\n---\n\n## Conclusion\n\n{conclusion}\n\n---\n\n{references_section}\n"
 
-    home_path = await get_home_path()
+    trace_end(phase_span)
+
+    if PAGE_CACHE is not None:
+        log(PAGE_CACHE.stats_message())
+
     file_path = os.path.join(home_path, markdown_filename)
     try:
         with open(file_path, "w", encoding="utf-8") as f: f.write(final_report)
@@ -862,6 +1848,13 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
 
     final_log = log_messages if config.include_execution_log else None
     out.final_report, out.all_executed_queries, out.referenced_urls, out.execution_log, out.md_file_path, out.md_export_message = final_report, executed_queries_by_section, references, final_log, file_path if "successfully" in md_export_message else "", md_export_message
+    out.run_id = run_id
+    out.collapsed_duplicate_sources = dict(DUPLICATE_INDEX.collapsed)
+    log(f"INFO: [dedupe] {len(out.collapsed_duplicate_sources)} near-duplicate sources collapsed in total.")
+    out.trace = TRACER.to_dict()
+    if str(getattr(config, "write_trace_file", CONFIG.write_trace_file)).strip().lower() in ("true", "1", "yes"):
+        checkpoint.save("trace", out.trace)
+    TRACER = None
     
     log("END: Pipeline finished.")
     return out
\ No newline at end of file
@@ -4,11 +4,17 @@
 #   "tiktoken",
 # ]
 # ///
-from typing import Any, Optional, List, Tuple
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, NamedTuple, Optional, List, Pattern, Set, Tuple, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import os
 import re
+import json
+import mmap
+import hashlib
+import math
+import functools
 import subprocess
-import tempfile
 import shutil
 from urllib.parse import urlparse
 from dataclasses import dataclass
@@ -17,6 +23,7 @@ import tiktoken
 
 class CONFIG:
     export_format: Optional[str] = "md"  # 'md' or 'txt'
+    max_cached_repositories: Optional[int] = 10  # Cached clones kept under <home>/repo_cache, least recently used evicted first
 
 class INPUTS:
     directory_path: str # Can be a local path or a GitHub URL
@@ -25,6 +32,16 @@ class INPUTS:
     ignore_dirs: Optional[List[str]] = None
     ignore_extensions: Optional[List[str]] = None
     code_extensions: Optional[List[str]] = None
+    # Set to false to only write the output file and leave the (possibly very large) content out of the result.
+    return_content: Optional[bool] = True
+    # Reuse unchanged file blocks from the previous output (tracked in a manifest next to it) instead of re-reading every file.
+    incremental: Optional[bool] = True
+    # Skip files and directories matched by .gitignore / .ignore files (and .git/info/exclude).
+    respect_gitignore: Optional[bool] = True
+    # Token budget for the whole output: files are ranked (README, entry points, configs, recent, small) and included
+    # in full while they fit, then as outlines (signatures / headings), then omitted. The summary and directory
+    # structure are always written and count towards it. No limit when unset.
+    max_tokens: Optional[int] = None
 
 @dataclass
 class OUTPUT:
@@ -32,6 +49,13 @@ class OUTPUT:
     output_path: str
     token_count: Any
     file_size_display: str
+    file_token_counts: Optional[List[Dict[str, Any]]] = None # [{path, tokens}] ({path, tokens, included} with max_tokens), largest first
+    reused_files: Optional[int] = None # File blocks copied from the previous output without re-reading the file
+    budget_exceeded: Optional[bool] = None # With max_tokens: whether the output is still larger than the budget
+
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Cached clones of remote repositories, under the home path, so re-ingesting only fetches what changed.
+REPO_CACHE_DIR = "repo_cache"
 
 def default_ignored_directories() -> List[str]:
     return [".git", "node_modules", "__pycache__", ".venv", "venv", ".idea", ".vscode", ".Rproj.user"]
@@ -57,33 +81,496 @@ def default_code_like_extensions() -> List[str]:
         ".env", ".sql", ".graphql", ".gql", ".rst", ".md", ".R",
     ]
 
-def parse_content_to_file_list(content: str) -> List[Tuple[str, str]]:
-    file_blocks = re.split(r"={8,}\nFile: (.+?)\n={8,}\n", content)
-    files = []
-    if len(file_blocks) < 2: return []
-    for i in range(1, len(file_blocks), 2):
-        fname = file_blocks[i].strip()
-        fcontent = file_blocks[i+1] if (i+1) < len(file_blocks) else ""
-        files.append((fname, fcontent.strip()))
-    return files
-
-def format_as_markdown(summary: str, tree: str, file_list: List[Tuple[str, str]]) -> str:
-    doc = f"# Analysed directory\n\n{summary}\n\n# Directory structure\n\n```\n{tree.strip()}\n```\n"
-    for fname, fcontent in file_list:
-        lang = fname.split('.')[-1].lower() if '.' in fname else 'text'
-        lang_map = {'js': 'javascript', 'py': 'python', 'sh': 'bash', 'md': 'markdown', 'r': 'r'}
-        lang = lang_map.get(lang, lang)
-        
-        separator = "=" * 60
-        doc += f"\n\n{separator}\n## File: `{fname}`\n{separator}\n\n```{lang}\n{fcontent}\n```\n"
-    return doc
+IGNORE_FILES = (".gitignore", ".ignore")
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translates one gitignore glob (without its leading "!" / "/" and trailing "/") to a regex over "/"-separated paths."""
+    out: List[str] = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**/", i):
+                out.append("(?:.*/)?"); i += 3; continue
+            if pattern.startswith("**", i):
+                out.append(".*"); i += 2; continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^": j += 1
+            if j < n and pattern[j] == "]": j += 1
+            j = pattern.find("]", j)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j].replace("\\", "\\\\").replace("[", "\\[")
+                if body[:1] in ("!", "^"): body = "^" + body[1:]
+                out.append(f"(?!/)[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1])); i += 2; continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+class IgnoreRules:
+    """The compiled patterns of one .gitignore / .ignore file; paths are matched relative to the directory holding it."""
+
+    def __init__(self, base: str, lines: Iterable[str]):
+        self.base = base # "/"-separated, relative to the ingested root; "" for the root itself
+        self.rules: List[Tuple[Pattern[str], bool, bool]] = [] # (regex, negated, directories only)
+        sources: List[str] = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip("\r")
+            if not line.endswith("\\ "): line = line.rstrip(" ")
+            if not line or line.startswith("#"): continue
+            negated = line.startswith("!")
+            if negated: line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line: continue
+            # A pattern with a "/" (other than a trailing one) is anchored to the file's directory; otherwise it matches at any depth.
+            anchored = "/" in line
+            source = _glob_to_regex(line.lstrip("/"))
+            if not anchored: source = "(?:.*/)?" + source
+            sources.append(source)
+            self.rules.append((re.compile(source), negated, dir_only))
+        # One combined regex to reject paths no rule can match, which is the common case.
+        self._any = re.compile("|".join(f"(?:{src})" for src in sources)) if sources else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """True if the path is ignored, False if a negated pattern re-includes it, None if no pattern applies."""
+        if self._any is None: return None
+        if self.base: rel_path = rel_path[len(self.base) + 1:]
+        if not self._any.fullmatch(rel_path): return None
+        for regex, negated, dir_only in reversed(self.rules):
+            if (is_dir or not dir_only) and regex.fullmatch(rel_path):
+                return not negated
+        return None
+
+def load_ignore_rules(dir_path: str, base: str) -> List[IgnoreRules]:
+    rules = []
+    for name in IGNORE_FILES:
+        try:
+            with open(os.path.join(dir_path, name), "r", encoding="utf-8", errors="replace") as f:
+                rules.append(IgnoreRules(base, f))
+        except OSError:
+            continue
+    return rules
+
+def is_ignored(ignore_stack: List[IgnoreRules], rel_path: str, is_dir: bool) -> bool:
+    # Deeper ignore files take precedence over the ones above them, like git.
+    for rules in reversed(ignore_stack):
+        result = rules.match(rel_path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+class FileEntry(NamedTuple):
+    path: str
+    relative_path: str # "/"-separated
+    stat: Optional[os.stat_result] # From the DirEntry's cache; None if it could not be read
+
+def scan_directory(processing_path: str, ignored_directories: Set[str], ignored_files_extensions: Set[str],
+                   code_like_extensions: Set[str], respect_gitignore: bool = True) -> Tuple[List[str], List[FileEntry]]:
+    """Walks the directory once with os.scandir and returns both the tree lines and the files to ingest.
+
+    Entries are visited in sorted order; a directory's own files come before its sub-directories' files. Ignored
+    directories (by name, extension or ignore file) are never entered. Symlinked directories are listed but not followed.
+    """
+    tree_lines: List[str] = []
+    file_entries: List[FileEntry] = []
+    ignore_stack: List[IgnoreRules] = []
+    if respect_gitignore:
+        try:
+            with open(os.path.join(processing_path, ".git", "info", "exclude"), "r", encoding="utf-8", errors="replace") as f:
+                ignore_stack.append(IgnoreRules("", f))
+        except OSError:
+            pass
+
+    def visit(dir_path: str, rel_dir: str, indent: str):
+        pushed = load_ignore_rules(dir_path, rel_dir) if respect_gitignore else []
+        ignore_stack.extend(pushed)
+        try:
+            with os.scandir(dir_path) as it:
+                entries = []
+                for entry in it:
+                    if entry.name in ignored_directories: continue
+                    if any(entry.name.endswith(ext) for ext in ignored_files_extensions): continue
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    if ignore_stack and is_ignored(ignore_stack, rel_path, is_dir): continue
+                    entries.append((entry.name, entry, is_dir, rel_path))
+        except OSError:
+            del ignore_stack[len(ignore_stack) - len(pushed):]
+            return
+        entries.sort(key=lambda item: item[0])
+
+        for name, entry, is_dir, rel_path in entries:
+            if is_dir or not any(name.endswith(ext) for ext in code_like_extensions): continue
+            try:
+                st = entry.stat()
+            except OSError:
+                st = None
+            file_entries.append(FileEntry(entry.path, rel_path, st))
+
+        for i, (name, entry, is_dir, rel_path) in enumerate(entries):
+            is_last_item = (i == len(entries) - 1)
+            connector = "└── " if is_last_item else "├── "
+            if is_dir:
+                tree_lines.append(indent + connector + name + "/\n")
+                if not entry.is_symlink():
+                    visit(entry.path, rel_path, indent + ("    " if is_last_item else "│   "))
+            else:
+                tree_lines.append(indent + connector + name + "\n")
+        del ignore_stack[len(ignore_stack) - len(pushed):]
+
+    visit(processing_path, "", "")
+    return tree_lines, file_entries
+
+def decode_file_content(data: bytes) -> str:
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class RenderedFile(NamedTuple):
+    path: str
+    data: bytes # The formatted block, UTF-8 encoded
+    tokens: Optional[int]
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    hash: Optional[str] = None
+    reused: bool = False
+    # In token budget mode: the file's outline block (None if the file has none worth keeping) and what was written.
+    outline: Optional[bytes] = None
+    outline_tokens: Optional[int] = None
+    mode: str = "full" # "full" or "outline"
+
+# The manifest is stored next to the output (".<output name>.manifest.json"). It records, for every file block of the
+# previous output: path, size, mtime_ns, hash (of the raw file, None when the content was skipped), tokens, and the
+# block's byte offset / length in the output, so unchanged blocks can be copied over instead of re-read. Files written
+# as outlines (token budget mode) are left out, so they are read again next time.
+MANIFEST_VERSION = 1
+
+def manifest_path(output_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(output_path))
+    return os.path.join(directory, f".{name}.manifest.json")
+
+class PreviousOutput:
+    """The previous output file (memory-mapped) and its manifest entries by path."""
+
+    def __init__(self, output_path: str, files: Dict[str, Dict[str, Any]]):
+        self.files = files
+        self._file = open(output_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(self._file.fileno()).st_size else None
+
+    def block(self, entry: Dict[str, Any]) -> bytes:
+        if self._mmap is None:
+            return b""
+        return self._mmap[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+def load_previous_output(output_path: str, settings: Dict[str, Any]) -> Optional[PreviousOutput]:
+    """Returns the previous output if its manifest was built with the same settings and the output is untouched since."""
+    try:
+        with open(manifest_path(output_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        st = os.stat(output_path)
+        if (manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != settings
+                or manifest.get("output_size") != st.st_size or manifest.get("output_mtime_ns") != st.st_mtime_ns):
+            return None
+        return PreviousOutput(output_path, {entry["path"]: entry for entry in manifest["files"]})
+    except Exception:
+        return None
+
+def write_manifest(output_path: str, settings: Dict[str, Any], rendered_files: List[RenderedFile], offsets: List[int]):
+    st = os.stat(output_path)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "settings": settings,
+        "output_size": st.st_size,
+        "output_mtime_ns": st.st_mtime_ns,
+        "files": [
+            {"path": r.path, "size": r.size, "mtime_ns": r.mtime_ns, "hash": r.hash, "tokens": r.tokens,
+             "offset": offset, "length": len(r.data)}
+            for r, offset in zip(rendered_files, offsets) if r.mode == "full"
+        ],
+    }
+    path = manifest_path(output_path)
+    try:
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+    except Exception:
+        pass
+
+def count_tokens(encoding: Optional[Any], text: str) -> Optional[int]:
+    if encoding is None:
+        return None
+    try:
+        return len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return None
+
+# Lines kept when a file only gets an outline (signatures, headings, top-level keys), by extension.
+OUTLINE_PATTERNS = {
+    ".py": r"^\s*(?:async\s+def|def|class)\s+\w+",
+    ".js": r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\b|class\s|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>)",
+    ".ts": r"^\s*(?:export\s+)?(?:default\s+)?(?:declare\s+)?(?:abstract\s+)?(?:async\s+)?(?:function\b|class\s|interface\s|type\s+\w+\s*=|enum\s|(?:const|let|var)\s+\w+\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)\s*=>)",
+    ".go": r"^(?:func|type)\s",
+    ".rs": r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:fn|struct|enum|trait|impl|mod)\b",
+    ".java": r"^\s*(?:(?:public|protected|private|static|abstract|final|synchronized)\s+)+[\w<>\[\], ]+\s*\(|^\s*(?:public\s+|abstract\s+|final\s+)*(?:class|interface|enum|record)\s",
+    ".c": r"^[A-Za-z_][\w \t\*]*\([^;]*$|^(?:struct|enum|union|typedef)\b|^#define\s",
+    ".sh": r"^\s*(?:function\s+)?\w+\s*\(\)",
+    ".md": r"^#{1,6}\s",
+    ".rst": r"^[=\-~^\"'`#*+]{3,}\s*$",
+    ".yml": r"^[A-Za-z_][\w.-]*\s*:",
+    ".toml": r"^\s*\[",
+    ".ini": r"^\s*\[",
+    ".sql": r"^\s*(?:create|alter)\s",
+    ".graphql": r"^\s*(?:type|input|interface|enum|union|schema|query|mutation|subscription|fragment)\b",
+}
+for _alias, _ext in ((".jsx", ".js"), (".tsx", ".ts"), (".mjs", ".js"), (".h", ".c"), (".cpp", ".c"), (".hpp", ".c"),
+                     (".bash", ".sh"), (".yaml", ".yml"), (".cfg", ".ini"), (".conf", ".ini"), (".gql", ".graphql")):
+    OUTLINE_PATTERNS[_alias] = OUTLINE_PATTERNS[_ext]
+OUTLINE_PATTERNS = {ext: re.compile(pattern, re.IGNORECASE if ext == ".sql" else 0) for ext, pattern in OUTLINE_PATTERNS.items()}
+OUTLINE_HEAD_LINES = 10 # For files without a known outline pattern (or without any match): their first lines
+
+def extract_outline(fname: str, content: str) -> Optional[str]:
+    """Returns the outline of a file (marked as such), or None if it would not be shorter than the file itself."""
+    lines = content.strip().split("\n")
+    pattern = OUTLINE_PATTERNS.get(os.path.splitext(fname)[1].lower())
+    kept = [line.rstrip() for line in lines if pattern.match(line)] if pattern else []
+    if not kept:
+        kept = lines[:OUTLINE_HEAD_LINES]
+    if len(kept) >= len(lines):
+        return None
+    return f"### Outline only (token budget): {len(kept)} of {len(lines)} lines ###\n" + "\n".join(kept)
+
+def render_outline(relative_filepath: str, content: str, format_block: Callable[[str, str], str],
+                   encoding: Optional[Any]) -> Tuple[Optional[bytes], Optional[int]]:
+    outline = extract_outline(relative_filepath, content)
+    if outline is None:
+        return None, None
+    block = format_block(relative_filepath, outline)
+    return block.encode("utf-8"), count_tokens(encoding, block)
+
+def render_file(file: FileEntry, format_block: Callable[[str, str], str], encoding: Optional[Any],
+                max_file_size_bytes: int, max_file_size_kb: int, previous: Optional[PreviousOutput] = None,
+                with_outline: bool = False) -> RenderedFile:
+    """Reads, formats and tokenizes one file, or reuses its block from the previous output; runs in the worker pool."""
+    filepath, relative_filepath = file.path, file.relative_path
+    entry = previous.files.get(relative_filepath) if previous else None
+
+    def rendered(content: str, size=None, mtime_ns=None, digest=None) -> RenderedFile:
+        block = format_block(relative_filepath, content)
+        outline, outline_tokens = None, None
+        if with_outline and digest is not None:
+            outline, outline_tokens = render_outline(relative_filepath, content, format_block, encoding)
+        return RenderedFile(relative_filepath, block.encode("utf-8"), count_tokens(encoding, block), size, mtime_ns, digest,
+                            outline=outline, outline_tokens=outline_tokens)
+
+    def reused(size, mtime_ns, digest, data: Optional[bytes] = None) -> RenderedFile:
+        outline, outline_tokens = None, None
+        if with_outline and digest is not None:
+            try:
+                if data is None:
+                    with open(filepath, "rb") as f: data = f.read()
+                outline, outline_tokens = render_outline(relative_filepath, decode_file_content(data), format_block, encoding)
+            except Exception:
+                pass
+        return RenderedFile(relative_filepath, previous.block(entry), entry["tokens"], size, mtime_ns, digest, True,
+                            outline=outline, outline_tokens=outline_tokens)
+
+    try:
+        st = file.stat if file.stat is not None else os.stat(filepath)
+    except Exception as e:
+        return rendered(f"### ERROR: Could not process file - {e} ###")
+    if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+        return reused(st.st_size, st.st_mtime_ns, entry["hash"])
+    if st.st_size > max_file_size_bytes:
+        return rendered(f"### File size exceeds {max_file_size_kb}KB, skipping content. ###", st.st_size, st.st_mtime_ns)
+    try:
+        with open(filepath, "rb") as f: data = f.read()
+    except Exception as e:
+        return rendered(f"### ERROR: Could not read file content - {e} ###")
+    digest = content_hash(data)
+    # Touched but unchanged (e.g. by a checkout): keep the old block, just refresh the stat in the manifest.
+    if entry and entry["hash"] == digest:
+        return reused(st.st_size, st.st_mtime_ns, digest, data)
+    return rendered(decode_file_content(data), st.st_size, st.st_mtime_ns, digest)
+
+def iter_rendered_files(file_entries: Iterable[FileEntry], render: Callable[[FileEntry], RenderedFile],
+                        max_workers: int = DEFAULT_MAX_WORKERS) -> Iterator[RenderedFile]:
+    """Renders files on a thread pool and yields them in input order.
 
-def format_as_txt(summary: str, tree: str, file_list: List[Tuple[str, str]]) -> str:
-    doc = f"=== ANALYSED DIRECTORY ===\n{summary}\n\n=== DIRECTORY STRUCTURE ===\n{tree.strip()}\n\n=== CONTENT ===\n"
-    for fname, fcontent in file_list:
-        separator = "#" * 80
-        doc += f"\n\n{separator}\n# File: {fname}\n{separator}\n\n{fcontent}\n"
-    return doc
+    Only a bounded window of files is in flight, so memory stays proportional to max_workers rather than to the repository.
+    Threads are enough here: file reads release the GIL and so does tiktoken's encoder.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending: Deque[Future] = deque()
+        for file in file_entries:
+            pending.append(executor.submit(render, file))
+            if len(pending) >= max_workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# Token budget mode: files are ranked by these heuristics, then included in full while they fit, as outlines after that.
+BYTES_PER_TOKEN = 4 # Estimate used when tiktoken is not available
+BUDGET_SUMMARY_RESERVE = 64 # Tokens kept for the budget note added to the summary
+OUTLINE_BUDGET_SHARE = 0.25 # At most this share of the budget is held back for outlines when not everything fits
+README_NAMES = {"readme", "readme.md", "readme.rst", "readme.txt"}
+ENTRY_POINT_NAMES = {
+    "main.py", "__main__.py", "__init__.py", "app.py", "cli.py", "manage.py", "server.py", "wsgi.py", "asgi.py",
+    "index.js", "index.ts", "index.jsx", "index.tsx", "main.js", "main.ts", "app.js", "app.ts", "app.tsx", "server.js",
+    "server.ts", "main.go", "main.rs", "lib.rs", "main.c", "main.cpp", "main.java", "main.sh",
+}
+CONFIG_NAMES = {
+    "pyproject.toml", "setup.py", "setup.cfg", "requirements.txt", "package.json", "tsconfig.json", "cargo.toml",
+    "go.mod", "pom.xml", "build.gradle", "docker-compose.yml", "docker-compose.yaml", "makefile", "cmakelists.txt",
+    ".env.example", "metadata.json",
+}
+LOW_PRIORITY_DIRS = {"test", "tests", "spec", "specs", "__tests__", "fixtures", "examples", "example", "docs", "vendor", "third_party"}
+
+def estimate_tokens(encoding: Optional[Any], text: str) -> int:
+    tokens = count_tokens(encoding, text)
+    return tokens if tokens is not None else len(text.encode("utf-8")) // BYTES_PER_TOKEN
+
+def file_priority(file: FileEntry, newest_mtime_ns: int, oldest_mtime_ns: int) -> float:
+    """Higher is more important: READMEs, entry points and configs first, then recent, small and shallow files."""
+    parts = file.relative_path.split("/")
+    name, depth = parts[-1].lower(), len(parts) - 1
+    score = 0.0
+    if name in README_NAMES or name.startswith("readme."):
+        score += 100 + (20 if depth == 0 else 0)
+    elif name in ENTRY_POINT_NAMES:
+        score += 50
+    elif name in CONFIG_NAMES:
+        score += 40
+    if any(part.lower() in LOW_PRIORITY_DIRS for part in parts[:-1]):
+        score -= 15
+    score -= 3 * depth
+    if file.stat is not None:
+        if newest_mtime_ns > oldest_mtime_ns:
+            score += 20 * (file.stat.st_mtime_ns - oldest_mtime_ns) / (newest_mtime_ns - oldest_mtime_ns)
+        score -= 5 * math.log2(1 + file.stat.st_size / 1024)
+    return score
+
+def rank_files(file_entries: List[FileEntry]) -> List[FileEntry]:
+    mtimes = [file.stat.st_mtime_ns for file in file_entries if file.stat is not None]
+    newest, oldest = (max(mtimes), min(mtimes)) if mtimes else (0, 0)
+    return sorted(file_entries, key=lambda file: (-file_priority(file, newest, oldest), file.relative_path))
+
+def block_tokens(data: Optional[bytes], tokens: Optional[int]) -> Optional[int]:
+    if data is None:
+        return None
+    return tokens if tokens is not None else len(data) // BYTES_PER_TOKEN
+
+def parse_max_tokens(value: Any) -> Optional[int]:
+    """The max_tokens input as a positive integer, or None when unset. Raises ValueError for anything else."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, str) and re.fullmatch(r"[0-9]+", value.strip()):
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"max_tokens must be a positive whole number of tokens, got {value!r}.")
+    return value
+
+def plan_budget(ranked_costs: List[Tuple[str, int, Optional[int]]], budget: int) -> Dict[str, str]:
+    """Decides, from (path, full tokens, outline tokens) in priority order, how each file goes in: "full", "outline" or "omitted".
+
+    Files are taken in full while they fit, keeping a share of the budget for the outlines of the others, which are then
+    added in the same order while they fit.
+    """
+    if sum(full for _, full, _ in ranked_costs) <= budget:
+        return {path: "full" for path, _, _ in ranked_costs}
+    reserve = min(sum(outline or 0 for _, _, outline in ranked_costs), int(budget * OUTLINE_BUDGET_SHARE))
+    remaining = budget - reserve
+    modes: Dict[str, str] = {}
+    for path, full, _ in ranked_costs:
+        if full <= remaining:
+            modes[path] = "full"
+            remaining -= full
+    remaining += reserve
+    for path, _, outline in ranked_costs:
+        if path in modes:
+            continue
+        if outline is not None and outline <= remaining:
+            modes[path] = "outline"
+            remaining -= outline
+        else:
+            modes[path] = "omitted"
+    return modes
+
+def format_markdown_file_block(fname: str, fcontent: str) -> str:
+    lang = fname.split('.')[-1].lower() if '.' in fname else 'text'
+    lang_map = {'js': 'javascript', 'py': 'python', 'sh': 'bash', 'md': 'markdown', 'r': 'r'}
+    lang = lang_map.get(lang, lang)
+
+    separator = "=" * 60
+    return f"\n\n{separator}\n## File: `{fname}`\n{separator}\n\n```{lang}\n{fcontent.strip()}\n```\n"
+
+def format_txt_file_block(fname: str, fcontent: str) -> str:
+    separator = "#" * 80
+    return f"\n\n{separator}\n# File: {fname}\n{separator}\n\n{fcontent.strip()}\n"
+
+# Chunks are either header / tree text, tokenized when written, or rendered file blocks.
+def iter_markdown_chunks(summary: str, tree_lines: Iterable[str], rendered_files: Iterable[RenderedFile]) -> Iterator[Union[str, RenderedFile]]:
+    yield f"# Analysed directory\n\n{summary}\n\n# Directory structure\n\n```\n"
+    yield from tree_lines
+    yield "```\n"
+    yield from rendered_files
+
+def iter_txt_chunks(summary: str, tree_lines: Iterable[str], rendered_files: Iterable[RenderedFile]) -> Iterator[Union[str, RenderedFile]]:
+    yield f"=== ANALYSED DIRECTORY ===\n{summary}\n\n=== DIRECTORY STRUCTURE ===\n"
+    yield from tree_lines
+    yield "\n=== CONTENT ===\n"
+    yield from rendered_files
+
+def get_token_encoding() -> Optional[Any]:
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def write_chunks(f, chunks: Iterable[Union[str, RenderedFile]], encoding: Optional[Any]) -> Tuple[Any, List[RenderedFile], List[int]]:
+    """Streams the chunks to the binary file f and sums their tokens on the way.
+
+    Returns the token count, the rendered files in output order and the byte offset of each of their blocks.
+    """
+    token_count: Any = 0
+    rendered_files: List[RenderedFile] = []
+    offsets: List[int] = []
+    offset = 0
+    for chunk in chunks:
+        if isinstance(chunk, RenderedFile):
+            data, tokens = chunk.data, chunk.tokens
+            rendered_files.append(chunk)
+            offsets.append(offset)
+        else:
+            data, tokens = chunk.encode("utf-8"), count_tokens(encoding, chunk)
+        f.write(data)
+        offset += len(data)
+        token_count = token_count + tokens if token_count is not None and tokens is not None else None
+    return (token_count if token_count is not None else "N/A (tiktoken error)"), rendered_files, offsets
 
 async def _process_directory(config: CONFIG, inputs: INPUTS, processing_path: str, root_name: str) -> OUTPUT:
     """The unified processing function that works on a local directory."""
@@ -96,76 +583,105 @@ async def _process_directory(config: CONFIG, inputs: INPUTS, processing_path: st
 
     max_file_size_bytes = max_file_size_kb * 1024
 
-    def build_tree_structure(dir_path, indent=""):
-        tree = ""
-        try:
-            items = sorted([item for item in os.listdir(dir_path) if item not in ignored_directories])
-        except OSError:
-            return ""
-
-        for i, item in enumerate(items):
-            if any(item.endswith(ext) for ext in ignored_files_extensions): continue
-            is_last_item = (i == len(items) - 1)
-            connector = "└── " if is_last_item else "├── "
-            tree += indent + connector + item
-            item_path = os.path.join(dir_path, item)
-            if os.path.isdir(item_path):
-                tree += "/\n"
-                new_indent = indent + ("    " if is_last_item else "│   ")
-                tree += build_tree_structure(item_path, new_indent)
-            else:
-                tree += "\n"
-        return tree
-
-    summary = f"Ingested content from: {inputs.directory_path}"
-    tree_str = f"{root_name}/\n" + build_tree_structure(processing_path)
-
-    content_str = ""
-    for root, dirs, files in os.walk(processing_path, topdown=True):
-        dirs[:] = [d for d in dirs if d not in ignored_directories]
-        files.sort()
-        for file in files:
-            if any(file.endswith(ext) for ext in ignored_files_extensions): continue
-            if not any(file.endswith(ext) for ext in code_like_extensions): continue
-
-            filepath = os.path.join(root, file)
-            relative_filepath = os.path.relpath(filepath, processing_path)
-            content = ""
-            try:
-                if os.path.getsize(filepath) > max_file_size_bytes:
-                    content = f"### File size exceeds {max_file_size_kb}KB, skipping content. ###"
-                else:
-                    with open(filepath, "r", encoding="utf-8") as f: content = f.read()
-            except (UnicodeDecodeError, IOError):
-                try:
-                    with open(filepath, "r", encoding="latin-1") as f: content = f.read()
-                except Exception as e: content = f"### ERROR: Could not read file content - {e} ###"
-            except Exception as e: content = f"### ERROR: Could not process file - {e} ###"
-
-            content_str += f"================================================\nFile: {relative_filepath.replace(os.sep, '/')}\n================================================\n{content}\n\n"
-
-    file_list = parse_content_to_file_list(content_str)
     fmt = (config.export_format or "md").lower()
-    
-    if fmt == "txt":
-        exported_document = format_as_txt(summary, tree_str, file_list)
-    else:
+    if fmt != "txt":
         fmt = "md"
-        exported_document = format_as_markdown(summary, tree_str, file_list)
+    encoding = get_token_encoding()
 
     base_name, _ = os.path.splitext(output_basename_input)
     correct_filename = f"{base_name}.{fmt}"
     
     home_path = await get_home_path()
     file_path = os.path.join(home_path, correct_filename)
-    
-    with open(file_path, "w", encoding="utf-8") as f: f.write(exported_document)
-    
-    token_count = "N/A"
+
+    # Anything that changes how a block is rendered invalidates the previous output.
+    settings = {
+        "source": inputs.directory_path.strip(),
+        "format": fmt,
+        "max_file_size_kb": max_file_size_kb,
+        "ignore_dirs": sorted(ignored_directories),
+        "ignore_extensions": sorted(ignored_files_extensions),
+        "code_extensions": sorted(code_like_extensions),
+        "tokenizer": "cl100k_base" if encoding is not None else None,
+    }
+    incremental = inputs.incremental is None or inputs.incremental
+    previous = load_previous_output(file_path, settings) if incremental else None
+
+    summary = f"Ingested content from: {inputs.directory_path}"
+    respect_gitignore = inputs.respect_gitignore is None or inputs.respect_gitignore
+    max_tokens = parse_max_tokens(inputs.max_tokens)
+    tree_lines, file_entries = scan_directory(
+        processing_path, ignored_directories, ignored_files_extensions, code_like_extensions, respect_gitignore,
+    )
+    tree_lines.insert(0, f"{root_name}/\n")
+    render = functools.partial(
+        render_file,
+        format_block=format_txt_file_block if fmt == "txt" else format_markdown_file_block,
+        encoding=encoding,
+        max_file_size_bytes=max_file_size_bytes,
+        max_file_size_kb=max_file_size_kb,
+        previous=previous,
+        with_outline=max_tokens is not None,
+    )
+    iter_chunks = iter_txt_chunks if fmt == "txt" else iter_markdown_chunks
+
+    budget_report = None
+    if max_tokens is None:
+        rendered_files = iter_rendered_files(file_entries, render)
+    else:
+        # A first pass only measures every file (full block and outline), a second one renders what the plan keeps.
+        # Blocks are not held in between, so memory stays bounded; the second read is mostly served from the OS cache.
+        render_outlined = functools.partial(render, with_outline=True)
+        costs: Dict[str, Tuple[int, Optional[int]]] = {}
+        for rendered in iter_rendered_files(file_entries, render_outlined):
+            costs[rendered.path] = (block_tokens(rendered.data, rendered.tokens), block_tokens(rendered.outline, rendered.outline_tokens))
+        header_tokens = sum(estimate_tokens(encoding, chunk) for chunk in iter_chunks(summary, tree_lines, []))
+        modes = plan_budget(
+            [(file.relative_path, *costs[file.relative_path]) for file in rank_files(file_entries)],
+            max_tokens - header_tokens - BUDGET_SUMMARY_RESERVE,
+        )
+        budget_report = [{"path": path, "tokens": full, "included": modes[path]} for path, (full, _) in costs.items()]
+
+        def render_planned(file: FileEntry) -> RenderedFile:
+            if modes[file.relative_path] == "full":
+                return render(file)
+            rendered = render_outlined(file)
+            return rendered._replace(data=rendered.outline or b"", tokens=rendered.outline_tokens, outline=None, mode="outline")
+
+        kept_entries = [file for file in file_entries if modes[file.relative_path] != "omitted"]
+        rendered_files = iter_rendered_files(kept_entries, render_planned)
+        counts = {mode: sum(1 for entry in budget_report if entry["included"] == mode) for mode in ("full", "outline", "omitted")}
+        summary += (
+            f"\nToken budget: {max_tokens} tokens. {counts['full']} files included in full, {counts['outline']} as outlines"
+            f" and {counts['omitted']} omitted (listed in the directory structure only)."
+        )
+        if header_tokens + BUDGET_SUMMARY_RESERVE > max_tokens:
+            summary += (
+                f" The summary and directory structure alone take about {header_tokens} tokens, so the output exceeds"
+                f" the budget; raise max_tokens or ignore more directories."
+            )
+    chunks = iter_chunks(summary, tree_lines, rendered_files)
+
+    # Each block is written as soon as it is produced, so the document is never built in memory. Unchanged blocks
+    # are copied from the previous output, which is only replaced once the new one is complete.
+    tmp_path = f"{file_path}.tmp"
     try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        token_count = len(encoding.encode(exported_document))
-    except Exception: token_count = "N/A (tiktoken error)"
+        with open(tmp_path, "wb") as f:
+            token_count, written_files, offsets = write_chunks(f, chunks, encoding)
+        if previous:
+            previous.close()
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if previous:
+            previous.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    write_manifest(file_path, settings, written_files, offsets)
+
+    exported_document = None
+    if inputs.return_content is None or inputs.return_content:
+        with open(file_path, "r", encoding="utf-8") as f: exported_document = f.read()
 
     file_size_display = "N/A"
     if os.path.exists(file_path):
@@ -175,16 +691,70 @@ async def _process_directory(config: CONFIG, inputs: INPUTS, processing_path: st
         elif file_size_kb >= 1: file_size_display = f"{file_size_kb:.2f} KB"
         else: file_size_display = f"{file_size_bytes} bytes"
 
+    # Largest files first, so the ones dominating the context budget are easy to spot.
+    file_token_counts = sorted(
+        budget_report if budget_report is not None else ({"path": r.path, "tokens": r.tokens} for r in written_files),
+        key=lambda entry: (-(entry["tokens"] or 0), entry["path"]),
+    )
+
     return OUTPUT(
         ingested_output=exported_document,
         output_path=file_path,
         token_count=token_count,
-        file_size_display=file_size_display
+        file_size_display=file_size_display,
+        file_token_counts=file_token_counts if encoding is not None or budget_report is not None else None,
+        reused_files=sum(1 for r in written_files if r.reused),
+        budget_exceeded=None if max_tokens is None else (
+            token_count > max_tokens if isinstance(token_count, int) else header_tokens + BUDGET_SUMMARY_RESERVE > max_tokens
+        ),
     )
 
+def repo_cache_dir(home_path: str, clone_url: str) -> str:
+    parsed_url = urlparse(clone_url)
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", f"{parsed_url.netloc}{parsed_url.path}").strip("_")
+    return os.path.join(home_path, REPO_CACHE_DIR, name)
+
+def prune_repo_cache(cache_root: str, keep: int, current_repo_dir: str):
+    """Deletes all but the `keep` most recently used cached clones (the current one is always kept)."""
+    if keep <= 0 or not os.path.isdir(cache_root):
+        return
+    with os.scandir(cache_root) as it:
+        clones = sorted(
+            ((entry.stat().st_mtime, entry.path) for entry in it
+             if entry.is_dir() and os.path.abspath(entry.path) != os.path.abspath(current_repo_dir)),
+            reverse=True,
+        )
+    for _, path in clones[max(keep - 1, 0):]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def sync_repository(clone_url: str, repo_dir: str):
+    """Updates the cached clone to the remote's latest commit, or makes a fresh shallow clone if there is none (or it is broken).
+
+    Only files that changed upstream get a new mtime, which is what lets the manifest skip the others.
+    """
+    def git(*args: str, cwd: Optional[str] = None):
+        subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, text=True)
+
+    if os.path.isdir(os.path.join(repo_dir, '.git')):
+        try:
+            git('fetch', '--depth', '1', 'origin', 'HEAD', cwd=repo_dir)
+            git('reset', '--hard', 'FETCH_HEAD', cwd=repo_dir)
+            git('clean', '-ffdx', cwd=repo_dir)
+            return
+        except subprocess.CalledProcessError:
+            pass
+    shutil.rmtree(repo_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(repo_dir), exist_ok=True)
+    try:
+        git('clone', '--depth', '1', clone_url, repo_dir)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(repo_dir, ignore_errors=True)
+        raise RuntimeError(f"Failed to clone repository. Error: {e.stderr}")
+
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     """Dispatcher: handles local paths and GitHub URLs, then calls the processor."""
     path = inputs.directory_path.strip()
+    parse_max_tokens(inputs.max_tokens)  # Rejects an invalid budget before anything is cloned or scanned
 
     if path.startswith(('http://', 'https://')):
         # **NEW: Explicitly check for the 'git' command before proceeding.**
@@ -210,16 +780,13 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         if not clone_url:
             raise ValueError("Invalid GitHub URL. Please provide a direct link to a repository (e.g., https://github.com/user/repo).")
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            try:
-                subprocess.run(
-                    ['git', 'clone', '--depth', '1', clone_url, temp_dir],
-                    check=True, capture_output=True, text=True
-                )
-            except subprocess.CalledProcessError as e:
-                raise RuntimeError(f"Failed to clone repository. Error: {e.stderr}")
-            
-            return await _process_directory(config, inputs, temp_dir, repo_name)
+        repo_dir = repo_cache_dir(await get_home_path(), clone_url)
+        sync_repository(clone_url, repo_dir)
+        # The clone directory's mtime records when it was last used, which is what eviction goes by.
+        os.utime(repo_dir)
+        max_cached = config.max_cached_repositories if config.max_cached_repositories is not None else 10
+        prune_repo_cache(os.path.dirname(repo_dir), int(max_cached), repo_dir)
+        return await _process_directory(config, inputs, repo_dir, repo_name)
 
     elif os.path.isdir(path):
         root_name = os.path.basename(os.path.abspath(path))
@@ -0,0 +1,71 @@
+import os
+import tempfile
+
+from tool import IgnoreRules, is_ignored, parse_max_tokens, plan_budget, scan_directory
+
+
+def test_plan_budget():
+    costs = [("README.md", 100, 20), ("main.py", 300, 40), ("util.py", 200, None), ("tests/test_main.py", 400, 50)]
+    assert plan_budget(costs, 1000) == {path: "full" for path, _, _ in costs}
+    # A quarter of the budget is held back for outlines, so main.py is outlined rather than filling it.
+    assert plan_budget(costs, 500) == {"README.md": "full", "main.py": "outline", "util.py": "full", "tests/test_main.py": "outline"}
+    # Files without an outline are omitted once they no longer fit in full.
+    assert plan_budget(costs, 150) == {"README.md": "full", "main.py": "outline", "util.py": "omitted", "tests/test_main.py": "omitted"}
+    assert set(plan_budget(costs, -10).values()) == {"omitted"}
+
+
+def test_parse_max_tokens():
+    assert parse_max_tokens(None) is None and parse_max_tokens("") is None
+    assert parse_max_tokens(500) == 500 and parse_max_tokens(" 500 ") == 500 and parse_max_tokens(500.0) == 500
+    for value in ["abc", 0, -5, 2.5, True, "12x"]:
+        try:
+            parse_max_tokens(value)
+        except ValueError:
+            continue
+        raise AssertionError(f"max_tokens={value!r} was accepted")
+
+
+def test_ignore_rules_negation_and_anchoring():
+    rules = IgnoreRules("", ["*.log", "!keep.log", "/build", "docs/*.tmp", "cache/", "\\#notes"])
+    assert rules.match("debug.log", False) is True
+    assert rules.match("src/deep/debug.log", False) is True
+    assert rules.match("src/keep.log", False) is False
+    # "/build" and "docs/*.tmp" are anchored to the directory of the ignore file.
+    assert rules.match("build", True) is True
+    assert rules.match("src/build", True) is None
+    assert rules.match("docs/a.tmp", False) is True
+    assert rules.match("src/docs/a.tmp", False) is None
+    # A trailing "/" only matches directories.
+    assert rules.match("src/cache", True) is True
+    assert rules.match("src/cache", False) is None
+    assert rules.match("#notes", False) is True
+    # Rules of a nested ignore file apply relative to its directory and take precedence.
+    nested = IgnoreRules("src", ["!debug.log", "/local.py"])
+    assert is_ignored([rules, nested], "src/debug.log", False) is False
+    assert is_ignored([rules, nested], "src/local.py", False) is True
+    assert is_ignored([rules, nested], "src/lib/local.py", False) is False
+
+
+def test_scan_directory_respects_gitignore():
+    with tempfile.TemporaryDirectory() as root:
+        for rel_path in ["main.py", "app.log", "keep.log", "build/out.py", "src/build/gen.py", "src/app.py", "src/local.py"]:
+            path = os.path.join(root, *rel_path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("x = 1\n")
+        with open(os.path.join(root, ".gitignore"), "w", encoding="utf-8") as f:
+            f.write("*.log\n!keep.log\n/build/\n")
+        with open(os.path.join(root, "src", ".gitignore"), "w", encoding="utf-8") as f:
+            f.write("/local.py\n")
+        _, file_entries = scan_directory(root, set(), set(), {".py", ".log"})
+        assert [entry.relative_path for entry in file_entries] == ["keep.log", "main.py", "src/app.py", "src/build/gen.py"]
+        _, file_entries = scan_directory(root, set(), set(), {".py", ".log"}, respect_gitignore=False)
+        assert len(file_entries) == 7
+
+
+if __name__ == "__main__":
+    test_plan_budget()
+    test_parse_max_tokens()
+    test_ignore_rules_negation_and_anchoring()
+    test_scan_directory_respects_gitignore()
+    print("All tests passed.")
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import tool
+from tool import CONFIG, INPUTS, run, build_section_index, build_section_tree, flatten_sections_for_prompt_with_refs, preselect_sections
+
+DOC = (
+    "# Guide\n\nIntro.\n\n"
+    "## Setup\n\nInstall things. The setup step needs care.\n\n"
+    "## Usage\n\nRun it after the setup step.\n\n"
+    "## Setup notes\n\nMore notes.\n"
+)
+
+
+def flat_sections(md_content: str):
+    index = build_section_index(md_content)
+    return [sec for sec, _ in flatten_sections_for_prompt_with_refs(build_section_tree(md_content, index))]
+
+
+def write_doc(directory: str) -> str:
+    path = os.path.join(directory, "guide.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(DOC)
+    return path
+
+
+def run_delete(path: str, prompt: str, llm_answer=None, prompts=None):
+    """Runs the deleter, with an LLM stand-in that records its calls."""
+    calls = []
+
+    async def fake_llm(payload):
+        calls.append(payload["prompt"])
+        return {"message": json.dumps(llm_answer or {"relevant": False, "section_index": None})}
+
+    original = tool.shinkai_llm_prompt_processor
+    tool.shinkai_llm_prompt_processor = fake_llm
+    try:
+        inputs = INPUTS()
+        inputs.md_file_path = path
+        inputs.prompt = prompt
+        inputs.prompts = prompts
+        return asyncio.run(run(CONFIG(), inputs)), calls
+    finally:
+        tool.shinkai_llm_prompt_processor = original
+
+
+def test_exact_match_only_on_high_confidence():
+    flat = flat_sections(DOC)
+    titles = [sec["full_title"] for sec in flat]
+    for prompt, expected in [
+        ('delete the "Setup" section', "Guide > Setup"),
+        ("delete the Setup section", "Guide > Setup"),
+        ("Setup", "Guide > Setup"),
+        ("delete `Guide > Setup notes`", "Guide > Setup notes"),
+    ]:
+        _, exact_idx = preselect_sections(flat, prompt)
+        assert exact_idx is not None and titles[exact_idx] == expected, (prompt, exact_idx)
+    for prompt in [
+        "remove the paragraph that mentions the Setup step",
+        "delete what comes after the setup step in Usage",
+    ]:
+        _, exact_idx = preselect_sections(flat, prompt)
+        assert exact_idx is None, (prompt, titles[exact_idx])
+
+
+def test_quoted_title_deletes_without_llm():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_doc(directory)
+        output, calls = run_delete(path, 'delete the "Setup" section')
+        assert calls == []
+        assert output.action_done == "Deleted section titled 'Guide > Setup' and all its sub-sections."
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        assert "## Setup\n" not in content and "## Setup notes\n" in content and "## Usage\n" in content
+
+
+def test_title_mention_asks_the_llm():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_doc(directory)
+        output, calls = run_delete(path, "remove the paragraph that mentions the Setup step")
+        assert len(calls) == 1
+        assert output.action_done == "No relevant section found to delete."
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == DOC
+
+
+def test_batch_results_follow_input_order():
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_doc(directory)
+        prompts = ["keep the intro as it is", 'delete "Usage"', "summarise the guide", 'remove "Setup notes"']
+        output, calls = run_delete(path, "", prompts=prompts)
+        assert calls == []
+        assert [r["prompt"] for r in output.batch_results] == prompts
+        assert [r["status"] for r in output.batch_results] == [
+            "Prompt does not indicate a delete action.", "Deleted.", "Prompt does not indicate a delete action.", "Deleted.",
+        ]
+
+
+if __name__ == "__main__":
+    test_exact_match_only_on_high_confidence()
+    test_quoted_title_deletes_without_llm()
+    test_title_mention_asks_the_llm()
+    test_batch_results_follow_input_order()
+    print("All tests passed.")
@@ -4,10 +4,15 @@
 # ]
 # ///
 
-from typing import Any, Optional, List, Dict, Tuple
+from typing import Any, Optional, List, Dict, Set, Tuple
+import asyncio
 import os
 import re
 import json
+import hashlib
+import math
+import bisect
+import difflib
 from shinkai_local_tools import shinkai_llm_prompt_processor
 
 class CONFIG:
@@ -16,68 +21,298 @@ class CONFIG:
 class INPUTS:
     prompt: str
     md_file_path: str
+    prompts: Optional[List[str]] = None
 
 class OUTPUT:
     updated_file_path: Optional[str] = None
     action_done: Optional[str] = None
     new_section_details: Optional[str] = None
+    batch_results: Optional[List[Dict[str, Any]]] = None
+
+# --------------------------- Section index ---------------------------
+# Shared by the markdown-editing tools (adder, updater, mover, deleter, reader, architecture parser). Each tool is
+# shipped as a single file, so this block is copied into each of them with only the helpers that tool uses; a
+# helper that appears in several tools must be kept identical in all of them.
+#
+# The headings of a file are cached in a hidden sidecar file next to it (".<name>.sections.json"), keyed on
+# the file's mtime and size. Headings inside fenced code blocks are ignored. After an edit, only the lines
+# touched by the splice are re-scanned; everything after them is shifted. Each heading carries a hash of its
+# section's own content (up to the next heading), so edits that change nothing can be detected and skipped.
+#
+# Edits are made on an MdDocument, a piece table over the file's text: a splice shares the existing text instead
+# of copying the document, and writes stream the pieces to a temporary file that is fsynced and renamed over the
+# original, so an interrupted write never truncates the file.
+
+SECTION_INDEX_VERSION = 2
+_HEADING_OR_FENCE_RE = re.compile(r"^(#{1,6})[ \t]+([^\n]*)$|^ {0,3}(`{3,}|~{3,})([^\n]*)$", re.MULTILINE)
+_FENCE_LINE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})", re.MULTILINE)
+
+
+def scan_md_headings(md_content: str, start: int = 0, end: Optional[int] = None) -> Tuple[List[List[Any]], List[List[int]]]:
+    """
+    Returns the [offset, level, title] of each heading in md_content[start:end] and the [start, end) ranges of its
+    fenced code blocks. A fence left open runs to the end of the document and is recorded with an end of -1.
+    """
+    end = len(md_content) if end is None else end
+    headings, fences = [], []
+    fence, fence_start = None, 0
+    for m in _HEADING_OR_FENCE_RE.finditer(md_content, start, end):
+        marker = m.group(3)
+        if marker:
+            if fence is None:
+                fence, fence_start = marker, m.start()
+            elif marker[0] == fence[0] and len(marker) >= len(fence) and not m.group(4).strip():
+                fences.append([fence_start, min(m.end() + 1, end)])
+                fence = None
+        elif fence is None:
+            headings.append([m.start(), len(m.group(1)), m.group(2).strip()])
+    if fence is not None:
+        fences.append([fence_start, -1])
+    return headings, fences
+
+
+def _add_byte_offsets(md_content: str, headings: List[List[Any]], char_pos: int = 0, byte_pos: int = 0) -> List[List[Any]]:
+    # Turns [offset, level, title] into [offset, byte_offset, level, title], counting bytes from a known anchor.
+    result = []
+    for offset, level, title in headings:
+        byte_pos += len(md_content[char_pos:offset].encode("utf-8"))
+        char_pos = offset
+        result.append([offset, byte_pos, level, title])
+    return result
+
+
+def section_hash(section_content: str) -> str:
+    return hashlib.blake2b(section_content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _add_section_hashes(md_content, headings: List[List[Any]], start: int = 0, end: Optional[int] = None) -> List[List[Any]]:
+    # Sets the hash (the 5th field) of headings[start:end] in place; each section's own content ends at the next heading.
+    end = len(headings) if end is None else end
+    for i in range(start, end):
+        section_end = headings[i + 1][0] if i + 1 < len(headings) else len(md_content)
+        headings[i] = headings[i][:4] + [section_hash(md_content[headings[i][0]:section_end])]
+    return headings
+
+
+def build_section_index(md_content: str) -> Dict[str, Any]:
+    md_content = str(md_content)
+    headings, fences = scan_md_headings(md_content)
+    return {
+        "version": SECTION_INDEX_VERSION,
+        "length": len(md_content),
+        "byte_length": len(md_content.encode("utf-8")),
+        "headings": _add_section_hashes(md_content, _add_byte_offsets(md_content, headings)),
+        "fences": fences,
+    }
+
 
-def parse_md_sections(md_content: str):
-    lines = md_content.splitlines(keepends=True)
-    headings = []
-    for i, line in enumerate(lines):
-        m = re.match(r'^(#{1,6})\s+(.*)$', line)
-        if m:
-            level = len(m.group(1))
-            title = m.group(2).strip()
-            headings.append((i, level, title))
+def _section_index_path(md_file_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(md_file_path))
+    return os.path.join(directory, f".{name}.sections.json")
+
+
+def load_section_index(md_file_path: str, md_content: str) -> Dict[str, Any]:
+    """Returns the cached index of the file if it still matches the file's mtime and size, otherwise scans md_content and caches it."""
+    try:
+        st = os.stat(md_file_path)
+        with open(_section_index_path(md_file_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if (index.get("version") == SECTION_INDEX_VERSION and index.get("mtime_ns") == st.st_mtime_ns
+                and index.get("size") == st.st_size and index.get("length") == len(md_content)):
+            return index
+    except Exception:
+        pass
+    index = build_section_index(md_content)
+    save_section_index(md_file_path, index)
+    return index
+
+
+def save_section_index(md_file_path: str, index: Dict[str, Any]):
+    """Stores the index as describing the current state of the file. Failures only cost a re-scan next time."""
+    path = _section_index_path(md_file_path)
+    try:
+        st = os.stat(md_file_path)
+        index["mtime_ns"], index["size"] = st.st_mtime_ns, st.st_size
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(f"{path}.tmp", path)
+    except Exception:
+        pass
+
+
+class MdDocument:
+    """
+    Piece table over a markdown text: a list of (buffer, start, end) pieces pointing into the original text and the
+    inserted strings. splice() returns a new document sharing every buffer, so an edit costs O(pieces), not O(text).
+    len(), slicing (which returns a str), find() and rfind() behave as on a str.
+    """
+
+    WRITE_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, text: str = "", pieces: Optional[List[Tuple[str, int, int]]] = None):
+        self._pieces = pieces if pieces is not None else ([(text, 0, len(text))] if text else [])
+        self._starts = []
+        length = 0
+        for _, s, e in self._pieces:
+            self._starts.append(length)
+            length += e - s
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return "".join(buf[s:e] for buf, s, e in self._pieces)
+
+    def _chunks(self, start: int, end: int):
+        # (buffer, buffer_start, buffer_end, document offset of buffer index 0) for the text in [start, end).
+        i = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        while start < end and i < len(self._pieces) and self._starts[i] < end:
+            buf, s, e = self._pieces[i]
+            base = self._starts[i] - s
+            lo, hi = max(s, start - base), min(e, end - base)
+            if lo < hi:
+                yield buf, lo, hi, base
+            i += 1
+
+    def __getitem__(self, key) -> str:
+        if isinstance(key, int):
+            pos = key + self._length if key < 0 else key
+            if not 0 <= pos < self._length:
+                raise IndexError("MdDocument index out of range")
+            return self[pos:pos + 1]
+        start, end, _ = key.indices(self._length)
+        return "".join(buf[lo:hi] for buf, lo, hi, _ in self._chunks(start, end))
+
+    def find(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        start, end, _ = slice(start, end).indices(self._length)
+        if len(sub) != 1:
+            pos = self[start:end].find(sub)
+            return pos + start if pos != -1 else -1
+        for buf, lo, hi, base in self._chunks(start, end):
+            pos = buf.find(sub, lo, hi)
+            if pos != -1:
+                return pos + base
+        return -1
+
+    def rfind(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        start, end, _ = slice(start, end).indices(self._length)
+        if len(sub) != 1:
+            pos = self[start:end].rfind(sub)
+            return pos + start if pos != -1 else -1
+        for buf, lo, hi, base in reversed(list(self._chunks(start, end))):
+            pos = buf.rfind(sub, lo, hi)
+            if pos != -1:
+                return pos + base
+        return -1
+
+    def splice(self, start: int, end: int, replacement: str) -> "MdDocument":
+        pieces = [(buf, lo, hi) for buf, lo, hi, _ in self._chunks(0, start)]
+        if replacement:
+            pieces.append((replacement, 0, len(replacement)))
+        pieces.extend((buf, lo, hi) for buf, lo, hi, _ in self._chunks(end, self._length))
+        return MdDocument(pieces=pieces)
+
+    def write_to(self, f):
+        for buf, s, e in self._pieces:
+            for pos in range(s, e, self.WRITE_CHUNK_SIZE):
+                f.write(buf[pos:min(pos + self.WRITE_CHUNK_SIZE, e)])
+
+
+def rstrip_offset(md_content, pos: int) -> int:
+    """len(md_content[:pos].rstrip()), without copying the prefix."""
+    while pos > 0 and md_content[pos - 1].isspace():
+        pos -= 1
+    return pos
+
+
+def lstrip_offset(md_content, pos: int) -> int:
+    """len(md_content) - len(md_content[pos:].lstrip()), without copying the suffix."""
+    length = len(md_content)
+    while pos < length and md_content[pos].isspace():
+        pos += 1
+    return pos
+
+
+def splice_md_content(md_content, index: Dict[str, Any], start: int, end: int, replacement: str) -> Tuple[MdDocument, Dict[str, Any]]:
+    """
+    Replaces md_content[start:end] (a str or an MdDocument) and returns the new document with its index,
+    re-scanning only the lines the splice touched.
+    """
+    md_content = md_content if isinstance(md_content, MdDocument) else MdDocument(md_content)
+    new_content = md_content.splice(start, end, replacement)
+    old_line_end = md_content.find("\n", end)
+    old_line_end = len(md_content) if old_line_end == -1 else old_line_end
+    line_start = md_content.rfind("\n", 0, start) + 1
+    new_line_end = new_content.find("\n", start + len(replacement))
+    new_line_end = len(new_content) if new_line_end == -1 else new_line_end
+    new_lines = new_content[line_start:new_line_end]
+    if _FENCE_LINE_RE.search(md_content[line_start:old_line_end]) or _FENCE_LINE_RE.search(new_lines):
+        # Opening or closing a code fence can hide or reveal headings anywhere below it.
+        return new_content, build_section_index(new_content)
+
+    delta = len(new_content) - len(md_content)
+    byte_delta = len(replacement.encode("utf-8")) - len(md_content[start:end].encode("utf-8"))
+    headings = [h for h in index["headings"] if h[0] < line_start]
+    # The section the splice starts in and every heading found in the re-scanned lines get a new hash.
+    rehash_start = max(len(headings) - 1, 0)
+    if not any(s <= line_start and (line_start < e or e == -1) for s, e in index["fences"]):
+        anchor = headings[-1] if headings else [0, 0]
+        region, _ = scan_md_headings(new_lines)
+        region = [[offset + line_start, level, title] for offset, level, title in region]
+        headings.extend(_add_byte_offsets(new_content, region, anchor[0], anchor[1]))
+    rehash_end = len(headings)
+    headings.extend([h[0] + delta, h[1] + byte_delta, h[2], h[3], h[4]] for h in index["headings"] if h[0] > old_line_end)
+    _add_section_hashes(new_content, headings, rehash_start, rehash_end)
+
+    fences = []
+    for s, e in index["fences"]:
+        if e != -1 and e <= line_start:
+            fences.append([s, e])
+        elif s > old_line_end:
+            fences.append([s + delta, -1 if e == -1 else e + delta])
+        else:
+            fences.append([s, -1 if e == -1 else e + delta])
+    new_index = dict(index, headings=headings, fences=fences, length=len(new_content), byte_length=index["byte_length"] + byte_delta)
+    new_index.pop("mtime_ns", None)
+    return new_content, new_index
+
+
+def build_section_tree(md_content: str, index: Dict[str, Any]) -> List[Dict]:
+    """Builds the section hierarchy from the index. Each section's content runs up to the next heading of any level."""
+    headings = index["headings"]
     if not headings:
         return [{
             "level": 0,
             "title": "",
-            "content": md_content,
+            "heading_line": "",
+            "content": md_content[:],
             "start_idx": 0,
             "end_idx": len(md_content),
             "subsections": []
         }]
-    line_start_char_indices = []
-    char_count = 0
-    for line in lines:
-        line_start_char_indices.append(char_count)
-        char_count += len(line)
-    sections = []
-    for i, (line_idx, level, title) in enumerate(headings):
-        start_idx = line_start_char_indices[line_idx]
-        if i + 1 < len(headings):
-            next_line_idx = headings[i + 1][0]
-            end_idx = line_start_char_indices[next_line_idx]
-        else:
-            end_idx = len(md_content)
-        content = md_content[start_idx:end_idx]
-        sections.append({
+    result, stack = [], []
+    for i, (start_idx, _, level, title, _) in enumerate(headings):
+        end_idx = headings[i + 1][0] if i + 1 < len(headings) else len(md_content)
+        line_end = md_content.find("\n", start_idx, end_idx)
+        sec = {
             "level": level,
             "title": title,
-            "content": content,
+            "heading_line": md_content[start_idx:end_idx if line_end == -1 else line_end],
+            "content": md_content[start_idx:end_idx],
             "start_idx": start_idx,
             "end_idx": end_idx,
             "subsections": []
-        })
-
-    def build_hierarchy(secs: List[Dict]) -> List[Dict]:
-        result = []
-        stack = []
-        for sec in secs:
-            while stack and stack[-1]["level"] >= sec["level"]:
-                stack.pop()
-            if stack:
-                stack[-1]["subsections"].append(sec)
-            else:
-                result.append(sec)
-            stack.append(sec)
-        return result
+        }
+        while stack and stack[-1]["level"] >= level:
+            stack.pop()
+        if stack:
+            stack[-1]["subsections"].append(sec)
+        else:
+            result.append(sec)
+        stack.append(sec)
+    return result
 
-    hierarchical_sections = build_hierarchy(sections)
-    return hierarchical_sections
 
 def flatten_sections_for_prompt_with_refs(sections: List[Dict], parent_titles: List[str] = None) -> List[Tuple[Dict, Dict]]:
     if parent_titles is None:
@@ -98,6 +333,7 @@ def flatten_sections_for_prompt_with_refs(sections: List[Dict], parent_titles: L
             result.extend(flatten_sections_for_prompt_with_refs(sec["subsections"], parent_titles + [sec["title"]]))
     return result
 
+
 def get_section_full_range(section: Dict) -> Tuple[int, int]:
     start = section["start_idx"]
     max_end = section["end_idx"]
@@ -111,6 +347,180 @@ def get_section_full_range(section: Dict) -> Tuple[int, int]:
     traverse(section)
     return start, max_end
 
+
+# Sections beyond this many are not shown to the LLM; the local ranking keeps the most promising ones.
+PRESELECT_TOP_K = 20
+_PROMPT_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "about", "into", "from", "by", "at",
+    "is", "it", "this", "that", "section", "sections", "heading", "part", "please", "add", "update", "delete",
+    "remove", "move", "read", "edit", "rewrite", "new", "before", "after", "above", "below",
+}
+
+
+def _stem(token: str) -> str:
+    # Just enough stemming for "prices", "pricing" and "price" to meet.
+    for suffix in ("ing", "es", "ed", "s", "e"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def _text_tokens(text: str) -> List[str]:
+    return [_stem(t) for t in re.findall(r"\w+", text.lower()) if t not in _PROMPT_STOPWORDS]
+
+
+def _normalized_title(title: str) -> str:
+    return " ".join(re.findall(r"\w+", title.lower()))
+
+
+_QUOTED_RE = re.compile(r'"([^"]+)"|\u201c([^\u201d]+)\u201d|`([^`]+)`|\u00ab([^\u00bb]+)\u00bb|(?<!\w)[\'\u2018]([^\'\u2019]+)[\'\u2019](?!\w)')
+
+
+def _quoted_phrases(prompt: str) -> Set[str]:
+    return {_normalized_title(next(g for g in m.groups() if g)) for m in _QUOTED_RE.finditer(prompt)}
+
+
+def _names_section_exactly(sec: Dict, prompt_tokens: List[str], quoted: Set[str]) -> bool:
+    """The prompt quotes the section's title (or title path), or is only its title plus instruction words."""
+    if _normalized_title(sec["title"]) in quoted or _normalized_title(sec["full_title"]) in quoted:
+        return True
+    title_tokens = _text_tokens(sec["title"])
+    return bool(title_tokens) and title_tokens == prompt_tokens
+
+
+def preselect_sections(sections_flat: List[Dict], prompt: str, top_k: int = PRESELECT_TOP_K) -> Tuple[List[int], Optional[int]]:
+    """
+    Ranks sections against the prompt locally: BM25 over each section's title path and opening text, plus a
+    fuzzy match of its own title words (typos, plurals). Returns the indices of the top_k candidates in document
+    order, and the index of the section the prompt names with high confidence (None otherwise): its title is
+    quoted or is the whole prompt, no other section matches that way, and it is also the top ranked section.
+    A title merely appearing in the prompt only makes sure that section is among the candidates.
+    """
+    prompt_norm = f" {_normalized_title(prompt)} "
+    named = []
+    for i, sec in enumerate(sections_flat):
+        title = _normalized_title(sec["title"])
+        if len(title) >= 3 and f" {title} " in prompt_norm:
+            named.append((i, title))
+    # "Beta" is not a separate match when the prompt names "Beta child".
+    named = [(i, t) for i, t in named if not any(t != other and f" {t} " in f" {other} " for _, other in named)]
+    named_idx = named[0][0] if len(named) == 1 else None
+
+    query_tokens = _text_tokens(prompt)
+    query = set(query_tokens)
+    docs = [_text_tokens(f"{sec['full_title']} {sec['content'][:300]}") for sec in sections_flat]
+    n_docs = len(docs)
+    avg_len = (sum(len(d) for d in docs) / n_docs or 1.0) if n_docs else 1.0
+    doc_freq: Dict[str, int] = {}
+    for d in docs:
+        for t in set(d):
+            doc_freq[t] = doc_freq.get(t, 0) + 1
+    scores = []
+    for sec, d in zip(sections_flat, docs):
+        score = 0.0
+        for t in query:
+            tf = d.count(t)
+            if tf:
+                idf = math.log(1 + (n_docs - doc_freq[t] + 0.5) / (doc_freq[t] + 0.5))
+                score += idf * tf * 2.5 / (tf + 1.5 * (0.25 + 0.75 * len(d) / avg_len))
+        title_words = _text_tokens(sec["title"])
+        if title_words and query:
+            fuzzy = sum(1 for w in title_words if difflib.get_close_matches(w, query, n=1, cutoff=0.8))
+            score += 2.0 * fuzzy / len(title_words)
+        scores.append(score)
+    ranked = sorted(range(n_docs), key=lambda i: scores[i], reverse=True)
+
+    exact_idx = None
+    quoted = _quoted_phrases(prompt)
+    exact = [i for i, sec in enumerate(sections_flat) if _names_section_exactly(sec, query_tokens, quoted)]
+    if len(exact) == 1 and ranked[0] == exact[0] and (n_docs == 1 or scores[ranked[0]] > scores[ranked[1]]):
+        exact_idx = exact[0]
+
+    if n_docs <= top_k:
+        return list(range(n_docs)), exact_idx
+    ranked = ranked[:top_k]
+    if named_idx is not None and named_idx not in ranked:
+        ranked[-1] = named_idx
+    return sorted(ranked), exact_idx
+
+
+async def find_relevant_sections_batch(sections_flat: List[Dict], prompts: List[str]) -> List[Optional[int]]:
+    """
+    One relevance pass for several instructions: instructions naming a section title exactly are resolved
+    locally, all the others share a single LLM call over the union of their candidate sections.
+    """
+    results: List[Optional[int]] = [None] * len(prompts)
+    pending, candidates = [], set()
+    for n, prompt in enumerate(prompts):
+        prompt_candidates, exact_idx = preselect_sections(sections_flat, prompt)
+        if exact_idx is not None:
+            results[n] = exact_idx
+        else:
+            pending.append(n)
+            candidates.update(prompt_candidates)
+    if not pending or not sections_flat:
+        return results
+    sections_description = "\n".join(
+        [f"{i}: Title: '{sections_flat[i]['full_title']}', Content (first 100 chars): '{sections_flat[i]['content'][:100].replace(chr(10), ' ')}...'" for i in sorted(candidates)]
+    )
+    instructions = "\n".join(f"{n}: {prompts[n]}" for n in pending)
+    llm_prompt = (
+        f"You are helping to select the most relevant markdown section for each of several user instructions.\n"
+        f"Instructions:\n{instructions}\n"
+        f"Here are the markdown sections:\n{sections_description}\n"
+        f"Output a JSON object with one key, 'selections': a list with one object per instruction, with keys:\n"
+        f" - 'instruction': the instruction number.\n"
+        f" - 'relevant': true if any section is relevant to the instruction, false otherwise.\n"
+        f" - 'section_index': index of the most relevant section if relevant is true, else null.\n"
+        f"Only output the JSON object, no extra text.\n"
+    )
+    response = await shinkai_llm_prompt_processor({"format": "json", "prompt": llm_prompt})
+    message = response.get("message", "").strip("```json\n").strip()
+    try:
+        for selection in json.loads(message).get("selections", []):
+            n, idx = selection.get("instruction"), selection.get("section_index")
+            n = int(n) if isinstance(n, str) and n.isdigit() else n
+            if n in pending and selection.get("relevant") is True and idx in candidates:
+                results[n] = idx
+    except Exception:
+        pass
+    return results
+
+
+def write_md_file(md_file_path: str, md_content):
+    """
+    Streams the document (a str or an MdDocument) to a temporary file next to md_file_path, fsyncs it and renames
+    it over the original, so a crash leaves either the old or the new file, never a truncated one.
+    """
+    tmp_path = f"{md_file_path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if isinstance(md_content, MdDocument):
+                md_content.write_to(f)
+            else:
+                f.write(md_content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(md_file_path):
+            os.chmod(tmp_path, os.stat(md_file_path).st_mode & 0o7777)
+        os.replace(tmp_path, md_file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename itself.
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(md_file_path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+# --------------------------- End of section index ---------------------------
+
 def extract_insert_location_from_prompt(prompt: str) -> str:
     prompt_lower = prompt.lower()
     before_keywords = ["before", "above", "prior to", "earlier than"]
@@ -126,8 +536,11 @@ def extract_insert_location_from_prompt(prompt: str) -> str:
 async def find_most_relevant_section(sections_flat: List[Dict], prompt: str) -> Optional[int]:
     if not sections_flat:
         return None
+    candidates, exact_idx = preselect_sections(sections_flat, prompt)
+    if exact_idx is not None:
+        return exact_idx
     sections_description = "\n".join(
-        [f"{i}: Title: '{sec['full_title']}', Content (first 100 chars): '{sec['content'][:100].replace(chr(10), ' ')}...'" for i, sec in enumerate(sections_flat)]
+        [f"{i}: Title: '{sections_flat[i]['full_title']}', Content (first 100 chars): '{sections_flat[i]['content'][:100].replace(chr(10), ' ')}...'" for i in candidates]
     )
     llm_prompt = (
         f"You are helping to select the most relevant markdown section for the user query.\n"
@@ -144,7 +557,7 @@ async def find_most_relevant_section(sections_flat: List[Dict], prompt: str) ->
         result = json.loads(message)
         if result.get("relevant") is True and isinstance(result.get("section_index"), int):
             idx = result["section_index"]
-            if 0 <= idx < len(sections_flat):
+            if idx in candidates:
                 return idx
         return None
     except Exception:
@@ -227,6 +640,69 @@ async def propose_section_content(prompt: str, parent_heading_level: int) -> str
     msg = strip_leading_heading(msg)
     return msg
 
+async def propose_section(prompt: str, context_section: Optional[Dict], add_location: str) -> Tuple[str, str]:
+    section_heading_line = await propose_section_heading(prompt, context_section=context_section, add_location=add_location)
+    match = re.match(r"^(#+)", section_heading_line)
+    parent_level = len(match.group(1)) if match else 2
+    section_content_val = await propose_section_content(prompt, parent_heading_level=parent_level)
+    return section_heading_line, section_content_val
+
+async def apply_batch_additions(md_file_path: str, md_content: str, prompts: List[str], output: OUTPUT) -> OUTPUT:
+    # Every insertion point is a boundary between sections of the original document ("after A" and "before B"
+    # can be the same boundary). New sections are collected per boundary in prompt order and spliced in from
+    # the end of the document backwards, so the file is written once.
+    index = load_section_index(md_file_path, md_content)
+    sections = build_section_tree(md_content, index)
+    flat_with_refs = flatten_sections_for_prompt_with_refs(sections)
+    sections_flat = [item[0] for item in flat_with_refs]
+    section_refs = [item[1] for item in flat_with_refs]
+
+    targets = await find_relevant_sections_batch(sections_flat, prompts) if sections_flat else [None] * len(prompts)
+    plans = []
+    for prompt, idx in zip(prompts, targets):
+        add_location = extract_insert_location_from_prompt(prompt) if idx is not None else "end"
+        if idx is None or add_location == "end":
+            plans.append((len(md_content), "end", None, "at the end of the document"))
+            continue
+        start_idx, end_idx = get_section_full_range(section_refs[idx])
+        context_section = {"title": sections_flat[idx]["title"], "level": sections_flat[idx]["level"]}
+        if add_location == "before":
+            plans.append((start_idx, add_location, context_section, f"before section '{sections_flat[idx]['full_title']}'"))
+        else:
+            plans.append((end_idx, add_location, context_section, f"after section '{sections_flat[idx]['full_title']}'"))
+
+    proposals = await asyncio.gather(*(propose_section(prompt, ctx, loc) for prompt, (_, loc, ctx, _) in zip(prompts, plans)))
+
+    results = []
+    by_boundary: Dict[int, List[str]] = {}
+    for prompt, (boundary, _, _, location_desc), (heading_line, content_val) in zip(prompts, plans, proposals):
+        if content_val.strip() == "":
+            results.append({"prompt": prompt, "section": None, "status": "No section content generated."})
+            continue
+        by_boundary.setdefault(boundary, []).append(f"{heading_line.strip()}\n\n{content_val.strip()}")
+        results.append({"prompt": prompt, "section": strip_heading_from_title(heading_line), "status": f"Added {location_desc}."})
+
+    new_md_content = md_content
+    for boundary in sorted(by_boundary, reverse=True):
+        pre_end = rstrip_offset(md_content, boundary)
+        lead = "\n\n" if pre_end else ""
+        separator = "\n\n" if lstrip_offset(md_content, boundary) < len(md_content) else "\n"
+        new_md_content, index = splice_md_content(new_md_content, index, pre_end, boundary, lead + "\n\n".join(by_boundary[boundary]) + separator)
+    output.batch_results = results
+    if not by_boundary:
+        output.action_done = "No section content generated."
+        return output
+    try:
+        write_md_file(md_file_path, new_md_content)
+        save_section_index(md_file_path, index)
+        output.updated_file_path = md_file_path
+        output.action_done = f"Added {sum(len(v) for v in by_boundary.values())} new sections."
+        output.new_section_details = "\n\n".join(md for boundary in sorted(by_boundary) for md in by_boundary[boundary])
+        return output
+    except Exception as e:
+        output.action_done = f"Failed to write updated file: {str(e)}"
+        return output
+
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     output = OUTPUT()
     md_file_path = inputs.md_file_path
@@ -250,6 +726,9 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         return output
 
     prompt = inputs.prompt.strip()
+    if inputs.prompts:
+        batch_prompts = [p.strip() for p in [prompt] + list(inputs.prompts) if isinstance(p, str) and p.strip()]
+        return await apply_batch_additions(md_file_path, md_content, batch_prompts, output)
 
     if len(md_content.strip()) == 0:
         section_heading_line = await propose_section_heading(prompt, context_section=None, add_location="end")
@@ -266,8 +745,7 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         clean_title = strip_heading_from_title(section_heading_line)
         
         try:
-            with open(md_file_path, "w", encoding="utf-8") as f:
-                f.write(new_section_md)
+            write_md_file(md_file_path, new_section_md)
             output.updated_file_path = md_file_path
             output.action_done = f"Added new section titled '{clean_title}' to the new file."
             output.new_section_details = new_section_md
@@ -276,7 +754,8 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
             output.action_done = f"Failed to write updated file: {str(e)}"
             return output
 
-    sections = parse_md_sections(md_content)
+    index = load_section_index(md_file_path, md_content)
+    sections = build_section_tree(md_content, index)
     flat_with_refs = flatten_sections_for_prompt_with_refs(sections)
     sections_flat = [item[0] for item in flat_with_refs]
     section_refs = [item[1] for item in flat_with_refs]
@@ -320,9 +799,8 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         target_sec = section_refs[relevant_idx]
         start_idx, _ = get_section_full_range(target_sec)
         
-        pre_content = full_text[:start_idx].rstrip()
-        post_content = full_text[start_idx:]
-        new_md_content = f"{pre_content}\n\n{new_section_md}\n\n{post_content}"
+        pre_end = rstrip_offset(full_text, start_idx)
+        new_md_content, index = splice_md_content(full_text, index, pre_end, start_idx, f"\n\n{new_section_md}\n\n")
         
         location_desc = f"before section '{add_section_title}'"
 
@@ -330,20 +808,20 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         target_sec = section_refs[relevant_idx]
         _, end_idx = get_section_full_range(target_sec)
         
-        pre_content = full_text[:end_idx].rstrip()
-        post_content = full_text[end_idx:]
-        new_md_content = f"{pre_content}\n\n{new_section_md}{post_content}"
+        pre_end = rstrip_offset(full_text, end_idx)
+        separator = "\n\n" if lstrip_offset(full_text, end_idx) < len(full_text) else "\n"
+        new_md_content, index = splice_md_content(full_text, index, pre_end, end_idx, f"\n\n{new_section_md}{separator}")
         
         location_desc = f"after section '{add_section_title}'"
         
     else:
-        pre_content = full_text.rstrip()
-        new_md_content = f"{pre_content}\n\n{new_section_md}\n"
+        pre_end = rstrip_offset(full_text, len(full_text))
+        new_md_content, index = splice_md_content(full_text, index, pre_end, len(full_text), f"\n\n{new_section_md}\n")
         location_desc = "at the end of the document"
 
     try:
-        with open(md_file_path, "w", encoding="utf-8") as f:
-            f.write(new_md_content)
+        write_md_file(md_file_path, new_md_content)
+        save_section_index(md_file_path, index)
         output.updated_file_path = md_file_path
         output.action_done = f"Added new section titled '{clean_title}' {location_desc}."
         output.new_section_details = new_section_md
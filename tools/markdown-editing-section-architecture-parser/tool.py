@@ -4,48 +4,287 @@
 # ]
 # ///
 
-from typing import Optional, List
+from typing import Any, Dict, Iterator, Optional, List, Tuple
 import os
 import re
+import json
+import hashlib
+import itertools
 
 class CONFIG:
     pass
 
 class INPUTS:
     md_file_path: str
+    # Only return sections up to this depth in the outline (1 = top-level sections, or the subtree root).
+    max_depth: Optional[int] = None
+    # Only return this section (title or "Parent > Child" path) and its sub-sections.
+    subtree: Optional[str] = None
+    # Paging over the (filtered) outline, for documents with many sections.
+    offset: Optional[int] = None
+    limit: Optional[int] = None
 
 class OUTPUT:
     file_path: Optional[str] = None
     section_titles: Optional[List[str]] = None
     section_titles_reading_instructions: Optional[str] = None
+    outline: Optional[List[Dict[str, Any]]] = None
+    section_index_file_path: Optional[str] = None
+    total_sections: Optional[int] = None
+    next_offset: Optional[int] = None
+    error_message: Optional[str] = None
 
 INSTRUCTIONS = (
     "When reading the section titles, avoid adding numbers to them. "
     "Read stricly only the original list as it is. This will avoid doubling indexing numbers if the section titles already contain numbers."
 )
 
+# --------------------------- Section index ---------------------------
+# Shared by the markdown-editing tools (adder, updater, mover, deleter, reader, architecture parser). Each tool is
+# shipped as a single file, so this block is copied into each of them with only the helpers that tool uses; a
+# helper that appears in several tools must be kept identical in all of them.
+#
+# The headings of a file are cached in a hidden sidecar file next to it (".<name>.sections.json"), keyed on
+# the file's mtime and size. Headings inside fenced code blocks are ignored. After an edit, only the lines
+# touched by the splice are re-scanned; everything after them is shifted. Each heading carries a hash of its
+# section's own content (up to the next heading), so edits that change nothing can be detected and skipped.
+
+SECTION_INDEX_VERSION = 2
+_HEADING_OR_FENCE_RE = re.compile(r"^(#{1,6})[ \t]+([^\n]*)$|^ {0,3}(`{3,}|~{3,})([^\n]*)$", re.MULTILINE)
+
+
+def scan_md_headings(md_content: str, start: int = 0, end: Optional[int] = None) -> Tuple[List[List[Any]], List[List[int]]]:
+    """
+    Returns the [offset, level, title] of each heading in md_content[start:end] and the [start, end) ranges of its
+    fenced code blocks. A fence left open runs to the end of the document and is recorded with an end of -1.
+    """
+    end = len(md_content) if end is None else end
+    headings, fences = [], []
+    fence, fence_start = None, 0
+    for m in _HEADING_OR_FENCE_RE.finditer(md_content, start, end):
+        marker = m.group(3)
+        if marker:
+            if fence is None:
+                fence, fence_start = marker, m.start()
+            elif marker[0] == fence[0] and len(marker) >= len(fence) and not m.group(4).strip():
+                fences.append([fence_start, min(m.end() + 1, end)])
+                fence = None
+        elif fence is None:
+            headings.append([m.start(), len(m.group(1)), m.group(2).strip()])
+    if fence is not None:
+        fences.append([fence_start, -1])
+    return headings, fences
+
+
+def _add_byte_offsets(md_content: str, headings: List[List[Any]], char_pos: int = 0, byte_pos: int = 0) -> List[List[Any]]:
+    # Turns [offset, level, title] into [offset, byte_offset, level, title], counting bytes from a known anchor.
+    result = []
+    for offset, level, title in headings:
+        byte_pos += len(md_content[char_pos:offset].encode("utf-8"))
+        char_pos = offset
+        result.append([offset, byte_pos, level, title])
+    return result
+
+
+def section_hash(section_content: str) -> str:
+    return hashlib.blake2b(section_content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _add_section_hashes(md_content, headings: List[List[Any]], start: int = 0, end: Optional[int] = None) -> List[List[Any]]:
+    # Sets the hash (the 5th field) of headings[start:end] in place; each section's own content ends at the next heading.
+    end = len(headings) if end is None else end
+    for i in range(start, end):
+        section_end = headings[i + 1][0] if i + 1 < len(headings) else len(md_content)
+        headings[i] = headings[i][:4] + [section_hash(md_content[headings[i][0]:section_end])]
+    return headings
+
+
+def build_section_index(md_content: str) -> Dict[str, Any]:
+    md_content = str(md_content)
+    headings, fences = scan_md_headings(md_content)
+    return {
+        "version": SECTION_INDEX_VERSION,
+        "length": len(md_content),
+        "byte_length": len(md_content.encode("utf-8")),
+        "headings": _add_section_hashes(md_content, _add_byte_offsets(md_content, headings)),
+        "fences": fences,
+    }
+
+
+def _section_index_path(md_file_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(md_file_path))
+    return os.path.join(directory, f".{name}.sections.json")
+
+
+def load_section_index(md_file_path: str, md_content: str) -> Dict[str, Any]:
+    """Returns the cached index of the file if it still matches the file's mtime and size, otherwise scans md_content and caches it."""
+    try:
+        st = os.stat(md_file_path)
+        with open(_section_index_path(md_file_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if (index.get("version") == SECTION_INDEX_VERSION and index.get("mtime_ns") == st.st_mtime_ns
+                and index.get("size") == st.st_size and index.get("length") == len(md_content)):
+            return index
+    except Exception:
+        pass
+    index = build_section_index(md_content)
+    save_section_index(md_file_path, index)
+    return index
+
+
+def save_section_index(md_file_path: str, index: Dict[str, Any]):
+    """Stores the index as describing the current state of the file. Failures only cost a re-scan next time."""
+    path = _section_index_path(md_file_path)
+    try:
+        st = os.stat(md_file_path)
+        index["mtime_ns"], index["size"] = st.st_mtime_ns, st.st_size
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(f"{path}.tmp", path)
+    except Exception:
+        pass
+
+# --------------------------- End of section index ---------------------------
+
+# The outline is derived from the section index the markdown-editing tools cache next to the file
+# (".<name>.sections.json"), so parsing a file also warms the index the editors load, and there is only one sidecar
+# to keep in sync. Each outline entry holds:
+#   index, parent (index or null), depth (1 = top level), level (number of #), title, line (1-based),
+#   offset / end_offset (byte range of the section including its sub-sections, counted on the text as read, so "\r\n"
+#   counts as one byte), word_count (own content, without the heading line and sub-sections), subtree_word_count,
+#   child_count.
+
+def build_outline(md_content: str, index: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Builds the outline from the index headings in one pass; only each section's own content is split into words."""
+    headings = index["headings"]
+    sections: List[Dict[str, Any]] = []
+    stack: List[Dict[str, Any]] = []
+    line_no, char_pos = 1, 0
+
+    def close(until_level: int, at_offset: int):
+        while stack and stack[-1]["level"] >= until_level:
+            sec = stack.pop()
+            sec["end_offset"] = at_offset
+            if stack:
+                stack[-1]["subtree_word_count"] += sec["subtree_word_count"]
+
+    for i, (offset, byte_offset, level, title, _) in enumerate(headings):
+        close(level, byte_offset)
+        line_no += md_content.count("\n", char_pos, offset)
+        char_pos = offset
+        own_end = headings[i + 1][0] if i + 1 < len(headings) else len(md_content)
+        body_start = md_content.find("\n", offset, own_end)
+        words = len(md_content[body_start:own_end].split()) if body_start != -1 else 0
+        parent = stack[-1] if stack else None
+        sec = {
+            "index": len(sections),
+            "parent": parent["index"] if parent else None,
+            "depth": parent["depth"] + 1 if parent else 1,
+            "level": level,
+            "title": title,
+            "line": line_no,
+            "offset": byte_offset,
+            "end_offset": None,
+            "word_count": words,
+            "subtree_word_count": words,
+            "child_count": 0,
+        }
+        if parent:
+            parent["child_count"] += 1
+        sections.append(sec)
+        stack.append(sec)
+    close(0, index["byte_length"])
+    return sections
+
+def load_outline(md_file_path: str) -> List[Dict[str, Any]]:
+    """Returns the outline of the file, reusing the cached section index when it still matches the file."""
+    with open(md_file_path, "r", encoding="utf-8") as f:
+        md_content = f.read()
+    return build_outline(md_content, load_section_index(md_file_path, md_content))
+
+def section_path(sections: List[Dict[str, Any]], sec: Dict[str, Any]) -> str:
+    titles = []
+    while sec is not None:
+        titles.append(sec["title"])
+        sec = sections[sec["parent"]] if sec["parent"] is not None else None
+    return " > ".join(reversed(titles))
+
+def _normalized(title: str) -> str:
+    return " ".join(title.lower().split())
+
+def find_subtree_root(sections: List[Dict[str, Any]], subtree: str) -> Optional[Dict[str, Any]]:
+    wanted = _normalized(subtree)
+    for sec in sections:
+        if _normalized(sec["title"]) == wanted:
+            return sec
+    # "Parent > Child" paths are only built when the plain title did not match.
+    for sec in sections:
+        if _normalized(section_path(sections, sec)) == wanted:
+            return sec
+    return None
+
+def iter_outline(sections: List[Dict[str, Any]], root: Optional[Dict[str, Any]] = None, max_depth: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Lazily yields the outline entries in document order, restricted to root's subtree and to max_depth below it."""
+    start, base_depth = (root["index"], root["depth"] - 1) if root else (0, 0)
+    for sec in itertools.islice(sections, start, None):
+        if root and sec["offset"] >= root["end_offset"]:
+            break
+        if max_depth is None or sec["depth"] - base_depth <= max_depth:
+            yield sec
+
+def optional_int(value: Any, name: str) -> Optional[int]:
+    """Reads an optional whole-number input ("3", 3 or 3.0); raises ValueError naming the input otherwise."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        number = float(value) if not isinstance(value, bool) else None
+    except (TypeError, ValueError):
+        number = None
+    if number is None or not number.is_integer():
+        raise ValueError(f"Invalid {name}: {value!r}. Expected a whole number.")
+    return int(number)
+
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     output = OUTPUT()
     md_file_path = inputs.md_file_path
-    section_titles: List[str] = []
+    output.file_path = md_file_path
+    output.section_titles = []
+    output.section_titles_reading_instructions = INSTRUCTIONS
 
     if not md_file_path or not isinstance(md_file_path, str) or not os.path.exists(md_file_path):
-        output.file_path = md_file_path
-        output.section_titles = section_titles
-        output.section_titles_reading_instructions = INSTRUCTIONS
         return output
 
     try:
-        with open(md_file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                m = re.match(r'^(#{1,6})\s+(.*)$', line)
-                if m:
-                    title = m.group(2).strip()
-                    section_titles.append(title)
-    except Exception:
-        section_titles = []
+        sections = load_outline(md_file_path)
+    except Exception as e:
+        output.error_message = f"Failed to read file {md_file_path}: {str(e)}"
+        return output
+    output.section_index_file_path = _section_index_path(md_file_path)
+    output.total_sections = len(sections)
 
-    output.file_path = md_file_path
-    output.section_titles = section_titles
-    output.section_titles_reading_instructions = INSTRUCTIONS
+    root = None
+    if inputs.subtree and inputs.subtree.strip():
+        root = find_subtree_root(sections, inputs.subtree)
+        if root is None:
+            output.error_message = f"Section not found: {inputs.subtree}"
+            return output
+
+    try:
+        max_depth = optional_int(inputs.max_depth, "max_depth")
+        offset = max(optional_int(inputs.offset, "offset") or 0, 0)
+        limit = optional_int(inputs.limit, "limit")
+    except ValueError as e:
+        output.error_message = str(e)
+        return output
+    if limit is not None:
+        limit = max(limit, 1)
+
+    entries = iter_outline(sections, root, max_depth)
+    page = list(itertools.islice(entries, offset, None if limit is None else offset + limit + 1))
+    if limit is not None and len(page) > limit:
+        page = page[:limit]
+        output.next_offset = offset + limit
+
+    output.outline = page
+    output.section_titles = [sec["title"] for sec in page]
     return output
\ No newline at end of file
@@ -0,0 +1,38 @@
+import asyncio
+import os
+import tempfile
+
+from tool import CONFIG, INPUTS, build_outline, build_section_index, run
+
+DOC = "pre words here\n# A\none two\n## A1 é\nthree\n```\n# no\n```\n### A1a\nfour five\n## A2\n# B\nsix\n"
+
+
+def test_outline_from_section_index():
+    outline = build_outline(DOC, build_section_index(DOC))
+    assert [(sec["title"], sec["parent"], sec["depth"], sec["line"]) for sec in outline] == [
+        ("A", None, 1, 2), ("A1 é", 0, 2, 4), ("A1a", 1, 3, 9), ("A2", 0, 2, 11), ("B", None, 1, 12),
+    ]
+    assert [(sec["offset"], sec["end_offset"]) for sec in outline] == [(15, 79), (27, 73), (55, 73), (73, 79), (79, 87)]
+    assert [(sec["word_count"], sec["subtree_word_count"], sec["child_count"]) for sec in outline] == [
+        (2, 9, 2), (5, 7, 1), (2, 2, 0), (0, 0, 0), (1, 1, 0),
+    ]
+
+
+def test_run_shares_the_section_index_sidecar():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "doc.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(DOC)
+        inputs = INPUTS()
+        inputs.md_file_path = path
+        inputs.subtree = "A > A1 é"
+        output = asyncio.run(run(CONFIG(), inputs))
+        assert output.section_titles == ["A1 é", "A1a"] and output.total_sections == 5
+        assert sorted(os.listdir(directory)) == [".doc.md.sections.json", "doc.md"]
+        assert output.section_index_file_path == os.path.join(directory, ".doc.md.sections.json")
+
+
+if __name__ == "__main__":
+    test_outline_from_section_index()
+    test_run_shares_the_section_index_sidecar()
+    print("All tests passed.")
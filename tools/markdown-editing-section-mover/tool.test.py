@@ -0,0 +1,68 @@
+from tool import (
+    build_section_index, build_section_tree, flatten_sections_for_prompt_with_refs, get_section_full_range,
+    move_section, relevel_section_text, same_section_contents,
+)
+
+DOC = (
+    "Intro text\n\n"
+    "# A\n\na body\n\n"
+    "## A1\n\na1 body\n\n```\n# not a heading\n```\n\n"
+    "## A2\n\na2 body\n\n"
+    "# B\n\nb body\n"
+)
+
+
+def section_ranges(md_content: str, index):
+    flat = flatten_sections_for_prompt_with_refs(build_section_tree(md_content, index))
+    return {sec["full_title"]: (sec["level"], get_section_full_range(ref)) for sec, ref in flat}
+
+
+def move(source: str, target: str, position: str) -> str:
+    """Moves section `source` before/after section `target` (None: start/end of the document) as a sibling of it."""
+    index = build_section_index(DOC)
+    ranges = section_ranges(DOC, index)
+    source_level, (source_start, source_end) = ranges[source]
+    if target is None:
+        insert_pos, new_level = (0 if position == "before" else len(DOC)), source_level
+    else:
+        new_level, (target_start, target_end) = ranges[target]
+        insert_pos = target_start if position == "before" else target_end
+    moved_text = relevel_section_text(DOC, index, source_start, source_end, new_level - source_level)
+    new_md_content, new_index = move_section(DOC, index, source_start, source_end, insert_pos, moved_text)
+    new_md_content = str(new_md_content)
+    assert new_index["headings"] == build_section_index(new_md_content)["headings"]
+    return new_md_content
+
+
+def test_move_between_siblings():
+    assert move("A > A2", "A > A1", "before") == (
+        "Intro text\n\n# A\n\na body\n\n## A2\n\na2 body\n\n"
+        "## A1\n\na1 body\n\n```\n# not a heading\n```\n\n# B\n\nb body\n"
+    )
+
+
+def test_move_relevels_headings_outside_code():
+    assert move("A > A1", "B", "after") == (
+        "Intro text\n\n# A\n\na body\n\n## A2\n\na2 body\n\n# B\n\nb body\n\n"
+        "# A1\n\na1 body\n\n```\n# not a heading\n```\n"
+    )
+
+
+def test_move_to_document_start():
+    assert move("B", None, "before") == (
+        "# B\n\nb body\n\nIntro text\n\n# A\n\na body\n\n"
+        "## A1\n\na1 body\n\n```\n# not a heading\n```\n\n## A2\n\na2 body\n"
+    )
+
+
+def test_move_next_to_itself_changes_nothing():
+    assert move("A > A1", "A > A2", "before") == DOC
+    assert same_section_contents(build_section_index(DOC), build_section_index(move("A > A2", "A > A1", "after")))
+
+
+if __name__ == "__main__":
+    test_move_between_siblings()
+    test_move_relevels_headings_outside_code()
+    test_move_to_document_start()
+    test_move_next_to_itself_changes_nothing()
+    print("All tests passed.")
@@ -4,10 +4,13 @@
 # ]
 # ///
 
-from typing import Any, Optional, List, Dict, Tuple
+from typing import Any, Optional, List, Dict, Set, Tuple
 import os
 import re
 import json
+import mmap
+import math
+import difflib
 from shinkai_local_tools import shinkai_llm_prompt_processor
 
 class CONFIG:
@@ -24,109 +27,213 @@ class OUTPUT:
     section_full_hierarchy: Optional[List[str]] = None
     explanation: Optional[str] = None
 
-def parse_md_sections(md_content: str):
-    # Parse markdown headings and return a flat list with start/end indices and parent links
-    lines = md_content.splitlines(keepends=True)
-    heading_infos = []
-    for i, line in enumerate(lines):
-        m = re.match(r'^(#{1,6})\s*(.*)$', line)
-        if m:
-            level = len(m.group(1))
-            title = m.group(2).strip()
-            heading_line = line.rstrip('\n')
-            heading_infos.append({
-                "line_idx": i,
-                "level": level,
-                "title": title,
-                "heading_line": heading_line,
-            })
-    # Always include a dummy "root" if there are no headings
-    if not heading_infos:
+# --------------------------- Section index ---------------------------
+# Shared by the markdown-editing tools (adder, updater, mover, deleter, reader, architecture parser). Each tool is
+# shipped as a single file, so this block is copied into each of them with only the helpers that tool uses; a
+# helper that appears in several tools must be kept identical in all of them.
+#
+# The headings of a file are cached in a hidden sidecar file next to it (".<name>.sections.json"), keyed on
+# the file's mtime and size. Headings inside fenced code blocks are ignored. After an edit, only the lines
+# touched by the splice are re-scanned; everything after them is shifted. Each heading carries a hash of its
+# section's own content (up to the next heading), so edits that change nothing can be detected and skipped.
+
+SECTION_INDEX_VERSION = 2
+
+
+def _section_index_path(md_file_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(md_file_path))
+    return os.path.join(directory, f".{name}.sections.json")
+
+
+# Sections beyond this many are not shown to the LLM; the local ranking keeps the most promising ones.
+PRESELECT_TOP_K = 20
+_PROMPT_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "about", "into", "from", "by", "at",
+    "is", "it", "this", "that", "section", "sections", "heading", "part", "please", "add", "update", "delete",
+    "remove", "move", "read", "edit", "rewrite", "new", "before", "after", "above", "below",
+}
+
+
+def _stem(token: str) -> str:
+    # Just enough stemming for "prices", "pricing" and "price" to meet.
+    for suffix in ("ing", "es", "ed", "s", "e"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def _text_tokens(text: str) -> List[str]:
+    return [_stem(t) for t in re.findall(r"\w+", text.lower()) if t not in _PROMPT_STOPWORDS]
+
+
+def _normalized_title(title: str) -> str:
+    return " ".join(re.findall(r"\w+", title.lower()))
+
+
+_QUOTED_RE = re.compile(r'"([^"]+)"|\u201c([^\u201d]+)\u201d|`([^`]+)`|\u00ab([^\u00bb]+)\u00bb|(?<!\w)[\'\u2018]([^\'\u2019]+)[\'\u2019](?!\w)')
+
+
+def _quoted_phrases(prompt: str) -> Set[str]:
+    return {_normalized_title(next(g for g in m.groups() if g)) for m in _QUOTED_RE.finditer(prompt)}
+
+
+def _names_section_exactly(sec: Dict, prompt_tokens: List[str], quoted: Set[str]) -> bool:
+    """The prompt quotes the section's title (or title path), or is only its title plus instruction words."""
+    if _normalized_title(sec["title"]) in quoted or _normalized_title(sec["full_title"]) in quoted:
+        return True
+    title_tokens = _text_tokens(sec["title"])
+    return bool(title_tokens) and title_tokens == prompt_tokens
+
+
+def preselect_sections(sections_flat: List[Dict], prompt: str, top_k: int = PRESELECT_TOP_K) -> Tuple[List[int], Optional[int]]:
+    """
+    Ranks sections against the prompt locally: BM25 over each section's title path and opening text, plus a
+    fuzzy match of its own title words (typos, plurals). Returns the indices of the top_k candidates in document
+    order, and the index of the section the prompt names with high confidence (None otherwise): its title is
+    quoted or is the whole prompt, no other section matches that way, and it is also the top ranked section.
+    A title merely appearing in the prompt only makes sure that section is among the candidates.
+    """
+    prompt_norm = f" {_normalized_title(prompt)} "
+    named = []
+    for i, sec in enumerate(sections_flat):
+        title = _normalized_title(sec["title"])
+        if len(title) >= 3 and f" {title} " in prompt_norm:
+            named.append((i, title))
+    # "Beta" is not a separate match when the prompt names "Beta child".
+    named = [(i, t) for i, t in named if not any(t != other and f" {t} " in f" {other} " for _, other in named)]
+    named_idx = named[0][0] if len(named) == 1 else None
+
+    query_tokens = _text_tokens(prompt)
+    query = set(query_tokens)
+    docs = [_text_tokens(f"{sec['full_title']} {sec['content'][:300]}") for sec in sections_flat]
+    n_docs = len(docs)
+    avg_len = (sum(len(d) for d in docs) / n_docs or 1.0) if n_docs else 1.0
+    doc_freq: Dict[str, int] = {}
+    for d in docs:
+        for t in set(d):
+            doc_freq[t] = doc_freq.get(t, 0) + 1
+    scores = []
+    for sec, d in zip(sections_flat, docs):
+        score = 0.0
+        for t in query:
+            tf = d.count(t)
+            if tf:
+                idf = math.log(1 + (n_docs - doc_freq[t] + 0.5) / (doc_freq[t] + 0.5))
+                score += idf * tf * 2.5 / (tf + 1.5 * (0.25 + 0.75 * len(d) / avg_len))
+        title_words = _text_tokens(sec["title"])
+        if title_words and query:
+            fuzzy = sum(1 for w in title_words if difflib.get_close_matches(w, query, n=1, cutoff=0.8))
+            score += 2.0 * fuzzy / len(title_words)
+        scores.append(score)
+    ranked = sorted(range(n_docs), key=lambda i: scores[i], reverse=True)
+
+    exact_idx = None
+    quoted = _quoted_phrases(prompt)
+    exact = [i for i, sec in enumerate(sections_flat) if _names_section_exactly(sec, query_tokens, quoted)]
+    if len(exact) == 1 and ranked[0] == exact[0] and (n_docs == 1 or scores[ranked[0]] > scores[ranked[1]]):
+        exact_idx = exact[0]
+
+    if n_docs <= top_k:
+        return list(range(n_docs)), exact_idx
+    ranked = ranked[:top_k]
+    if named_idx is not None and named_idx not in ranked:
+        ranked[-1] = named_idx
+    return sorted(ranked), exact_idx
+
+# --------------------------- End of section index ---------------------------
+
+# Reading works on the raw bytes of the file through mmap: headings are located with one bytes-regex pass (or taken
+# from the sidecar index when it matches the file byte for byte), and only the previews and the selected section
+# are decoded, so reading one section of a very large file needs memory proportional to that section.
+_HEADING_OR_FENCE_BYTES_RE = re.compile(rb"^(#{1,6})[ \t]+([^\n]*)$|^ {0,3}(`{3,}|~{3,})([^\n]*)$", re.MULTILINE)
+SECTION_PREVIEW_BYTES = 1200
+
+
+def scan_md_headings_bytes(md_bytes) -> List[List[Any]]:
+    """Returns the [byte_offset, level, title] of each heading in md_bytes (bytes or mmap), skipping fenced code blocks."""
+    headings = []
+    fence = None
+    for m in _HEADING_OR_FENCE_BYTES_RE.finditer(md_bytes):
+        marker = m.group(3)
+        if marker:
+            if fence is None:
+                fence = marker
+            elif marker[:1] == fence[:1] and len(marker) >= len(fence) and not m.group(4).strip():
+                fence = None
+        elif fence is None:
+            headings.append([m.start(), len(m.group(1)), m.group(2).decode("utf-8", errors="replace").strip()])
+    return headings
+
+
+def load_byte_headings(md_file_path: str, md_bytes) -> List[List[Any]]:
+    # The sidecar's byte offsets count the decoded text, so they only apply when that is exactly the file's bytes
+    # (no "\r\n" line endings).
+    try:
+        st = os.stat(md_file_path)
+        with open(_section_index_path(md_file_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if (index.get("version") == SECTION_INDEX_VERSION and index.get("mtime_ns") == st.st_mtime_ns
+                and index.get("size") == st.st_size and index.get("byte_length") == st.st_size):
+            return [[byte_offset, level, title] for _, byte_offset, level, title, _ in index["headings"]]
+    except Exception:
+        pass
+    return scan_md_headings_bytes(md_bytes)
+
+
+def decode_md_bytes(md_bytes, start: int, end: int) -> str:
+    # Same newline handling as reading the file in text mode.
+    return md_bytes[start:end].decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def flatten_section_hierarchy(md_bytes, headings: List[List[Any]]) -> List[Dict]:
+    """
+    For each section (spanning its subsections too), produce its parent chain (list of heading_lines of its
+    parents, root-first). Offsets are byte offsets; "content" holds only a decoded preview of the section.
+    """
+    size = len(md_bytes)
+    if not headings:
         return [{
-            "level": 0,
-            "title": "",
-            "heading_line": "",
-            "content": md_content,
-            "start_idx": 0,
-            "end_idx": len(md_content),
-            "parent_indices": []
+            "section": {"level": 0, "title": "", "heading_line": "", "content": decode_md_bytes(md_bytes, 0, SECTION_PREVIEW_BYTES), "start_idx": 0, "end_idx": size},
+            "section_full_hierarchy": []
         }]
-    # Get char offset for each line
-    line_start_char_indices = []
-    char_count = 0
-    for line in lines:
-        line_start_char_indices.append(char_count)
-        char_count += len(line)
-    # Build sections with start/end char indices
-    sections = []
-    for idx, h in enumerate(heading_infos):
-        level = h["level"]
-        title = h["title"]
-        heading_line = h["heading_line"]
-        line_idx = h["line_idx"]
-        start_idx = line_start_char_indices[line_idx]
-        # Find next heading of level <= this one, or end of file
-        next_start = len(md_content)
-        for j in range(idx + 1, len(heading_infos)):
-            if heading_infos[j]["level"] <= level:
-                next_line_idx = heading_infos[j]["line_idx"]
-                next_start = line_start_char_indices[next_line_idx]
-                break
-        end_idx = next_start
-        sections.append({
-            "idx": idx,
-            "level": level,
-            "title": title,
-            "heading_line": heading_line,
-            "start_idx": start_idx,
-            "end_idx": end_idx,
-            "parent_idx": None,   # to be filled
-        })
-    # Set parent_idx for each section
-    for idx, sec in enumerate(sections):
-        # The parent is the nearest previous heading of lower level
-        parent_idx = None
-        for j in range(idx - 1, -1, -1):
-            if sections[j]["level"] < sec["level"]:
-                parent_idx = j
-                break
-        sec["parent_idx"] = parent_idx
-    return sections
-
-def flatten_section_hierarchy(sections: List[Dict]) -> List[Dict]:
-    # For each section, produce its parent chain (list of heading_lines of its parents, root-first)
-    flat = []
-    for sec in sections:
-        hierarchy = []
-        parent_idx = sec.get("parent_idx")
-        while parent_idx is not None:
-            parent = sections[parent_idx]
-            hierarchy.append(parent["heading_line"])
-            parent_idx = parent.get("parent_idx")
-        hierarchy = list(reversed(hierarchy))
-        flat.append({
-            "section": sec,
-            "section_full_hierarchy": hierarchy
-        })
+    flat, stack = [], []
+    for start_idx, level, title in headings:
+        # A section ends where the next heading of the same or a higher level starts.
+        while stack and stack[-1]["section"]["level"] >= level:
+            stack.pop()["section"]["end_idx"] = start_idx
+        line_end = md_bytes.find(b"\n", start_idx)
+        entry = {
+            "section": {
+                "level": level,
+                "title": title,
+                "heading_line": decode_md_bytes(md_bytes, start_idx, size if line_end == -1 else line_end).rstrip("\n"),
+                "start_idx": start_idx,
+                "end_idx": size,
+            },
+            "section_full_hierarchy": [parent["section"]["heading_line"] for parent in stack]
+        }
+        flat.append(entry)
+        stack.append(entry)
+    for entry in flat:
+        sec = entry["section"]
+        sec["content"] = decode_md_bytes(md_bytes, sec["start_idx"], min(sec["end_idx"], sec["start_idx"] + SECTION_PREVIEW_BYTES))
     return flat
 
 async def find_most_relevant_section(flat_sections: List[Dict], prompt: str) -> Optional[int]:
     if not flat_sections:
         return None
-    # Give LLM a description of each section (title and first 100 chars of content)
-    sections_description = "\n".join(
-        [f"{i}: Title: '{s['section']['title']}', Heading: '{s['section']['heading_line']}', Content (first 100 chars): '{s['section']['start_idx']}-{s['section']['end_idx']} {'' if s['section']['start_idx'] == s['section']['end_idx'] else ''}{prompt[:0]}...'" for i, s in enumerate(flat_sections)]
-    )
-    # For better LLM selection, actually preview the content
+    candidates, exact_idx = preselect_sections([
+        {"title": s["section"]["title"], "full_title": " > ".join(s["section_full_hierarchy"] + [s["section"]["heading_line"]]), "content": s["section"]["content"]}
+        for s in flat_sections
+    ], prompt)
+    if exact_idx is not None:
+        return exact_idx
+    # For better LLM selection, preview the content of each candidate section
     preview_lines = []
-    for i, s in enumerate(flat_sections):
-        sec = s['section']
+    for i in candidates:
+        sec = flat_sections[i]['section']
         # Only show first 100 chars for the preview
-        preview_content = ""
-        if "full_md_content" in s:
-            preview_content = s["full_md_content"][sec["start_idx"]:sec["end_idx"]][:100].replace('\n', ' ')
-        else:
-            preview_content = ""
+        preview_content = sec["content"][:100].replace('\n', ' ')
         preview_lines.append(
             f"{i}: Title: '{sec['title']}', Heading: '{sec['heading_line']}', Content (first 100 chars): '{preview_content}...'"
         )
@@ -146,7 +253,7 @@ async def find_most_relevant_section(flat_sections: List[Dict], prompt: str) ->
         result = json.loads(message)
         if result.get("relevant") is True and isinstance(result.get("section_index"), int):
             idx = result["section_index"]
-            if 0 <= idx < len(flat_sections):
+            if idx in candidates:
                 return idx
         return None
     except Exception:
@@ -165,36 +272,34 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         output.explanation = f"File not found: {md_file_path}"
         return output
 
-    try:
-        with open(md_file_path, "r", encoding="utf-8") as f:
-            md_content = f.read()
-    except Exception as e:
-        output.explanation = f"Failed to read file {md_file_path}: {str(e)}"
-        return output
-
-    sections = parse_md_sections(md_content)
-    for sec in sections:
-        sec["full_md_content"] = md_content
-    flat_sections = flatten_section_hierarchy(sections)
-    # Add full_md_content for previewing in LLM prompt
-    for s in flat_sections:
-        s["full_md_content"] = md_content
-
     prompt = inputs.prompt.strip()
     if not prompt:
         output.explanation = "No prompt provided to select a section."
         return output
 
-    relevant_idx = await find_most_relevant_section(flat_sections, prompt)
-    if relevant_idx is None:
-        output.explanation = "No relevant section found for the given prompt."
+    try:
+        with open(md_file_path, "rb") as f:
+            # mmap cannot map an empty file.
+            md_bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+    except Exception as e:
+        output.explanation = f"Failed to read file {md_file_path}: {str(e)}"
         return output
 
-    selected = flat_sections[relevant_idx]
-    section = selected["section"]
+    try:
+        flat_sections = flatten_section_hierarchy(md_bytes, load_byte_headings(md_file_path, md_bytes))
+
+        relevant_idx = await find_most_relevant_section(flat_sections, prompt)
+        if relevant_idx is None:
+            output.explanation = "No relevant section found for the given prompt."
+            return output
 
-    output.section_title = section.get("heading_line", "")
-    output.section_content = md_content[section["start_idx"]:section["end_idx"]]
-    output.section_full_hierarchy = selected.get("section_full_hierarchy", [])
+        selected = flat_sections[relevant_idx]
+        section = selected["section"]
 
-    return output
\ No newline at end of file
+        output.section_title = section.get("heading_line", "")
+        output.section_content = decode_md_bytes(md_bytes, section["start_idx"], section["end_idx"])
+        output.section_full_hierarchy = selected.get("section_full_hierarchy", [])
+        return output
+    finally:
+        if isinstance(md_bytes, mmap.mmap):
+            md_bytes.close()
@@ -4,10 +4,15 @@
 # ]
 # ///
 
-from typing import Any, Optional, List, Dict, Tuple
+from typing import Any, Optional, List, Dict, Set, Tuple
+import asyncio
 import os
 import re
 import json
+import hashlib
+import math
+import bisect
+import difflib
 from shinkai_local_tools import shinkai_llm_prompt_processor
 
 class CONFIG:
@@ -16,69 +21,286 @@ class CONFIG:
 class INPUTS:
     prompt: str
     md_file_path: str
+    prompts: Optional[List[str]] = None
 
 class OUTPUT:
     updated_file_path: Optional[str] = None
     action_done: Optional[str] = None
     original_content: Optional[str] = None
     new_section_content: Optional[str] = None
+    changed_sections: Optional[List[str]] = None
+    diff: Optional[str] = None
+    batch_results: Optional[List[Dict[str, Any]]] = None
 
-def parse_md_sections(md_content: str):
-    lines = md_content.splitlines(keepends=True)
-    headings = []
-    for i, line in enumerate(lines):
-        m = re.match(r'^(#{1,6})\s+(.*)$', line)
-        if m:
-            level = len(m.group(1))
-            title = m.group(2).strip()
-            headings.append((i, level, title))
+# --------------------------- Section index ---------------------------
+# Shared by the markdown-editing tools (adder, updater, mover, deleter, reader, architecture parser). Each tool is
+# shipped as a single file, so this block is copied into each of them with only the helpers that tool uses; a
+# helper that appears in several tools must be kept identical in all of them.
+#
+# The headings of a file are cached in a hidden sidecar file next to it (".<name>.sections.json"), keyed on
+# the file's mtime and size. Headings inside fenced code blocks are ignored. After an edit, only the lines
+# touched by the splice are re-scanned; everything after them is shifted. Each heading carries a hash of its
+# section's own content (up to the next heading), so edits that change nothing can be detected and skipped.
+#
+# Edits are made on an MdDocument, a piece table over the file's text: a splice shares the existing text instead
+# of copying the document, and writes stream the pieces to a temporary file that is fsynced and renamed over the
+# original, so an interrupted write never truncates the file.
+
+SECTION_INDEX_VERSION = 2
+_HEADING_OR_FENCE_RE = re.compile(r"^(#{1,6})[ \t]+([^\n]*)$|^ {0,3}(`{3,}|~{3,})([^\n]*)$", re.MULTILINE)
+_FENCE_LINE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})", re.MULTILINE)
+
+
+def scan_md_headings(md_content: str, start: int = 0, end: Optional[int] = None) -> Tuple[List[List[Any]], List[List[int]]]:
+    """
+    Returns the [offset, level, title] of each heading in md_content[start:end] and the [start, end) ranges of its
+    fenced code blocks. A fence left open runs to the end of the document and is recorded with an end of -1.
+    """
+    end = len(md_content) if end is None else end
+    headings, fences = [], []
+    fence, fence_start = None, 0
+    for m in _HEADING_OR_FENCE_RE.finditer(md_content, start, end):
+        marker = m.group(3)
+        if marker:
+            if fence is None:
+                fence, fence_start = marker, m.start()
+            elif marker[0] == fence[0] and len(marker) >= len(fence) and not m.group(4).strip():
+                fences.append([fence_start, min(m.end() + 1, end)])
+                fence = None
+        elif fence is None:
+            headings.append([m.start(), len(m.group(1)), m.group(2).strip()])
+    if fence is not None:
+        fences.append([fence_start, -1])
+    return headings, fences
+
+
+def _add_byte_offsets(md_content: str, headings: List[List[Any]], char_pos: int = 0, byte_pos: int = 0) -> List[List[Any]]:
+    # Turns [offset, level, title] into [offset, byte_offset, level, title], counting bytes from a known anchor.
+    result = []
+    for offset, level, title in headings:
+        byte_pos += len(md_content[char_pos:offset].encode("utf-8"))
+        char_pos = offset
+        result.append([offset, byte_pos, level, title])
+    return result
+
+
+def section_hash(section_content: str) -> str:
+    return hashlib.blake2b(section_content.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _add_section_hashes(md_content, headings: List[List[Any]], start: int = 0, end: Optional[int] = None) -> List[List[Any]]:
+    # Sets the hash (the 5th field) of headings[start:end] in place; each section's own content ends at the next heading.
+    end = len(headings) if end is None else end
+    for i in range(start, end):
+        section_end = headings[i + 1][0] if i + 1 < len(headings) else len(md_content)
+        headings[i] = headings[i][:4] + [section_hash(md_content[headings[i][0]:section_end])]
+    return headings
+
+
+def build_section_index(md_content: str) -> Dict[str, Any]:
+    md_content = str(md_content)
+    headings, fences = scan_md_headings(md_content)
+    return {
+        "version": SECTION_INDEX_VERSION,
+        "length": len(md_content),
+        "byte_length": len(md_content.encode("utf-8")),
+        "headings": _add_section_hashes(md_content, _add_byte_offsets(md_content, headings)),
+        "fences": fences,
+    }
+
+
+def _section_index_path(md_file_path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(md_file_path))
+    return os.path.join(directory, f".{name}.sections.json")
+
+
+def load_section_index(md_file_path: str, md_content: str) -> Dict[str, Any]:
+    """Returns the cached index of the file if it still matches the file's mtime and size, otherwise scans md_content and caches it."""
+    try:
+        st = os.stat(md_file_path)
+        with open(_section_index_path(md_file_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if (index.get("version") == SECTION_INDEX_VERSION and index.get("mtime_ns") == st.st_mtime_ns
+                and index.get("size") == st.st_size and index.get("length") == len(md_content)):
+            return index
+    except Exception:
+        pass
+    index = build_section_index(md_content)
+    save_section_index(md_file_path, index)
+    return index
+
+
+def save_section_index(md_file_path: str, index: Dict[str, Any]):
+    """Stores the index as describing the current state of the file. Failures only cost a re-scan next time."""
+    path = _section_index_path(md_file_path)
+    try:
+        st = os.stat(md_file_path)
+        index["mtime_ns"], index["size"] = st.st_mtime_ns, st.st_size
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(f"{path}.tmp", path)
+    except Exception:
+        pass
+
+
+class MdDocument:
+    """
+    Piece table over a markdown text: a list of (buffer, start, end) pieces pointing into the original text and the
+    inserted strings. splice() returns a new document sharing every buffer, so an edit costs O(pieces), not O(text).
+    len(), slicing (which returns a str), find() and rfind() behave as on a str.
+    """
+
+    WRITE_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, text: str = "", pieces: Optional[List[Tuple[str, int, int]]] = None):
+        self._pieces = pieces if pieces is not None else ([(text, 0, len(text))] if text else [])
+        self._starts = []
+        length = 0
+        for _, s, e in self._pieces:
+            self._starts.append(length)
+            length += e - s
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return "".join(buf[s:e] for buf, s, e in self._pieces)
+
+    def _chunks(self, start: int, end: int):
+        # (buffer, buffer_start, buffer_end, document offset of buffer index 0) for the text in [start, end).
+        i = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        while start < end and i < len(self._pieces) and self._starts[i] < end:
+            buf, s, e = self._pieces[i]
+            base = self._starts[i] - s
+            lo, hi = max(s, start - base), min(e, end - base)
+            if lo < hi:
+                yield buf, lo, hi, base
+            i += 1
+
+    def __getitem__(self, key) -> str:
+        if isinstance(key, int):
+            pos = key + self._length if key < 0 else key
+            if not 0 <= pos < self._length:
+                raise IndexError("MdDocument index out of range")
+            return self[pos:pos + 1]
+        start, end, _ = key.indices(self._length)
+        return "".join(buf[lo:hi] for buf, lo, hi, _ in self._chunks(start, end))
+
+    def find(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        start, end, _ = slice(start, end).indices(self._length)
+        if len(sub) != 1:
+            pos = self[start:end].find(sub)
+            return pos + start if pos != -1 else -1
+        for buf, lo, hi, base in self._chunks(start, end):
+            pos = buf.find(sub, lo, hi)
+            if pos != -1:
+                return pos + base
+        return -1
+
+    def rfind(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        start, end, _ = slice(start, end).indices(self._length)
+        if len(sub) != 1:
+            pos = self[start:end].rfind(sub)
+            return pos + start if pos != -1 else -1
+        for buf, lo, hi, base in reversed(list(self._chunks(start, end))):
+            pos = buf.rfind(sub, lo, hi)
+            if pos != -1:
+                return pos + base
+        return -1
+
+    def splice(self, start: int, end: int, replacement: str) -> "MdDocument":
+        pieces = [(buf, lo, hi) for buf, lo, hi, _ in self._chunks(0, start)]
+        if replacement:
+            pieces.append((replacement, 0, len(replacement)))
+        pieces.extend((buf, lo, hi) for buf, lo, hi, _ in self._chunks(end, self._length))
+        return MdDocument(pieces=pieces)
+
+    def write_to(self, f):
+        for buf, s, e in self._pieces:
+            for pos in range(s, e, self.WRITE_CHUNK_SIZE):
+                f.write(buf[pos:min(pos + self.WRITE_CHUNK_SIZE, e)])
+
+
+def splice_md_content(md_content, index: Dict[str, Any], start: int, end: int, replacement: str) -> Tuple[MdDocument, Dict[str, Any]]:
+    """
+    Replaces md_content[start:end] (a str or an MdDocument) and returns the new document with its index,
+    re-scanning only the lines the splice touched.
+    """
+    md_content = md_content if isinstance(md_content, MdDocument) else MdDocument(md_content)
+    new_content = md_content.splice(start, end, replacement)
+    old_line_end = md_content.find("\n", end)
+    old_line_end = len(md_content) if old_line_end == -1 else old_line_end
+    line_start = md_content.rfind("\n", 0, start) + 1
+    new_line_end = new_content.find("\n", start + len(replacement))
+    new_line_end = len(new_content) if new_line_end == -1 else new_line_end
+    new_lines = new_content[line_start:new_line_end]
+    if _FENCE_LINE_RE.search(md_content[line_start:old_line_end]) or _FENCE_LINE_RE.search(new_lines):
+        # Opening or closing a code fence can hide or reveal headings anywhere below it.
+        return new_content, build_section_index(new_content)
+
+    delta = len(new_content) - len(md_content)
+    byte_delta = len(replacement.encode("utf-8")) - len(md_content[start:end].encode("utf-8"))
+    headings = [h for h in index["headings"] if h[0] < line_start]
+    # The section the splice starts in and every heading found in the re-scanned lines get a new hash.
+    rehash_start = max(len(headings) - 1, 0)
+    if not any(s <= line_start and (line_start < e or e == -1) for s, e in index["fences"]):
+        anchor = headings[-1] if headings else [0, 0]
+        region, _ = scan_md_headings(new_lines)
+        region = [[offset + line_start, level, title] for offset, level, title in region]
+        headings.extend(_add_byte_offsets(new_content, region, anchor[0], anchor[1]))
+    rehash_end = len(headings)
+    headings.extend([h[0] + delta, h[1] + byte_delta, h[2], h[3], h[4]] for h in index["headings"] if h[0] > old_line_end)
+    _add_section_hashes(new_content, headings, rehash_start, rehash_end)
+
+    fences = []
+    for s, e in index["fences"]:
+        if e != -1 and e <= line_start:
+            fences.append([s, e])
+        elif s > old_line_end:
+            fences.append([s + delta, -1 if e == -1 else e + delta])
+        else:
+            fences.append([s, -1 if e == -1 else e + delta])
+    new_index = dict(index, headings=headings, fences=fences, length=len(new_content), byte_length=index["byte_length"] + byte_delta)
+    new_index.pop("mtime_ns", None)
+    return new_content, new_index
+
+
+def build_section_tree(md_content: str, index: Dict[str, Any]) -> List[Dict]:
+    """Builds the section hierarchy from the index. Each section's content runs up to the next heading of any level."""
+    headings = index["headings"]
     if not headings:
         return [{
             "level": 0,
             "title": "",
-            "content": md_content,
+            "heading_line": "",
+            "content": md_content[:],
             "start_idx": 0,
             "end_idx": len(md_content),
             "subsections": []
         }]
-    line_start_char_indices = []
-    char_count = 0
-    for line in lines:
-        line_start_char_indices.append(char_count)
-        char_count += len(line)
-    sections = []
-    for i, (line_idx, level, title) in enumerate(headings):
-        start_idx = line_start_char_indices[line_idx]
-        if i + 1 < len(headings):
-            next_line_idx = headings[i + 1][0]
-            end_idx = line_start_char_indices[next_line_idx]
-        else:
-            end_idx = len(md_content)
-        content = md_content[start_idx:end_idx]
-        sections.append({
+    result, stack = [], []
+    for i, (start_idx, _, level, title, _) in enumerate(headings):
+        end_idx = headings[i + 1][0] if i + 1 < len(headings) else len(md_content)
+        line_end = md_content.find("\n", start_idx, end_idx)
+        sec = {
             "level": level,
             "title": title,
-            "content": content,
+            "heading_line": md_content[start_idx:end_idx if line_end == -1 else line_end],
+            "content": md_content[start_idx:end_idx],
             "start_idx": start_idx,
             "end_idx": end_idx,
             "subsections": []
-        })
-
-    def build_hierarchy(secs: List[Dict]) -> List[Dict]:
-        result = []
-        stack = []
-        for sec in secs:
-            while stack and stack[-1]["level"] >= sec["level"]:
-                stack.pop()
-            if stack:
-                stack[-1]["subsections"].append(sec)
-            else:
-                result.append(sec)
-            stack.append(sec)
-        return result
+        }
+        while stack and stack[-1]["level"] >= level:
+            stack.pop()
+        if stack:
+            stack[-1]["subsections"].append(sec)
+        else:
+            result.append(sec)
+        stack.append(sec)
+    return result
 
-    hierarchical_sections = build_hierarchy(sections)
-    return hierarchical_sections
 
 def flatten_sections_for_prompt_with_refs(sections: List[Dict], parent_titles: List[str] = None) -> List[Tuple[Dict, Dict]]:
     if parent_titles is None:
@@ -89,6 +311,7 @@ def flatten_sections_for_prompt_with_refs(sections: List[Dict], parent_titles: L
         flat = {
             "full_title": full_title,
             "level": sec["level"],
+            "title": sec["title"],
             "content": sec["content"],
             "start_idx": sec["start_idx"],
             "end_idx": sec["end_idx"],
@@ -98,6 +321,7 @@ def flatten_sections_for_prompt_with_refs(sections: List[Dict], parent_titles: L
             result.extend(flatten_sections_for_prompt_with_refs(sec["subsections"], parent_titles + [sec["title"]]))
     return result
 
+
 def get_section_full_range(section: Dict) -> Tuple[int, int]:
     start = section["start_idx"]
     max_end = section["end_idx"]
@@ -111,11 +335,232 @@ def get_section_full_range(section: Dict) -> Tuple[int, int]:
     traverse(section)
     return start, max_end
 
+
+# Sections beyond this many are not shown to the LLM; the local ranking keeps the most promising ones.
+PRESELECT_TOP_K = 20
+_PROMPT_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "about", "into", "from", "by", "at",
+    "is", "it", "this", "that", "section", "sections", "heading", "part", "please", "add", "update", "delete",
+    "remove", "move", "read", "edit", "rewrite", "new", "before", "after", "above", "below",
+}
+
+
+def _stem(token: str) -> str:
+    # Just enough stemming for "prices", "pricing" and "price" to meet.
+    for suffix in ("ing", "es", "ed", "s", "e"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def _text_tokens(text: str) -> List[str]:
+    return [_stem(t) for t in re.findall(r"\w+", text.lower()) if t not in _PROMPT_STOPWORDS]
+
+
+def _normalized_title(title: str) -> str:
+    return " ".join(re.findall(r"\w+", title.lower()))
+
+
+_QUOTED_RE = re.compile(r'"([^"]+)"|\u201c([^\u201d]+)\u201d|`([^`]+)`|\u00ab([^\u00bb]+)\u00bb|(?<!\w)[\'\u2018]([^\'\u2019]+)[\'\u2019](?!\w)')
+
+
+def _quoted_phrases(prompt: str) -> Set[str]:
+    return {_normalized_title(next(g for g in m.groups() if g)) for m in _QUOTED_RE.finditer(prompt)}
+
+
+def _names_section_exactly(sec: Dict, prompt_tokens: List[str], quoted: Set[str]) -> bool:
+    """The prompt quotes the section's title (or title path), or is only its title plus instruction words."""
+    if _normalized_title(sec["title"]) in quoted or _normalized_title(sec["full_title"]) in quoted:
+        return True
+    title_tokens = _text_tokens(sec["title"])
+    return bool(title_tokens) and title_tokens == prompt_tokens
+
+
+def preselect_sections(sections_flat: List[Dict], prompt: str, top_k: int = PRESELECT_TOP_K) -> Tuple[List[int], Optional[int]]:
+    """
+    Ranks sections against the prompt locally: BM25 over each section's title path and opening text, plus a
+    fuzzy match of its own title words (typos, plurals). Returns the indices of the top_k candidates in document
+    order, and the index of the section the prompt names with high confidence (None otherwise): its title is
+    quoted or is the whole prompt, no other section matches that way, and it is also the top ranked section.
+    A title merely appearing in the prompt only makes sure that section is among the candidates.
+    """
+    prompt_norm = f" {_normalized_title(prompt)} "
+    named = []
+    for i, sec in enumerate(sections_flat):
+        title = _normalized_title(sec["title"])
+        if len(title) >= 3 and f" {title} " in prompt_norm:
+            named.append((i, title))
+    # "Beta" is not a separate match when the prompt names "Beta child".
+    named = [(i, t) for i, t in named if not any(t != other and f" {t} " in f" {other} " for _, other in named)]
+    named_idx = named[0][0] if len(named) == 1 else None
+
+    query_tokens = _text_tokens(prompt)
+    query = set(query_tokens)
+    docs = [_text_tokens(f"{sec['full_title']} {sec['content'][:300]}") for sec in sections_flat]
+    n_docs = len(docs)
+    avg_len = (sum(len(d) for d in docs) / n_docs or 1.0) if n_docs else 1.0
+    doc_freq: Dict[str, int] = {}
+    for d in docs:
+        for t in set(d):
+            doc_freq[t] = doc_freq.get(t, 0) + 1
+    scores = []
+    for sec, d in zip(sections_flat, docs):
+        score = 0.0
+        for t in query:
+            tf = d.count(t)
+            if tf:
+                idf = math.log(1 + (n_docs - doc_freq[t] + 0.5) / (doc_freq[t] + 0.5))
+                score += idf * tf * 2.5 / (tf + 1.5 * (0.25 + 0.75 * len(d) / avg_len))
+        title_words = _text_tokens(sec["title"])
+        if title_words and query:
+            fuzzy = sum(1 for w in title_words if difflib.get_close_matches(w, query, n=1, cutoff=0.8))
+            score += 2.0 * fuzzy / len(title_words)
+        scores.append(score)
+    ranked = sorted(range(n_docs), key=lambda i: scores[i], reverse=True)
+
+    exact_idx = None
+    quoted = _quoted_phrases(prompt)
+    exact = [i for i, sec in enumerate(sections_flat) if _names_section_exactly(sec, query_tokens, quoted)]
+    if len(exact) == 1 and ranked[0] == exact[0] and (n_docs == 1 or scores[ranked[0]] > scores[ranked[1]]):
+        exact_idx = exact[0]
+
+    if n_docs <= top_k:
+        return list(range(n_docs)), exact_idx
+    ranked = ranked[:top_k]
+    if named_idx is not None and named_idx not in ranked:
+        ranked[-1] = named_idx
+    return sorted(ranked), exact_idx
+
+
+async def find_relevant_sections_batch(sections_flat: List[Dict], prompts: List[str]) -> List[Optional[int]]:
+    """
+    One relevance pass for several instructions: instructions naming a section title exactly are resolved
+    locally, all the others share a single LLM call over the union of their candidate sections.
+    """
+    results: List[Optional[int]] = [None] * len(prompts)
+    pending, candidates = [], set()
+    for n, prompt in enumerate(prompts):
+        prompt_candidates, exact_idx = preselect_sections(sections_flat, prompt)
+        if exact_idx is not None:
+            results[n] = exact_idx
+        else:
+            pending.append(n)
+            candidates.update(prompt_candidates)
+    if not pending or not sections_flat:
+        return results
+    sections_description = "\n".join(
+        [f"{i}: Title: '{sections_flat[i]['full_title']}', Content (first 100 chars): '{sections_flat[i]['content'][:100].replace(chr(10), ' ')}...'" for i in sorted(candidates)]
+    )
+    instructions = "\n".join(f"{n}: {prompts[n]}" for n in pending)
+    llm_prompt = (
+        f"You are helping to select the most relevant markdown section for each of several user instructions.\n"
+        f"Instructions:\n{instructions}\n"
+        f"Here are the markdown sections:\n{sections_description}\n"
+        f"Output a JSON object with one key, 'selections': a list with one object per instruction, with keys:\n"
+        f" - 'instruction': the instruction number.\n"
+        f" - 'relevant': true if any section is relevant to the instruction, false otherwise.\n"
+        f" - 'section_index': index of the most relevant section if relevant is true, else null.\n"
+        f"Only output the JSON object, no extra text.\n"
+    )
+    response = await shinkai_llm_prompt_processor({"format": "json", "prompt": llm_prompt})
+    message = response.get("message", "").strip("```json\n").strip()
+    try:
+        for selection in json.loads(message).get("selections", []):
+            n, idx = selection.get("instruction"), selection.get("section_index")
+            n = int(n) if isinstance(n, str) and n.isdigit() else n
+            if n in pending and selection.get("relevant") is True and idx in candidates:
+                results[n] = idx
+    except Exception:
+        pass
+    return results
+
+
+def write_md_file(md_file_path: str, md_content):
+    """
+    Streams the document (a str or an MdDocument) to a temporary file next to md_file_path, fsyncs it and renames
+    it over the original, so a crash leaves either the old or the new file, never a truncated one.
+    """
+    tmp_path = f"{md_file_path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if isinstance(md_content, MdDocument):
+                md_content.write_to(f)
+            else:
+                f.write(md_content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(md_file_path):
+            os.chmod(tmp_path, os.stat(md_file_path).st_mode & 0o7777)
+        os.replace(tmp_path, md_file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename itself.
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(md_file_path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+
+def group_batch_targets(prompts: List[str], targets: List[Optional[int]], sections_flat: List[Dict], section_refs: List[Dict]) -> Tuple[Dict[Tuple[int, int], List[int]], List[Dict[str, Any]]]:
+    """
+    Groups batched instructions by the full range of their target section. Instructions on the same section
+    share one range; a section nested inside another targeted section is left to the outer one.
+    Returns {(start, end): [instruction numbers]} and a result entry per instruction.
+    """
+    results = [{"prompt": p, "section": None, "status": "No relevant section found."} for p in prompts]
+    by_range: Dict[Tuple[int, int], List[int]] = {}
+    for n, idx in enumerate(targets):
+        if idx is None:
+            continue
+        results[n]["section"] = sections_flat[idx]["full_title"]
+        by_range.setdefault(get_section_full_range(section_refs[idx]), []).append(n)
+    grouped: Dict[Tuple[int, int], List[int]] = {}
+    outer = None
+    for rng in sorted(by_range, key=lambda r: (r[0], -r[1])):
+        if outer is not None and rng[1] <= outer[1]:
+            for n in by_range[rng]:
+                results[n]["status"] = f"Skipped: inside section '{results[grouped[outer][0]]['section']}', which the same batch also targets."
+            continue
+        grouped[rng] = by_range[rng]
+        outer = rng
+    return grouped, results
+
+
+def changed_section_titles(old_index: Dict[str, Any], new_index: Dict[str, Any]) -> List[str]:
+    """Titles of the sections of new_index whose content is not found in old_index (edited or added sections)."""
+    old_hashes = {h[4] for h in old_index["headings"]}
+    return [h[3] for h in new_index["headings"] if h[4] not in old_hashes]
+
+
+def same_section_contents(old_index: Dict[str, Any], new_index: Dict[str, Any]) -> bool:
+    """True when both indexes describe the same sections with the same content. Text before the first heading is not hashed."""
+    return old_index["length"] == new_index["length"] and [h[4] for h in old_index["headings"]] == [h[4] for h in new_index["headings"]]
+
+
+def unified_section_diff(old_content: str, new_content: str, name: str, context_lines: int = 2) -> str:
+    """Compact unified diff of one section, for reporting what an edit changed."""
+    return "".join(difflib.unified_diff(
+        old_content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+        fromfile=f"a/{name}", tofile=f"b/{name}", n=context_lines,
+    ))
+
+# --------------------------- End of section index ---------------------------
+
 async def find_most_relevant_section(sections_flat: List[Dict], prompt: str) -> Optional[int]:
     if not sections_flat:
         return None
+    candidates, exact_idx = preselect_sections(sections_flat, prompt)
+    if exact_idx is not None:
+        return exact_idx
     sections_description = "\n".join(
-        [f"{i}: Title: '{sec['full_title']}', Content (first 100 chars): '{sec['content'][:100].replace(chr(10), ' ')}...'" for i, sec in enumerate(sections_flat)]
+        [f"{i}: Title: '{sections_flat[i]['full_title']}', Content (first 100 chars): '{sections_flat[i]['content'][:100].replace(chr(10), ' ')}...'" for i in candidates]
     )
     llm_prompt = (
         f"You are helping to select the most relevant markdown section for the user query.\n"
@@ -132,7 +577,7 @@ async def find_most_relevant_section(sections_flat: List[Dict], prompt: str) ->
         result = json.loads(message)
         if result.get("relevant") is True and isinstance(result.get("section_index"), int):
             idx = result["section_index"]
-            if 0 <= idx < len(sections_flat):
+            if idx in candidates:
                 return idx
         return None
     except Exception:
@@ -149,6 +594,50 @@ async def update_section_content(original_content: str, section_content: str, ta
     updated_content = response.get("message", "").strip()
     return updated_content
 
+def keep_trailing_newlines(orig_content: str, updated_content: str) -> str:
+    orig_trailing_newlines = len(re.match(r".*?(\n*)$", orig_content, re.DOTALL).group(1))
+    if orig_trailing_newlines == 0:
+        orig_trailing_newlines = 2
+    return updated_content.rstrip('\n') + ("\n" * orig_trailing_newlines)
+
+async def apply_batch_updates(md_file_path: str, md_content: str, index: Dict[str, Any], sections_flat: List[Dict], section_refs: List[Dict], prompts: List[str], output: OUTPUT) -> OUTPUT:
+    # Resolve every target in one relevance pass, edit the sections concurrently, then splice from the end of the
+    # document backwards so earlier offsets stay valid, and write the file once.
+    targets = await find_relevant_sections_batch(sections_flat, prompts)
+    grouped, results = group_batch_targets(prompts, targets, sections_flat, section_refs)
+    ranges = sorted(grouped, reverse=True)
+    tasks = ["\n".join(f"- {prompts[n]}" for n in grouped[rng]) if len(grouped[rng]) > 1 else prompts[grouped[rng][0]] for rng in ranges]
+    updates = await asyncio.gather(*(update_section_content(md_content[s:e], md_content[s:e], task) for (s, e), task in zip(ranges, tasks)))
+
+    new_md_content, new_index = md_content, index
+    diffs = []
+    for (start_idx, end_idx), updated in zip(ranges, updates):
+        original = md_content[start_idx:end_idx]
+        updated = keep_trailing_newlines(original, updated)
+        new_md_content, new_index = splice_md_content(new_md_content, new_index, start_idx, end_idx, updated)
+        diffs.insert(0, unified_section_diff(original, updated, results[grouped[(start_idx, end_idx)][0]]["section"]))
+        for n in grouped[(start_idx, end_idx)]:
+            results[n]["status"] = "Updated." if updated != original else "Unchanged."
+    output.batch_results = results
+    if not ranges:
+        output.action_done = "No relevant section found for any of the batched updates."
+        return output
+    if same_section_contents(index, new_index):
+        output.action_done = "The batched updates did not change any section; the file was not rewritten."
+        return output
+    output.changed_sections = changed_section_titles(index, new_index)
+    output.diff = "".join(diffs)
+    index = new_index
+    try:
+        write_md_file(md_file_path, new_md_content)
+        save_section_index(md_file_path, index)
+        output.updated_file_path = md_file_path
+        output.action_done = f"Updated {len(ranges)} sections for {sum(len(v) for v in grouped.values())} of {len(prompts)} batched instructions."
+        return output
+    except Exception as e:
+        output.action_done = f"Failed to write updated file: {str(e)}"
+        return output
+
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     output = OUTPUT()
 
@@ -172,12 +661,16 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         output.action_done = "File is empty. Cannot update any section."
         return output
 
-    sections = parse_md_sections(md_content)
+    index = load_section_index(md_file_path, md_content)
+    sections = build_section_tree(md_content, index)
     flat_with_refs = flatten_sections_for_prompt_with_refs(sections)
     sections_flat = [item[0] for item in flat_with_refs]
     section_refs = [item[1] for item in flat_with_refs]
 
     prompt = inputs.prompt.strip()
+    if inputs.prompts:
+        batch_prompts = [p.strip() for p in [prompt] + list(inputs.prompts) if isinstance(p, str) and p.strip()]
+        return await apply_batch_updates(md_file_path, md_content, index, sections_flat, section_refs, batch_prompts, output)
 
     relevant_idx = await find_most_relevant_section(sections_flat, prompt)
     if relevant_idx is None:
@@ -190,24 +683,25 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
 
     updated_section_content = await update_section_content(section_full_content, section_full_content, prompt)
 
-    orig_content = section_full_content
-    orig_trailing_newlines = len(re.match(r".*?(\n*)$", orig_content, re.DOTALL).group(1))
-    if orig_trailing_newlines == 0:
-        orig_trailing_newlines = 2
-
-    updated_section_content_stripped = updated_section_content.rstrip('\n')
-    updated_section_content_fixed = updated_section_content_stripped + ("\n" * orig_trailing_newlines)
+    updated_section_content_fixed = keep_trailing_newlines(section_full_content, updated_section_content)
 
-    full_text = md_content
-    new_md_content = full_text[:start_idx] + updated_section_content_fixed + full_text[end_idx:]
+    new_md_content, new_index = splice_md_content(md_content, index, start_idx, end_idx, updated_section_content_fixed)
+    output.original_content = section_full_content
+    output.new_section_content = updated_section_content_fixed
+    if same_section_contents(index, new_index):
+        # Nothing to write; an agent re-applying the same edit in a loop leaves the file (and its mtime) alone.
+        output.action_done = f"Section '{sections_flat[relevant_idx]['full_title']}' is already up to date; the file was not rewritten."
+        output.changed_sections = []
+        return output
+    output.changed_sections = changed_section_titles(index, new_index)
+    output.diff = unified_section_diff(section_full_content, updated_section_content_fixed, sections_flat[relevant_idx]["full_title"])
+    index = new_index
 
     try:
-        with open(md_file_path, "w", encoding="utf-8") as f:
-            f.write(new_md_content)
+        write_md_file(md_file_path, new_md_content)
+        save_section_index(md_file_path, index)
         output.updated_file_path = md_file_path
         output.action_done = f"Section '{sections_flat[relevant_idx]['full_title']}' updated."
-        output.original_content = section_full_content
-        output.new_section_content = updated_section_content_fixed
         return output
     except Exception as e:
         output.action_done = f"Failed to write updated file: {str(e)}"
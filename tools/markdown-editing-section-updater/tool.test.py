@@ -0,0 +1,50 @@
+import random
+
+from tool import MdDocument, build_section_index, splice_md_content
+
+PIECES = ["# A\n", "## B é\n", "text line\n", "```py\n", "```\n", "~~~\n", "### C\n", "\n", "no newline", "#nohead\n", "  ```\n", "# ü title  \n"]
+
+
+def random_markdown(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice(PIECES) for _ in range(n))
+
+
+def test_splice_matches_full_rebuild():
+    # The incrementally updated index must equal a fresh build_section_index of the spliced document,
+    # including splices that open or close fenced code blocks and cut through headings.
+    rng = random.Random(7)
+    for _ in range(2000):
+        md_content = random_markdown(rng, rng.randint(0, 15))
+        index = build_section_index(md_content)
+        for _ in range(4):
+            start = rng.randint(0, len(md_content))
+            end = rng.randint(start, min(len(md_content), start + 30))
+            replacement = random_markdown(rng, rng.randint(0, 3)) + rng.choice(["", "x", "\n"])
+            md_content, index = splice_md_content(md_content, index, start, end, replacement)
+            expected = build_section_index(str(md_content))
+            assert index["headings"] == expected["headings"], (str(md_content), index["headings"], expected["headings"])
+            assert (index["length"], index["byte_length"]) == (expected["length"], expected["byte_length"])
+
+
+def test_md_document_behaves_like_str():
+    rng = random.Random(11)
+    for _ in range(500):
+        text = random_markdown(rng, rng.randint(0, 10))
+        document = MdDocument(text)
+        for _ in range(6):
+            start = rng.randint(0, len(text))
+            end = rng.randint(start, len(text))
+            replacement = random_markdown(rng, rng.randint(0, 2))
+            text = text[:start] + replacement + text[end:]
+            document = document.splice(start, end, replacement)
+            assert str(document) == text and len(document) == len(text)
+            i, j = rng.randint(0, len(text)), rng.randint(0, len(text))
+            assert document[i:j] == text[i:j]
+            assert document.find("\n", i, j) == text.find("\n", i, j)
+            assert document.rfind("\n", i, j) == text.rfind("\n", i, j)
+
+
+if __name__ == "__main__":
+    test_splice_matches_full_rebuild()
+    test_md_document_behaves_like_str()
+    print("All tests passed.")
@@ -4,7 +4,7 @@
 # ]
 # ///
 
-from typing import Any, Optional, List, Dict
+from typing import Any, Optional, List, Dict, Iterable, Tuple
 import os
 import re
 import json
@@ -26,12 +26,26 @@ class OUTPUT:
     original_titles: Optional[List[str]] = None
     intermediary_deterministic_numbered_titles: Optional[List[str]] = None
     final_llm_formatted_section_titles: Optional[List[str]] = None
+    numbering_style: Optional[str] = None
     error_message: Optional[str] = None
 
-def extract_section_titles(md_content: str) -> List[Dict[str, Any]]:
-    lines = md_content.splitlines(keepends=True)
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+
+def extract_section_titles(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Headings of the document, read line by line. Lines inside fenced code blocks are not headings."""
     titles = []
+    fence = None
     for i, line in enumerate(lines):
+        fence_match = _FENCE_RE.match(line)
+        if fence_match:
+            marker = fence_match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence) and not fence_match.group(2).strip():
+                fence = None
+            continue
+        if fence is not None:
+            continue
         m = re.match(r'^(#{1,6})\s+(.*?)(\s*)$', line)
         if m:
             level = len(m.group(1))
@@ -44,9 +58,10 @@ def extract_section_titles(md_content: str) -> List[Dict[str, Any]]:
             })
     return titles
 
-def assign_hierarchical_numbers(titles_info: List[Dict[str, Any]]) -> List[Optional[str]]:
+def assign_hierarchical_counters(titles_info: List[Dict[str, Any]]) -> List[Optional[List[int]]]:
+    """The position of each heading in the hierarchy, e.g. [2, 1] for the first sub-section of the second section."""
     counters = [0] * 6
-    numbered_list = []
+    counter_list = []
     level1_count = sum(1 for t in titles_info if t["level"] == 1)
     is_single_h1_case = level1_count == 1
     first_h1_processed = False
@@ -54,16 +69,17 @@ def assign_hierarchical_numbers(titles_info: List[Dict[str, Any]]) -> List[Optio
     for t in titles_info:
         level = t["level"]
         if is_single_h1_case and level == 1 and not first_h1_processed:
-            numbered_list.append(None)
+            counter_list.append(None)
             first_h1_processed = True
             continue
         counters[level - 1] += 1
         for i in range(level, len(counters)):
             counters[i] = 0
-        numbering_parts = [str(c) for c in counters[:level] if c > 0]
-        numbering_str = ".".join(numbering_parts) + "."
-        numbered_list.append(numbering_str)
-    return numbered_list
+        counter_list.append([c for c in counters[:level] if c > 0])
+    return counter_list
+
+def assign_hierarchical_numbers(titles_info: List[Dict[str, Any]]) -> List[Optional[str]]:
+    return [None if path is None else ".".join(str(c) for c in path) + "." for path in assign_hierarchical_counters(titles_info)]
 
 def prefix_numbering_to_titles(titles_info: List[Dict[str, Any]], numbering: List[Optional[str]]) -> List[str]:
     result = []
@@ -75,6 +91,257 @@ def prefix_numbering_to_titles(titles_info: List[Dict[str, Any]], numbering: Lis
             result.append(f"{num} {original_title}")
     return result
 
+# --------------------------- Rule-based numbering styles ---------------------------
+# The common numbering styles are applied without the LLM. A style is a list of counter kinds (the last one repeats
+# for deeper levels), a separator, a suffix, and whether only the heading's own counter is shown (outline style,
+# e.g. "I." > "A." > "1.") or its full path (e.g. "1.2.3.").
+
+# A numbering prefix candidate: "1.", "1.2", "2.1)", "IV.", "b)", "A.1." or "Appendix C:". Counters are all digits, all
+# upper-case or all lower-case letters. Whether a candidate is really numbering is decided across sibling headings.
+_NUMBERING_PREFIX_RE = re.compile(
+    r"^(?P<appendix>(?:[Aa]ppendix|APPENDIX)\s+)?"
+    r"(?P<counters>(?:\d+|[A-Z]+|[a-z]+)(?:\.(?:\d+|[A-Z]+|[a-z]+))*)"
+    r"(?P<suffix>[.):\-]?)\s+"
+)
+_STYLE_PATTERN_RE = re.compile(r"(?<![\w.])((?:\d+|[A-Za-z]+)(?:[.\-](?:\d+|[A-Za-z]+))*)([.)]?)(?![\w])")
+_OUTLINE_PATTERN_RE = re.compile(r"(?<![\w.])((?:\d+|[A-Za-z]+)[.)])(?:\s*/\s*(?:\d+|[A-Za-z]+)[.)])+")
+# Instructions mentioning any of these are left to the LLM.
+_LLM_ONLY_CUES = ("bold", "italic", "emoji", "word", "spell", "translat", "language", "superscript", "prefix", "chapter ")
+_GENERIC_PROMPT_WORDS = {
+    "a", "the", "all", "of", "to", "in", "and", "as", "is", "it", "them", "their", "please", "just", "again",
+    "renumber", "re", "number", "numbers", "numbering", "numbered", "section", "sections", "title", "titles",
+    "heading", "headings", "update", "fix", "correct", "apply", "use", "format", "style", "keep", "like", "etc",
+    "hierarchical", "hierarchy", "decimal", "standard", "default", "consistent", "consistently", "markdown", "document",
+    "with", "using", "for", "every", "each", "level", "levels", "scheme", "system",
+}
+# Words that only describe the style they come with; a prompt made of them and generic words is fully understood.
+_SUFFIX_WORDS = ("no", "without", "trailing", "final", "ending", "dot", "dots", "period", "periods", "point")
+_REMOVE_NUMBERING_WORDS = ("remove", "strip", "drop", "delete", "no", "without", "unnumbered", "from")
+_CASE_WORDS = ("upper", "uppercase", "capital", "capitals", "lower", "lowercase", "small", "case")
+_ROMAN_WORDS = ("roman", "numeral", "numerals", *_CASE_WORDS)
+_LETTER_WORDS = ("letter", "letters", "lettered", "alphabet", "alphabetic", "alphabetical", *_CASE_WORDS)
+_ROMAN_NUMERALS = [(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"), (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+
+def to_roman(n: int) -> str:
+    result = ""
+    for value, numeral in _ROMAN_NUMERALS:
+        while n >= value:
+            result += numeral
+            n -= value
+    return result
+
+def to_letters(n: int) -> str:
+    # 1 -> A, 26 -> Z, 27 -> AA
+    result = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        result = chr(ord("A") + rem) + result
+    return result
+
+def format_counter(kind: str, n: int) -> str:
+    if kind == "upper-roman":
+        return to_roman(n)
+    if kind == "lower-roman":
+        return to_roman(n).lower()
+    if kind == "upper-letter":
+        return to_letters(n)
+    if kind == "lower-letter":
+        return to_letters(n).lower()
+    return str(n)
+
+def counter_kind(component: str) -> str:
+    if component.isdigit():
+        return "arabic"
+    if re.fullmatch(r"[IVXLCDM]+", component) and (len(component) > 1 or component == "I"):
+        return "upper-roman"
+    if re.fullmatch(r"[ivxlcdm]+", component) and (len(component) > 1 or component == "i"):
+        return "lower-roman"
+    return "upper-letter" if component.isupper() else "lower-letter"
+
+def make_style(name: str, kinds: List[str], separator: str = ".", suffix: str = ".", outline: bool = False, top_prefix: str = "") -> Dict[str, Any]:
+    return {"name": name, "kinds": kinds, "separator": separator, "suffix": suffix, "outline": outline, "top_prefix": top_prefix}
+
+def prompt_fully_understood(prompt: str, consumed_spans: List[Tuple[int, int]], style_words: Iterable[str], allow_single_letters: bool = False) -> bool:
+    """
+    True when nothing but filler is left of the prompt once the numbering examples it was parsed from
+    (consumed_spans) and the words describing the chosen style are taken out. Anything else, such as a second
+    numbering example, "subsections" or "skip the intro", is an instruction the rules would silently drop.
+    """
+    remaining, pos = [], 0
+    for start, end in sorted(consumed_spans):
+        remaining.append(prompt[pos:start])
+        pos = end
+    remaining.append(prompt[pos:])
+    allowed = _GENERIC_PROMPT_WORDS | set(style_words)
+    for token in re.findall(r"[a-z]+|\d+", " ".join(remaining).lower()):
+        if token in allowed or (allow_single_letters and len(token) == 1 and token.isalpha()):
+            continue
+        return False
+    return True
+
+def parse_numbering_style(user_prompt: str) -> Optional[Dict[str, Any]]:
+    """Maps the user's instruction to a numbering style, or returns None when it needs the LLM."""
+    prompt = user_prompt.strip()
+    lower = prompt.lower()
+    if any(cue in lower for cue in _LLM_ONLY_CUES):
+        return None
+    no_suffix = re.search(r"\b(no|without)\b.*\b(trailing|final|ending)\b", lower)
+    suffix = "" if no_suffix else "."
+    suffix_words = _SUFFIX_WORDS if no_suffix else ()
+
+    if re.search(r"\b(remove|strip|drop|delete)\b.*\bnumber|\b(no|without)\s+number|\bunnumbered\b", lower):
+        return make_style("none", []) if prompt_fully_understood(prompt, [], _REMOVE_NUMBERING_WORDS) else None
+
+    outline = _OUTLINE_PATTERN_RE.search(prompt)
+    if outline:
+        components = re.findall(r"(\d+|[A-Za-z]+)([.)])", outline.group(0))
+        style = make_style("outline", [counter_kind(c) for c, _ in components], suffix=components[0][1], outline=True)
+        return style if prompt_fully_understood(prompt, [outline.span()], ("outline",)) else None
+    if "outline" in lower:
+        style = make_style("outline", ["upper-roman", "upper-letter", "arabic", "lower-letter", "lower-roman"], suffix=suffix, outline=True)
+        return style if prompt_fully_understood(prompt, [], ("outline", *suffix_words)) else None
+    if "appendix" in lower or "appendices" in lower:
+        style = make_style("appendix", ["upper-letter", "arabic"], suffix=suffix, top_prefix="Appendix ")
+        return style if prompt_fully_understood(prompt, [], ("appendix", "appendices", *_LETTER_WORDS, *suffix_words)) else None
+
+    patterns = []
+    for m in _STYLE_PATTERN_RE.finditer(prompt):
+        body, pattern_suffix = m.group(1), m.group(2)
+        components = re.split(r"[.\-]", body)
+        # A bare word or number ("a", "2024") is not a numbering pattern; "1.1", "A.1)" and "1." are.
+        if len(components) < 2 and not pattern_suffix:
+            continue
+        if len(components) < 2 and not (body.isdigit() or len(body) == 1 or counter_kind(body).endswith("roman")):
+            continue
+        separator = "-" if "-" in body else "."
+        patterns.append((m, [counter_kind(c) for c in components], separator, pattern_suffix))
+    if patterns:
+        m, kinds, separator, pattern_suffix = patterns[0]
+        # Further examples of the same shape ("i. ii. iii.") illustrate the same style; any other shape is a
+        # second instruction (e.g. "I. for sections and 1.1 for subsections") and goes to the LLM.
+        spans = [p[0].span() for p in patterns if p[1:] == (kinds, separator, pattern_suffix)]
+        style = make_style(f"pattern {m.group(0)}", kinds, separator=separator, suffix=pattern_suffix)
+        return style if prompt_fully_understood(prompt, spans, suffix_words) else None
+
+    if "roman" in lower:
+        kind = "lower-roman" if re.search(r"\b(lower|small)", lower) else "upper-roman"
+        style = make_style("roman", [kind, "arabic"], suffix=suffix)
+        return style if prompt_fully_understood(prompt, [], (*_ROMAN_WORDS, *suffix_words)) else None
+    if "letter" in lower or "alphabet" in lower:
+        kind = "lower-letter" if re.search(r"\b(lower|small)", lower) else "upper-letter"
+        style = make_style("letters", [kind, "arabic"], suffix=suffix)
+        return style if prompt_fully_understood(prompt, [], (*_LETTER_WORDS, *suffix_words), allow_single_letters=True) else None
+    if prompt_fully_understood(prompt, [], suffix_words):
+        return make_style("decimal", ["arabic"], suffix=suffix)
+    return None
+
+def format_numbering(path: List[int], style: Dict[str, Any]) -> str:
+    kinds = style["kinds"]
+    if style["outline"]:
+        label = format_counter(kinds[min(len(path), len(kinds)) - 1], path[-1])
+    else:
+        label = style["separator"].join(format_counter(kinds[min(i, len(kinds) - 1)], n) for i, n in enumerate(path))
+    prefix = style["top_prefix"] if len(path) == 1 else ""
+    return f"{prefix}{label}{style['suffix']}"
+
+def parse_numbering_prefix(title: str) -> Optional[Dict[str, Any]]:
+    """The numbering prefix candidate of a title, or None. A single counter needs a separator ("1." but not "2024")."""
+    m = _NUMBERING_PREFIX_RE.match(title)
+    if not m or not title[m.end():].strip():
+        return None
+    counters = m.group("counters").split(".")
+    appendix, suffix = bool(m.group("appendix")), m.group("suffix")
+    if suffix in (":", "-") and not appendix:
+        return None
+    if len(counters) == 1 and not suffix and not appendix:
+        return None
+    kinds = tuple("arabic" if c.isdigit() else "upper" if c.isupper() else "lower" for c in counters)
+    return {"counters": counters, "shape": (appendix, kinds, suffix), "length": m.end()}
+
+def counter_readings(counter: str) -> Dict[str, int]:
+    """The values a counter can stand for, e.g. {"letter": 3, "roman": 100} for "C"."""
+    if counter.isdigit():
+        return {"arabic": int(counter)}
+    readings = {}
+    if len(counter) == 1:
+        readings["letter"] = ord(counter.upper()) - ord("A") + 1
+    value, rest = 0, counter.upper()
+    for n, numeral in _ROMAN_NUMERALS:
+        while rest.startswith(numeral):
+            value += n
+            rest = rest[len(numeral):]
+    if value and to_roman(value) == counter.upper():
+        readings["roman"] = value
+    return readings
+
+def is_counter_sequence(prefixes: List[Dict[str, Any]]) -> bool:
+    """True when the prefixes share their leading counters and their last counters never decrease under one reading."""
+    if len({tuple(p["counters"][:-1]) for p in prefixes}) > 1:
+        return False
+    readings = [counter_readings(p["counters"][-1]) for p in prefixes]
+    for kind in ("arabic", "letter", "roman"):
+        values = [r.get(kind) for r in readings]
+        if None not in values and all(a <= b for a, b in zip(values, values[1:])):
+            return True
+    return False
+
+def sibling_groups(titles_info: List[Dict[str, Any]]) -> Tuple[List[List[int]], List[Optional[int]]]:
+    """Heading indices grouped by parent and level, in document order, and the parent index of each heading."""
+    groups: Dict[Tuple[Optional[int], int], List[int]] = {}
+    parents: List[Optional[int]] = []
+    open_headings: List[int] = []
+    for i, t in enumerate(titles_info):
+        while open_headings and titles_info[open_headings[-1]]["level"] >= t["level"]:
+            open_headings.pop()
+        parent = open_headings[-1] if open_headings else None
+        groups.setdefault((parent, t["level"]), []).append(i)
+        parents.append(parent)
+        open_headings.append(i)
+    return list(groups.values()), parents
+
+def strip_old_numbering(titles_info: List[Dict[str, Any]]) -> List[str]:
+    """
+    The titles without their old numbering. A prefix is only numbering when it follows the scheme of its siblings:
+    at least two siblings carry counters of the same shape that count upwards, and at least half of the siblings are
+    prefixed; otherwise the prefix must match the heading's position (and its parent's number, for "2.3."). "1.2. Setup" loses its prefix, while
+    "2.5 GHz Processors", "E. coli outbreak" or "2024 Goals" keep theirs.
+    """
+    prefixes = [parse_numbering_prefix(t["title"]) for t in titles_info]
+    groups, parents = sibling_groups(titles_info)
+    numbered = [False] * len(titles_info)
+    for group in groups:
+        by_shape: Dict[tuple, List[int]] = {}
+        for i in group:
+            if prefixes[i] is not None:
+                by_shape.setdefault(prefixes[i]["shape"], []).append(i)
+        prefixed = sum(len(members) for members in by_shape.values())
+        for members in by_shape.values():
+            if len(members) >= 2 and 2 * prefixed >= len(group) and is_counter_sequence([prefixes[i] for i in members]):
+                for i in members:
+                    numbered[i] = True
+                continue
+            for i in members:
+                parent = parents[i]
+                leading = prefixes[i]["counters"][:-1]
+                if leading and not (parent is not None and numbered[parent] and prefixes[parent]["counters"] == leading):
+                    continue
+                if group.index(i) + 1 in counter_readings(prefixes[i]["counters"][-1]).values():
+                    numbered[i] = True
+    return [t["title"][prefixes[i]["length"]:] if numbered[i] else t["title"] for i, t in enumerate(titles_info)]
+
+def format_titles_with_style(titles_info: List[Dict[str, Any]], counters: List[Optional[List[int]]], style: Dict[str, Any]) -> List[str]:
+    result = []
+    for t, title, path in zip(titles_info, strip_old_numbering(titles_info), counters):
+        if path is None:
+            result.append(t["title"])
+        elif not style["kinds"]:
+            result.append(title)
+        else:
+            result.append(f"{format_numbering(path, style)} {title}")
+    return result
+
+# --------------------------- End of rule-based numbering styles ---------------------------
+
 def build_prompt_for_formatting(deterministic_numbered_titles: List[str], user_prompt: str) -> str:
     titles_list_str = "\n".join(f"- {line}" for line in deterministic_numbered_titles)
     example_input = (
@@ -106,24 +373,36 @@ def build_prompt_for_formatting(deterministic_numbered_titles: List[str], user_p
     )
     return prompt
 
-def replace_section_titles_in_content(md_content: str, titles_info: List[Dict[str, Any]], new_titles: List[str]) -> str:
-    lines = md_content.splitlines(keepends=True)
+def replace_heading_line(old_line: str, new_title: str) -> str:
+    m = re.match(r'^(#{1,6})(\s*)(.*?)(\s*)$', old_line)
+    if not m:
+        return old_line
+    hashes = m.group(1)
+    spacing = m.group(2) if m.group(2) else ' '
+    trailing_space = m.group(4)
+    return f"{hashes}{spacing}{new_title}{trailing_space}"
+
+def write_section_titles(md_file_path: str, titles_info: List[Dict[str, Any]], new_titles: List[str]):
+    """
+    Rewrites the heading lines in one streaming pass: lines are copied to a temporary file next to the original,
+    which is fsynced and renamed over it, so the document is never held in memory and never left half-written.
+    """
     if len(titles_info) != len(new_titles):
         raise ValueError("Number of new titles does not match original titles count")
-    for i in sorted(range(len(titles_info)), reverse=True):
-        title_info = titles_info[i]
-        line_idx = title_info["line_idx"]
-        old_line = lines[line_idx]
-        m = re.match(r'^(#{1,6})(\s*)(.*?)(\s*)$', old_line)
-        if not m:
-            continue
-        hashes = m.group(1)
-        spacing = m.group(2) if m.group(2) else ' '
-        trailing_space = m.group(4)
-        new_title = new_titles[i]
-        new_line = f"{hashes}{spacing}{new_title}{trailing_space}"
-        lines[line_idx] = new_line
-    return "".join(lines)
+    replacements = {t["line_idx"]: new_title for t, new_title in zip(titles_info, new_titles)}
+    tmp_path = f"{md_file_path}.tmp"
+    try:
+        with open(md_file_path, "r", encoding="utf-8", newline="") as src, open(tmp_path, "w", encoding="utf-8", newline="") as dst:
+            for i, line in enumerate(src):
+                dst.write(replace_heading_line(line, replacements[i]) if i in replacements else line)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.chmod(tmp_path, os.stat(md_file_path).st_mode & 0o7777)
+        os.replace(tmp_path, md_file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 async def call_llm_with_retries(prompt: str, max_retries: int = 2) -> (Optional[List[str]], Optional[str]):
     for attempt in range(max_retries + 1):
@@ -163,19 +442,21 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         return output
 
     try:
-        with open(md_file_path, "r", encoding="utf-8") as f:
-            md_content = f.read()
+        with open(md_file_path, "r", encoding="utf-8", newline="") as f:
+            titles_info = extract_section_titles(f)
+        if not titles_info:
+            with open(md_file_path, "r", encoding="utf-8", newline="") as f:
+                is_empty = not any(line.strip() for line in f)
     except Exception as e:
         output.action_done = f"Failed to read file '{md_file_path}': {str(e)}"
         output.error_message = str(e)
         return output
 
-    if not md_content.strip():
+    if not titles_info and is_empty:
         output.action_done = "Markdown file is empty."
         output.error_message = "Empty markdown content."
         return output
 
-    titles_info = extract_section_titles(md_content)
     if not titles_info:
         output.action_done = "No section titles found in markdown file."
         output.error_message = "No markdown headers found."
@@ -184,6 +465,7 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     original_titles = [t["title"] for t in titles_info]
     output.original_titles = original_titles
 
+    counters = assign_hierarchical_counters(titles_info)
     numbering = assign_hierarchical_numbers(titles_info)
     deterministic_numbered_titles = prefix_numbering_to_titles(titles_info, numbering)
 
@@ -191,32 +473,31 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     if inputs.show_intermediary_output and inputs.show_intermediary_output.lower() == 'yes':
         output.intermediary_deterministic_numbered_titles = deterministic_numbered_titles
 
-    llm_prompt = build_prompt_for_formatting(deterministic_numbered_titles, user_prompt)
+    style = parse_numbering_style(user_prompt)
+    if style is not None:
+        formatted_titles = format_titles_with_style(titles_info, counters, style)
+        output.numbering_style = style["name"]
+    else:
+        # Unrecognized style: the LLM formats the deterministically numbered titles.
+        llm_prompt = build_prompt_for_formatting(deterministic_numbered_titles, user_prompt)
 
-    llm_formatted_titles, error_msg = await call_llm_with_retries(llm_prompt, max_retries=2)
+        formatted_titles, error_msg = await call_llm_with_retries(llm_prompt, max_retries=2)
 
-    if llm_formatted_titles is None:
-        output.action_done = "Failed to get valid reformatted section titles from LLM."
-        output.error_message = error_msg
-        return output
+        if formatted_titles is None:
+            output.action_done = "Failed to get valid reformatted section titles from LLM."
+            output.error_message = error_msg
+            return output
 
-    if len(llm_formatted_titles) != len(original_titles):
-        output.action_done = "LLM returned a different number of section titles than the original."
-        output.error_message = f"Original count: {len(original_titles)}, New count: {len(llm_formatted_titles)}"
-        return output
+        if len(formatted_titles) != len(original_titles):
+            output.action_done = "LLM returned a different number of section titles than the original."
+            output.error_message = f"Original count: {len(original_titles)}, New count: {len(formatted_titles)}"
+            return output
+        output.numbering_style = "llm"
 
-    output.final_llm_formatted_section_titles = llm_formatted_titles
-
-    try:
-        new_md_content = replace_section_titles_in_content(md_content, titles_info, llm_formatted_titles)
-    except Exception as e:
-        output.action_done = "Failed to replace section titles in markdown content."
-        output.error_message = str(e)
-        return output
+    output.final_llm_formatted_section_titles = formatted_titles
 
     try:
-        with open(md_file_path, "w", encoding="utf-8") as f:
-            f.write(new_md_content)
+        write_section_titles(md_file_path, titles_info, formatted_titles)
         output.updated_file_path = md_file_path
         output.action_done = "Section titles reformatted successfully."
         return output
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import tool
+from tool import CONFIG, INPUTS, run, extract_section_titles, parse_numbering_style, strip_old_numbering
+
+
+def stripped_titles(md_content: str):
+    return strip_old_numbering(extract_section_titles(md_content.splitlines(keepends=True)))
+
+
+def test_title_words_are_not_numbering():
+    titles = ["2.5 GHz Processors", "3.14 is pi", "E. coli outbreak", "C. Elegans Research", "Mix. Foo", "2024 Goals"]
+    assert stripped_titles("# Doc\n" + "".join(f"## {t}\n" for t in titles)) == ["Doc"] + titles
+    for title in titles:
+        assert stripped_titles(f"# Doc\n## {title}\n") == ["Doc", title], title
+        assert stripped_titles(f"# Doc\n## Overview\n## {title}\n") == ["Doc", "Overview", title], title
+
+
+def test_consistent_numbering_is_stripped():
+    md_content = (
+        "# Doc\n## 1. Intro\n## 3. Setup\n### 3.1 Install\n### 3.2. Config\n## 4. Usage\n"
+        "## Appendix A: Data\n## Appendix B: Glossary\n"
+    )
+    assert stripped_titles(md_content) == ["Doc", "Intro", "Setup", "Install", "Config", "Usage", "Data", "Glossary"]
+    md_content = "# I. Intro\n## A. One\n## B. Two\n# II. Next\n## A) Only child\n# III. Third\n"
+    assert stripped_titles(md_content) == ["Intro", "One", "Two", "Next", "Only child", "Third"]
+
+
+def test_renumber_keeps_title_numbers():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "doc.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("# Doc\n\n## 1. Intro\n\n## 3.14 is pi\n\n## E. coli outbreak\n\n### 1. Sources\n")
+        inputs = INPUTS()
+        inputs.md_file_path = path
+        inputs.prompt = "renumber the sections"
+        output = asyncio.run(run(CONFIG(), inputs))
+        assert output.numbering_style == "decimal"
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == "# Doc\n\n## 1. Intro\n\n## 2. 3.14 is pi\n\n## 3. E. coli outbreak\n\n### 3.1. Sources\n"
+
+
+def test_only_fully_understood_prompts_skip_the_llm():
+    for prompt, name, kinds, suffix in [
+        ("renumber the sections", "decimal", ["arabic"], "."),
+        ("use i. ii. iii.", "pattern i.", ["lower-roman"], "."),
+        ("use 1.1 for every level", "pattern 1.1", ["arabic", "arabic"], ""),
+        ("use roman numerals without trailing dots", "roman", ["upper-roman", "arabic"], ""),
+        ("remove the numbering from all headings", "none", [], "."),
+    ]:
+        style = parse_numbering_style(prompt)
+        assert style is not None and (style["name"], style["kinds"], style["suffix"]) == (name, kinds, suffix), prompt
+    for prompt in [
+        "use I. II. for top level sections and 1.1 for subsections",
+        "roman numerals for top sections and letters for subsections",
+        "Use format Section 1, Section 2",
+        "use the numbering 1.1 but skip the intro",
+        "remove numbering from the intro only",
+    ]:
+        assert parse_numbering_style(prompt) is None, prompt
+
+
+def test_mixed_prompt_goes_to_the_llm():
+    calls = []
+
+    async def fake_llm(payload):
+        calls.append(payload["prompt"])
+        return {"message": json.dumps(["Doc", "I. Intro", "I.1 Setup"])}
+
+    original = tool.shinkai_llm_prompt_processor
+    tool.shinkai_llm_prompt_processor = fake_llm
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doc.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# Doc\n\n## Intro\n\n### Setup\n")
+            inputs = INPUTS()
+            inputs.md_file_path = path
+            inputs.prompt = "use I. II. for top level sections and 1.1 for subsections"
+            output = asyncio.run(run(CONFIG(), inputs))
+            assert len(calls) == 1 and output.numbering_style == "llm"
+            with open(path, encoding="utf-8") as f:
+                assert f.read() == "# Doc\n\n## I. Intro\n\n### I.1 Setup\n"
+    finally:
+        tool.shinkai_llm_prompt_processor = original
+
+
+if __name__ == "__main__":
+    test_title_words_are_not_numbering()
+    test_consistent_numbering_is_stripped()
+    test_renumber_keeps_title_numbers()
+    test_only_fully_understood_prompts_skip_the_llm()
+    test_mixed_prompt_goes_to_the_llm()
+    print("All tests passed.")
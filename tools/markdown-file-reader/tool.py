@@ -4,19 +4,125 @@
 # ]
 # ///
 
-from typing import Any, Optional
+from typing import Any, Dict, Optional, List, Tuple
 import os
+import re
+import mmap
 
 class CONFIG:
     pass
 
 class INPUTS:
     md_file_path: str
+    # Optional heading title (without the leading #s). When given, only that section and its sub-sections are
+    # returned, and only their bytes are decoded.
+    section_title: Optional[str] = None
+    # Windowed reading: start at byte `offset` and return at most `limit` bytes, or about `limit` tokens when
+    # limit_unit is "tokens". Pass the returned next_offset as offset to continue.
+    offset: Optional[int] = None
+    limit: Optional[int] = None
+    limit_unit: Optional[str] = None
 
 class OUTPUT:
     full_markdown_content: Optional[str] = None
     error_message: Optional[str] = None
     file_path: Optional[str] = None
+    next_offset: Optional[int] = None
+    total_bytes: Optional[int] = None
+
+_HEADING_OR_FENCE_BYTES_RE = re.compile(rb"^(#{1,6})[ \t]+([^\n]*)$|^ {0,3}(`{3,}|~{3,})([^\n]*)$", re.MULTILINE)
+
+def scan_md_headings_bytes(md_bytes) -> List[List[Any]]:
+    """Returns the [byte_offset, level, title] of each heading in md_bytes (bytes or mmap), skipping fenced code blocks."""
+    headings = []
+    fence = None
+    for m in _HEADING_OR_FENCE_BYTES_RE.finditer(md_bytes):
+        marker = m.group(3)
+        if marker:
+            if fence is None:
+                fence = marker
+            elif marker[:1] == fence[:1] and len(marker) >= len(fence) and not m.group(4).strip():
+                fence = None
+        elif fence is None:
+            headings.append([m.start(), len(m.group(1)), m.group(2).decode("utf-8", errors="replace").strip()])
+    return headings
+
+def normalize_title(title: str) -> str:
+    return " ".join(title.strip().lstrip("#").lower().split())
+
+def find_section_byte_range(md_bytes, section_title: str) -> Optional[Tuple[int, int]]:
+    """Byte range of the first section titled section_title, up to the next heading of the same or a higher level."""
+    wanted = normalize_title(section_title)
+    headings = scan_md_headings_bytes(md_bytes)
+    for i, (start, level, title) in enumerate(headings):
+        if normalize_title(title) == wanted:
+            end = next((s for s, l, _ in headings[i + 1:] if l <= level), len(md_bytes))
+            return start, end
+    return None
+
+# Rough size of a token, used to turn a token limit into a byte window.
+BYTES_PER_TOKEN = 4
+
+def decode_md_bytes(md_bytes, start: int, end: int) -> str:
+    # Same newline handling as reading the file in text mode.
+    return md_bytes[start:end].decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+def window_end(md_bytes, start: int, end: int, limit_bytes: int) -> int:
+    """
+    End of the window of at most limit_bytes starting at start (and not past end). Unless the window reaches end,
+    it is cut after the last newline in its second half, or else before a split UTF-8 character or CRLF pair.
+    """
+    stop = start + limit_bytes
+    if stop >= end:
+        return end
+    newline = md_bytes.rfind(b"\n", start + limit_bytes // 2, stop)
+    if newline != -1:
+        return newline + 1
+    while stop > start and (md_bytes[stop] & 0xC0) == 0x80:
+        stop -= 1
+    if stop > start and md_bytes[stop - 1:stop + 1] == b"\r\n":
+        # Keep a CRLF pair in one window, or it reads as two line breaks.
+        stop -= 1
+    if stop == start:
+        # The limit is smaller than the first character: return that character.
+        stop = start + (2 if md_bytes[start:start + 2] == b"\r\n" else 1)
+        while stop < end and (md_bytes[stop] & 0xC0) == 0x80:
+            stop += 1
+    return stop
+
+def read_md_file(md_file_path: str, section_title: Optional[str], offset: Optional[int], limit_bytes: Optional[int]) -> Dict[str, Any]:
+    """Reads a section and/or a byte window of the file through mmap, decoding only the bytes that are returned."""
+    with open(md_file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        result = {"content": None, "next_offset": None, "total_bytes": size, "error": None}
+        if size == 0:
+            if section_title:
+                result["error"] = f"Section not found: {section_title}"
+            else:
+                result["content"] = ""
+            return result
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as md_bytes:
+            start, end = 0, size
+            if section_title:
+                section_range = find_section_byte_range(md_bytes, section_title)
+                if section_range is None:
+                    result["error"] = f"Section not found: {section_title}"
+                    return result
+                start, end = section_range
+            if offset is not None:
+                if offset < 0 or offset > size:
+                    result["error"] = f"Offset {offset} is outside the file (0-{size})."
+                    return result
+                start = max(start, min(offset, end))
+                # Never start in the middle of a UTF-8 character or a CRLF pair.
+                while start < end and (md_bytes[start] & 0xC0) == 0x80:
+                    start += 1
+                if 0 < start < end and md_bytes[start - 1:start + 1] == b"\r\n":
+                    start += 1
+            stop = end if limit_bytes is None else window_end(md_bytes, start, end, limit_bytes)
+            result["content"] = decode_md_bytes(md_bytes, start, stop)
+            result["next_offset"] = stop if stop < end else None
+            return result
 
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     output = OUTPUT()
@@ -32,6 +138,32 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
         output.error_message = f"File not found: {md_file_path}"
         return output
 
+    section_title = inputs.section_title.strip() if isinstance(inputs.section_title, str) and inputs.section_title.strip() else None
+    try:
+        offset = int(inputs.offset) if inputs.offset not in (None, "") else None
+        limit = int(inputs.limit) if inputs.limit not in (None, "") else None
+    except (TypeError, ValueError):
+        output.error_message = "offset and limit must be integers."
+        return output
+    if limit is not None and limit <= 0:
+        output.error_message = "limit must be a positive integer."
+        return output
+    limit_bytes = limit * BYTES_PER_TOKEN if limit is not None and (inputs.limit_unit or "").strip().lower() == "tokens" else limit
+
+    if section_title is not None or offset is not None or limit_bytes is not None:
+        try:
+            result = read_md_file(md_file_path, section_title, offset, limit_bytes)
+        except Exception as e:
+            output.error_message = f"Failed to read file {md_file_path}: {str(e)}"
+            return output
+        output.total_bytes = result["total_bytes"]
+        if result["error"]:
+            output.error_message = result["error"]
+        else:
+            output.full_markdown_content = result["content"]
+            output.next_offset = result["next_offset"]
+        return output
+
     try:
         with open(md_file_path, "r", encoding="utf-8") as f:
             md_content = f.read()
@@ -13,10 +13,29 @@ class CONFIG:
 
 class INPUTS:
     text_content: str
+    # Path of a markdown file previously exported to the home directory (the md_filepath of an earlier call).
+    # When given, text_content is appended to it instead of being saved to a new file.
+    append_to_path: Optional[str] = None
 
 class OUTPUT:
     message: str
     md_filepath: Optional[str]
+    bytes_written: Optional[int] = None
+    total_bytes: Optional[int] = None
+
+def append_to_markdown_file(md_path: str, text_content: str) -> int:
+    """Appends text_content to an existing file, starting it on a new line, and returns the number of bytes written."""
+    with open(md_path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        data = text_content.encode("utf-8")
+        if size > 0 and data:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        return len(data)
 
 async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
     output = OUTPUT()
@@ -27,6 +46,23 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
             output.md_filepath = None
             return output
 
+        if inputs.append_to_path:
+            # A relative path is taken relative to the home directory, not the working directory.
+            md_path = os.path.realpath(os.path.join(home_dir, inputs.append_to_path))
+            if os.path.commonpath([md_path, os.path.realpath(home_dir)]) != os.path.realpath(home_dir):
+                output.message = "Error: append_to_path must be a file inside the home directory."
+                output.md_filepath = None
+                return output
+            if not os.path.isfile(md_path):
+                output.message = f"Error: append_to_path does not exist: {md_path}"
+                output.md_filepath = None
+                return output
+            output.bytes_written = append_to_markdown_file(md_path, inputs.text_content)
+            output.total_bytes = os.path.getsize(md_path)
+            output.message = f"Markdown content appended successfully to: {md_path}"
+            output.md_filepath = md_path
+            return output
+
         filename = "exported_content.md"
         md_path = os.path.join(home_dir, filename)
 
@@ -41,6 +77,8 @@ async def run(config: CONFIG, inputs: INPUTS) -> OUTPUT:
 
         with open(md_path, "w", encoding="utf-8") as f:
             f.write(inputs.text_content)
+        output.total_bytes = os.path.getsize(md_path)
+        output.bytes_written = output.total_bytes
 
         output.message = f"Markdown file saved successfully at: {md_path}"
         output.md_filepath = md_path